@@ -6,10 +6,17 @@ import Figaro
 import miqScoreNGSReadCountPublic
 
 
+rBackends = ("worker", "script")
+rWorkerPool = None
+referenceSet = None
+
+
 def getApplicationParameters():
     parameters = miqScore16SPublicSupport.parameters.environmentParameterParser.EnvParameters()
     parameters.addParameter("sampleName", str, required=True, externalValidation=True)
     parameters.addParameter("maxReadCount", int, default=default.maxReadCount, lowerBound=0, upperBound=20000000)
+    parameters.addParameter("rejectOversizedSamples", bool, default=default.rejectOversizedSamples)
+    parameters.addParameter("downsampleSeed", int, default=default.downsampleSeed, lowerBound=0)
     parameters.addParameter("forwardReads", str, default = default.forwardReads, expectedFile=True)
     parameters.addParameter("reverseReads", str, default=default.reverseReads, expectedFile=True)
     parameters.addParameter("forwardPrimerLength", int, lowerBound=0, upperBound=40, required=True)
@@ -34,11 +41,18 @@ def getApplicationParameters():
     parameters.addParameter("trimParameterPickle", str, default="", externalValidation=True)
     parameters.addParameter("dada2OutputFiles", str, default="", externalValidation=True)
     parameters.addParameter("debug", bool, default=False)
+    parameters.addParameter("noStepCache", bool, default=False)
+    parameters.addParameter("stepCacheFolder", str, default=default.stepCacheFolder, createdDirectory=True)
+    parameters.addParameter("stepCacheSizeLimit", int, default=default.stepCacheSizeLimit, lowerBound=0)
+    parameters.addParameter("coreBudget", int, default=default.coreBudget, lowerBound=0)
+    parameters.addParameter("rBackend", str, default=default.rBackend, externalValidation=True)
     test = dict(os.environ)
     requiredCombinedLength = parameters.ampliconLength.value + parameters.minOverlap.value
     parameters.sideLoadParameter("minCombinedReadLength", requiredCombinedLength)
     if not parameters.fileNamingStandard.value.lower() in Figaro.figaroSupport.fileNamingStandards.aliasList.keys():
         raise ValueError("%s is not a valid naming standard alias" %parameters.fileNamingStandard.value)
+    if not parameters.rBackend.value.lower() in rBackends:
+        raise ValueError("%s is not a valid R backend. Options are: %s" %(parameters.rBackend.value, ", ".join(rBackends)))
     if not validSampleName(parameters.sampleName.value):
         logger.error("Invalid sample name given: %s" %parameters.sampleName.value)
         raise ValueError("Invalid sample name given: %s" %parameters.sampleName.value)
@@ -49,23 +63,67 @@ def getApplicationParameters():
     return parameters
 
 
-def validateFastqPair(forwardPath:str, reversePath:str):
-    readCount = miqScore16SPublicSupport.formatReaders.fastq.fastqHandler.validFastqPair(forwardPath, reversePath)
-    if not readCount:
-        if readCount == False:
+def rejectionReadBudget():
+    if parameters.maxReadCount.value > 0 and parameters.rejectOversizedSamples.value:
+        return parameters.maxReadCount.value  #oversized samples are rejected as soon as they pass the limit, not after a full count
+    return 0
+
+
+def validateFastqPair(validation):
+    '''
+    :param validation: fastqScanner.ValidationResult for the input reads
+    '''
+    fastqHandler = miqScore16SPublicSupport.formatReaders.fastq.fastqHandler
+    fastqScanner = miqScore16SPublicSupport.formatReaders.fastq.fastqScanner
+    maxReads = validation.maxReads
+    if validation.reason == fastqScanner.readBudgetReason:
+        raise RuntimeError("Max fastq read count exceeded for this sample. Max: %s. Read count: more than %s" %(maxReads, maxReads))
+    if not validation:
+        if validation.reason == fastqScanner.formatErrorReason:
             errorMessage = "Fastq file failed validation checks"
-        elif readCount == 0:
+        elif validation.reason == fastqScanner.emptyReason:
             errorMessage = "Fastq files appear to be empty of reads"
         else:
-            raise RuntimeError("Fastq validation should only return either False or a non-negative integer. This code should be unreachable and this is a bug.")
-        logger.error(errorMessage)
-        raise miqScore16SPublicSupport.formatReaders.fastq.fastqHandler.FastqFormatError(errorMessage)
-    if parameters.maxReadCount.value > 0:
-        if readCount > parameters.maxReadCount.value:
-            raise RuntimeError("Max fastq read count exceeded for this sample. Max: %s. Read count: %s" %(parameters.maxReadCount.value, readCount))
+            raise RuntimeError("Fastq validation returned an unexpected reason: %s. This code should be unreachable and this is a bug." %validation.reason)
+        logger.error("%s: %s" %(errorMessage, validation.message))
+        raise fastqHandler.FastqFormatError(errorMessage)
     return True
 
 
+def downsampleReadsIfNeeded(forwardPath:str, reversePath:str, readCount:int):
+    maxReadCount = parameters.maxReadCount.value
+    if maxReadCount < 1 or readCount <= maxReadCount:
+        return forwardPath, reversePath, readCount
+    if parameters.rejectOversizedSamples.value:
+        raise RuntimeError("Max fastq read count exceeded for this sample. Max: %s. Read count: %s" %(maxReadCount, readCount))
+    downsampleFolder = os.path.join(default.workingFolder, "downsampled", parameters.sampleName.value)  #keeps the original file names so FIGARO can still find the pair
+    if not os.path.isdir(downsampleFolder):
+        os.makedirs(downsampleFolder)
+    forwardOutput = os.path.join(downsampleFolder, os.path.split(forwardPath)[1])
+    reverseOutput = os.path.join(downsampleFolder, os.path.split(reversePath)[1])
+    logger.info("Sample has %s read pairs, which is more than the max of %s. Downsampling with seed %s." %(readCount, maxReadCount, parameters.downsampleSeed.value))
+    downsampledReadCount = miqScore16SPublicSupport.formatReaders.fastq.fastqDownsampler.downsampleFastqPair(forwardPath, reversePath, forwardOutput, reverseOutput, maxReadCount, parameters.downsampleSeed.value, readCount)
+    return forwardOutput, reverseOutput, downsampledReadCount
+
+
+def scanInputReads(forwardPath:str, reversePath:str):
+    fastqHandler = miqScore16SPublicSupport.formatReaders.fastq.fastqHandler
+    fastqScanner = miqScore16SPublicSupport.formatReaders.fastq.fastqScanner
+    maxReads = rejectionReadBudget()
+    indexedResult = fastqHandler.indexedPairBudgetCheck(forwardPath, reversePath, maxReads)
+    if indexedResult is not None:
+        validateFastqPair(indexedResult)
+    forwardConsumers = [fastqScanner.ReadCounter(), fastqScanner.EncodingDetector(), fastqScanner.Md5Hasher()]
+    reverseConsumers = [fastqScanner.ReadCounter(), fastqScanner.EncodingDetector(), fastqScanner.Md5Hasher()]
+    pairValidator = fastqScanner.PairValidator(logErrors=False, maxReads=maxReads, stopScan=True)  #a rejected pair ends the scan before hashing the rest
+    scanSummary = fastqScanner.scanFastqPair(forwardPath, reversePath, forwardConsumers, reverseConsumers, [pairValidator])
+    validateFastqPair(pairValidator.validationResult((forwardPath, reversePath)))
+    for path, summary in ((forwardPath, scanSummary.pe1), (reversePath, scanSummary.pe2)):
+        logger.info("File integrity info for %s: MD5=%s SIZE=%s READS=%s ENCODING=%s DECOMPRESSION=%s" %(path, summary.md5, os.path.getsize(path), summary.readCount, summary.encoding, summary.decompressionBackend))
+        miqScore16SPublicSupport.pipeline.stepCache.rememberChecksum(path, summary.md5)  #saves hashing the reads again for step cache keys
+    return scanSummary
+
+
 def validSampleName(name:str):
     validNameCharacters = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz1234567890.-_ "
     invalidStartingCharacters = ".-_ "
@@ -135,12 +193,36 @@ def getReadLengthsFromFastq(path:str):
     return miqScore16SPublicSupport.formatReaders.fastq.fastqHandler.estimateReadLength(path)
 
  
-def buildRscriptArguments(arguments:dict):
-    rscriptArgumentsList = []
-    for flag in arguments:
-        rscriptArgumentsList.append("-%s %s" % (flag, arguments[flag]))
-    rscriptArguments = " ".join(rscriptArgumentsList)
-    return rscriptArguments
+def getRWorkerPool():
+    '''
+    :return: running pool of warm R workers, or None to run R steps with Rscript
+    '''
+    global rWorkerPool
+    if not parameters.rBackend.value.lower() == "worker":
+        return None
+    if rWorkerPool is None:
+        rWorker = miqScore16SPublicSupport.pipeline.rWorker
+        rWorkerPool = rWorker.RWorkerPool(default.rScriptExecutable, parameters.rScriptFolder.value, size=2, jobTimeout=default.rWorkerJobTimeout)
+        try:
+            rWorkerPool.start()
+        except rWorker.RWorkerError as error:
+            logger.warning("Unable to start R workers, so each R step will run as its own Rscript process. %s" %error)
+            rWorkerPool = False
+    return rWorkerPool or None
+
+
+def stopRWorkerPool():
+    global rWorkerPool
+    if rWorkerPool:
+        rWorkerPool.stop()
+    rWorkerPool = None
+
+
+def runRJobs(jobs:list):
+    pool = getRWorkerPool()
+    if pool is None:
+        return miqScore16SPublicSupport.pipeline.rRunner.runConcurrently(jobs)
+    return pool.runConcurrently(jobs)
 
 
 def getTrimmingParametersWithFigaro(sequenceFolder):
@@ -155,9 +237,29 @@ def getTrimmingParametersWithFigaro(sequenceFolder):
     return resultTable[0]
 
 
-def dada2Trim(forwardReads:str, reverseReads:str, trimParameters:Figaro.figaroSupport.trimParameterPrediction.TrimParameterSet):
+def trimmedReadPaths():
     r1TrimmedFile = os.path.join(parameters.outputFolder.value, parameters.sampleName.value + ".forward.trimmed.fastq.gz")
     r2TrimmedFile = os.path.join(parameters.outputFolder.value, parameters.sampleName.value + ".reverse.trimmed.fastq.gz")
+    return r1TrimmedFile, r2TrimmedFile
+
+
+def errorModelPaths():
+    pe1ErrorModelFile = os.path.join(parameters.outputFolder.value, parameters.sampleName.value + "_1.Rda")
+    pe2ErrorModelFile = os.path.join(parameters.outputFolder.value, parameters.sampleName.value + "_2.Rda")
+    return pe1ErrorModelFile, pe2ErrorModelFile
+
+
+def ampliconOutputPaths():
+    outputFolder = parameters.outputFolder.value
+    seqTableCSV = os.path.join(outputFolder, parameters.sampleName.value + ".SV.csv")
+    outputTaxa = os.path.join(outputFolder, parameters.sampleName.value + ".SV.taxa.csv")
+    outputTaxaChimeraFree = os.path.join(outputFolder, parameters.sampleName.value + ".SV.nochimera.csv")
+    outputSequenceTable = os.path.join(outputFolder, parameters.sampleName.value + ".seqtable.rds")
+    return seqTableCSV, outputTaxaChimeraFree, outputTaxa, outputSequenceTable
+
+
+def dada2Trim(forwardReads:str, reverseReads:str, trimParameters:Figaro.figaroSupport.trimParameterPrediction.TrimParameterSet):
+    r1TrimmedFile, r2TrimmedFile = trimmedReadPaths()
     arguments = {
         "f" : forwardReads,
         "r" : reverseReads,
@@ -171,42 +273,35 @@ def dada2Trim(forwardReads:str, reverseReads:str, trimParameters:Figaro.figaroSu
         "m" : trimParameters.forwardMaxExpectedError,
         "n" : trimParameters.reverseMaxExpectedError
     }
-    rscriptCommand = "%s %s" %(default.rScriptExecutable, os.path.join(parameters.rScriptFolder.value, "dada2.trimreads.R"))
-    rscriptArguments = buildRscriptArguments(arguments)
-    command = "%s %s" %(rscriptCommand, rscriptArguments)
-    logger.info("Running trim command: %s" %command)
-    exitCode = os.system(command)
-    if exitCode == 0:
-        logger.info("Trim command returned exit status 0")
-    else:
-        logger.error("Trim command %s returned exit status %s" %(command, exitCode))
-        raise RuntimeError("Error in trimming operation")
+    rRunner = miqScore16SPublicSupport.pipeline.rRunner
+    command = rRunner.buildRscriptCommand(default.rScriptExecutable, os.path.join(parameters.rScriptFolder.value, "dada2.trimreads.R"), arguments)
+    try:
+        runRJobs([rRunner.RScriptJob("Trim command", command)])
+    except rRunner.RScriptError as error:
+        raise RuntimeError("Error in trimming operation") from error
     return r1TrimmedFile, r2TrimmedFile
 
 
-def dada2BuildErrorModelRunner(inputFileList:str, outputFileName:str):
+def dada2BuildErrorModelRunner(inputFileList:str, outputFileName:str, threads:int=0):
+    '''
+    :return: unstarted RScriptJob building one error model
+    '''
+    rRunner = miqScore16SPublicSupport.pipeline.rRunner
     arguments = {
         "i" : inputFileList,
         "o" : outputFileName
     }
-    rscriptCommand = "%s %s" %(default.rScriptExecutable, os.path.join(parameters.rScriptFolder.value, "dada2.builderrormodels.R"))
-    rscriptArguments = buildRscriptArguments(arguments)
-    command = "%s %s" %(rscriptCommand, rscriptArguments)
-    logger.info("Running error model command: %s" %command)
-    exitCode = os.system(command)
-    if exitCode == 0:
-        logger.info("Error model command returned exit status 0")
-    else:
-        logger.error("Error model command returned exit status %s" %exitCode)
-        raise RuntimeError("Error in error modeling process.")
-    return exitCode
+    if threads:
+        arguments["t"] = threads
+    command = rRunner.buildRscriptCommand(default.rScriptExecutable, os.path.join(parameters.rScriptFolder.value, "dada2.builderrormodels.R"), arguments)
+    return rRunner.RScriptJob("Error model build for %s" %os.path.split(outputFileName)[1], command)
 
 
 def dada2BuildErrorModels(forwardTrimmedReads:str, reverseTrimmedReads:str):
+    rRunner = miqScore16SPublicSupport.pipeline.rRunner
     pe1FileList = os.path.join(parameters.outputFolder.value, "read1.fileList.txt")
     pe2FileList = os.path.join(parameters.outputFolder.value, "read2.fileList.txt")
-    pe1ErrorModelFile = os.path.join(parameters.outputFolder.value, parameters.sampleName.value + "_1.Rda")
-    pe2ErrorModelFile = os.path.join(parameters.outputFolder.value, parameters.sampleName.value + "_2.Rda")
+    pe1ErrorModelFile, pe2ErrorModelFile = errorModelPaths()
     pe1List = [forwardTrimmedReads]
     pe2List = [reverseTrimmedReads]
     pe1File = open(pe1FileList, 'w')
@@ -217,8 +312,13 @@ def dada2BuildErrorModels(forwardTrimmedReads:str, reverseTrimmedReads:str):
     for path in pe2List:
         print(path, file=pe2File)
     pe2File.close()
-    dada2BuildErrorModelRunner(pe1FileList, pe1ErrorModelFile)
-    dada2BuildErrorModelRunner(pe2FileList, pe2ErrorModelFile)
+    pe1Threads, pe2Threads = rRunner.splitCores(parameters.coreBudget.value, 2)
+    jobs = [dada2BuildErrorModelRunner(pe1FileList, pe1ErrorModelFile, pe1Threads),
+            dada2BuildErrorModelRunner(pe2FileList, pe2ErrorModelFile, pe2Threads)]
+    try:
+        runRJobs(jobs)
+    except rRunner.RScriptError as error:
+        raise RuntimeError("Error in error modeling process.") from error
     if not parameters.noCleanup:
         os.remove(pe1FileList)
         os.remove(pe2FileList)
@@ -226,11 +326,7 @@ def dada2BuildErrorModels(forwardTrimmedReads:str, reverseTrimmedReads:str):
 
 
 def dada2GetAmplicons(forwardTrimmedReads:str, reverseTrimmedReads:str, forwardErrorModel:str, reverseErrorModel:str):
-    outputFolder = parameters.outputFolder.value
-    seqTableCSV = os.path.join(outputFolder, parameters.sampleName.value + ".SV.csv")
-    outputTaxa = os.path.join(outputFolder, parameters.sampleName.value + ".SV.taxa.csv")
-    outputTaxaChimeraFree = os.path.join(outputFolder, parameters.sampleName.value + ".SV.nochimera.csv")
-    outputSequenceTable = os.path.join(outputFolder, parameters.sampleName.value + ".seqtable.rds")
+    seqTableCSV, outputTaxaChimeraFree, outputTaxa, outputSequenceTable = ampliconOutputPaths()
     rdpDataBase = parameters.databaseFile.value
     arguments = {
         "f" : forwardTrimmedReads,
@@ -245,16 +341,12 @@ def dada2GetAmplicons(forwardTrimmedReads:str, reverseTrimmedReads:str, forwardE
         "l" : parameters.minOverlap.value,
         "m" : parameters.maxMismatch.value
     }
-    rscriptCommand = "%s %s" %(default.rScriptExecutable, os.path.join(parameters.rScriptFolder.value, "dada2.getamplicons.R"))
-    rscriptArguments = buildRscriptArguments(arguments)
-    command = "%s %s" %(rscriptCommand, rscriptArguments)
-    logger.info("Running amplicon calling command: %s" %command)
-    exitCode = os.system(command)
-    if exitCode == 0:
-        logger.info("Amplicon calling command returned exit status 0")
-    else:
-        logger.error("Amplicon calling command returned exit status %s" %exitCode)
-        raise RuntimeError("Error in amplicon calling step")
+    rRunner = miqScore16SPublicSupport.pipeline.rRunner
+    command = rRunner.buildRscriptCommand(default.rScriptExecutable, os.path.join(parameters.rScriptFolder.value, "dada2.getamplicons.R"), arguments)
+    try:
+        runRJobs([rRunner.RScriptJob("Amplicon calling command", command)])
+    except rRunner.RScriptError as error:
+        raise RuntimeError("Error in amplicon calling step") from error
     return seqTableCSV, outputTaxaChimeraFree, outputTaxa, outputSequenceTable
 
 
@@ -280,7 +372,70 @@ def removeFileRedundantEntries(masterTable:miqScore16SPublicSupport.projectData.
             alreadyEntered.add(sample.baseName)
     return deduped
 
-def runDada2Functions(forwardReads:str, reverseReads:str):
+def getStepCache():
+    if parameters.noStepCache.value:
+        return None
+    return miqScore16SPublicSupport.pipeline.stepCache.StepCache(parameters.stepCacheFolder.value, parameters.stepCacheSizeLimit.value * 1024 * 1024)
+
+
+def buildDada2Pipeline(forwardReads:str, reverseReads:str, cache:miqScore16SPublicSupport.pipeline.stepCache.StepCache=None, sharedErrorModels:tuple=None):
+    '''
+    :param sharedErrorModels: forward and reverse error models to use instead of learning them from this sample
+    '''
+    stepGraph = miqScore16SPublicSupport.pipeline.stepGraph
+    rScriptFolder = parameters.rScriptFolder.value
+    readFolder = os.path.split(os.path.abspath(forwardReads))[0]
+    pipeline = stepGraph.PipelineGraph(cache)
+
+    def trimParameterStep(upstream:dict):
+        return {"trimParameters": getTrimmingParametersWithFigaro(readFolder)}
+
+    def trimStep(upstream:dict):
+        return dict(zip(("forward", "reverse"), dada2Trim(forwardReads, reverseReads, upstream["trimParameters"]["trimParameters"])))
+
+    def errorModelStep(upstream:dict):
+        return dict(zip(("forward", "reverse"), dada2BuildErrorModels(upstream["trim"]["forward"], upstream["trim"]["reverse"])))
+
+    def sharedErrorModelStep(upstream:dict):
+        return dict(zip(("forward", "reverse"), sharedErrorModels))
+
+    def ampliconStep(upstream:dict):
+        trimmedReads = (upstream["trim"]["forward"], upstream["trim"]["reverse"])
+        errorModels = (upstream["errorModels"]["forward"], upstream["errorModels"]["reverse"])
+        return dict(zip(("amplicons", "chimeraFreeAmplicons", "taxa", "rdsFile"), dada2GetAmplicons(*trimmedReads, *errorModels)))
+
+    pipeline.addStep(stepGraph.PipelineStep("trimParameters", trimParameterStep,
+                                            parameters={"ampliconLength": parameters.ampliconLength.value,
+                                                        "forwardPrimerLength": parameters.forwardPrimerLength.value,
+                                                        "reversePrimerLength": parameters.reversePrimerLength.value,
+                                                        "minOverlap": parameters.minOverlap.value,
+                                                        "fileNamingStandard": parameters.fileNamingStandard.value,
+                                                        "trimParameterDownsample": parameters.trimParameterDownsample.value,
+                                                        "trimParameterPercentile": parameters.trimParameterPercentile.value},
+                                            inputFiles=[forwardReads, reverseReads] + ([parameters.trimParameterPickle.value] if parameters.trimParameterPickle.value else [])))
+    pipeline.addStep(stepGraph.PipelineStep("trim", trimStep, ["trimParameters"],
+                                            parameters={"forwardPrimerLength": parameters.forwardPrimerLength.value,
+                                                        "reversePrimerLength": parameters.reversePrimerLength.value,
+                                                        "truncQ": parameters.truncQ.value},
+                                            inputFiles=[forwardReads, reverseReads],
+                                            scripts=[os.path.join(rScriptFolder, "dada2.trimreads.R")],
+                                            outputFiles=dict(zip(("forward", "reverse"), trimmedReadPaths()))))
+    if sharedErrorModels:
+        pipeline.addStep(stepGraph.PipelineStep("errorModels", sharedErrorModelStep, inputFiles=list(sharedErrorModels), cacheable=False))
+    else:
+        pipeline.addStep(stepGraph.PipelineStep("errorModels", errorModelStep, ["trim"],
+                                                scripts=[os.path.join(rScriptFolder, "dada2.builderrormodels.R")],
+                                                outputFiles=dict(zip(("forward", "reverse"), errorModelPaths()))))
+    pipeline.addStep(stepGraph.PipelineStep("amplicons", ampliconStep, ["trim", "errorModels"],
+                                            parameters={"minOverlap": parameters.minOverlap.value,
+                                                        "maxMismatch": parameters.maxMismatch.value},
+                                            inputFiles=[parameters.databaseFile.value],
+                                            scripts=[os.path.join(rScriptFolder, "dada2.getamplicons.R")],
+                                            outputFiles=dict(zip(("amplicons", "chimeraFreeAmplicons", "taxa", "rdsFile"), ampliconOutputPaths()))))
+    return pipeline
+
+
+def runDada2Functions(forwardReads:str, reverseReads:str, keepRWorkers:bool=False, sharedErrorModels:tuple=None, trimOnly:bool=False):
     if parameters.dada2OutputFiles.value:
         import pickle
         if parameters.trimParameterPickle.value:
@@ -294,11 +449,20 @@ def runDada2Functions(forwardReads:str, reverseReads:str):
         import miqScore16SPublicSupport.projectData.microbiome.dada2Outputs
         outputFiles = Dada2OutputFiles()
         outputFiles.rawReads = (forwardReads, reverseReads)
-        readFolder = os.path.split(os.path.abspath(forwardReads))[0]
-        trimParameters = getTrimmingParametersWithFigaro(readFolder)
-        outputFiles.trimmedReads = dada2Trim(forwardReads, reverseReads, trimParameters)
-        outputFiles.errorModels = dada2BuildErrorModels(*outputFiles.trimmedReads)
-        outputFiles.amplicons, outputFiles.chimeraFreeAmplicons, outputFiles.taxa, outputFiles.rdsFile = dada2GetAmplicons(*outputFiles.trimmedReads, *outputFiles.errorModels)
+        pipeline = buildDada2Pipeline(forwardReads, reverseReads, getStepCache(), sharedErrorModels)
+        targets = ["trim"] if trimOnly else None
+        try:
+            results = pipeline.run(targets=targets)
+        finally:
+            if not keepRWorkers:
+                stopRWorkerPool()
+        if pipeline.cachedSteps:
+            logger.info("Reused cached results for pipeline steps: %s" %", ".join(pipeline.cachedSteps))
+        outputFiles.trimmedReads = results["trim"]["forward"], results["trim"]["reverse"]
+        if trimOnly:
+            return outputFiles
+        outputFiles.errorModels = results["errorModels"]["forward"], results["errorModels"]["reverse"]
+        outputFiles.amplicons, outputFiles.chimeraFreeAmplicons, outputFiles.taxa, outputFiles.rdsFile = [results["amplicons"][name] for name in ("amplicons", "chimeraFreeAmplicons", "taxa", "rdsFile")]
         # import pickle
         # file = open("/data/output/dada2OutputFiles.pkl", 'wb')
         # pickle.dump(outputFiles, file)
@@ -322,9 +486,12 @@ def dada2GenusCountTable(chimeraFreeReadCounts:miqScore16SPublicSupport.projectD
         genusReadCounts[genus] += chimeraFreeReadCounts.ampliconTable[amplicon]
     return genusReadCounts
 
-def getDada2Results(dada2OutputFiles:Dada2OutputFiles):
+def getDada2Results(dada2OutputFiles:Dada2OutputFiles, rawReadCount:int=None):
     from . import miqScore16SPublicSupport
-    totalReadInput = miqScore16SPublicSupport.formatReaders.fastq.fastqHandler.countReads(dada2OutputFiles.rawReads[0])
+    if rawReadCount is None:
+        totalReadInput = miqScore16SPublicSupport.formatReaders.fastq.fastqHandler.countReads(dada2OutputFiles.rawReads[0])
+    else:
+        totalReadInput = rawReadCount
     trimmedReadInput = miqScore16SPublicSupport.formatReaders.fastq.fastqHandler.countReads(dada2OutputFiles.trimmedReads[0])
     ampliconsWithChimera = miqScore16SPublicSupport.projectData.microbiome.dada2Outputs.Dada2AmpliconCount(dada2OutputFiles.amplicons)
     ampliconsWithoutChimera = miqScore16SPublicSupport.projectData.microbiome.dada2Outputs.Dada2AmpliconCount(dada2OutputFiles.chimeraFreeAmplicons)
@@ -349,23 +516,42 @@ readFatePrintNames = {"filteredReads": "Failed Quality Filter",
                       "Reference": "Aligned To Reference"}
 
 
+class StandardReferenceSet(object):
+    '''
+    Reference data loaded once and shared by every sample.
+    '''
+
+    def __init__(self, referenceFolder:str):
+        self.referenceData = miqScoreNGSReadCountPublic.referenceHandler.StandardReference(os.path.join(referenceFolder, "zrCommunityStandard.json"))
+        templateFile = open(os.path.join(referenceFolder, "16SReportTemplate.html"), 'r')
+        self.template = templateFile.read()
+        templateFile.close()
+        goodMiqPath = os.path.join(referenceFolder, "goodMiq.json")
+        badMiqPath = os.path.join(referenceFolder, "badMiq.json")
+        self.goodComposition, self.badComposition = miqScoreNGSReadCountPublic.loadReferenceCompositionFromExampleMiq(goodMiqPath, badMiqPath)
+        self.goodMiq, self.badMiq = miqScoreNGSReadCountPublic.loadExampleData(goodMiqPath, badMiqPath, self.referenceData, "16s")
+
+
+def getReferenceSet():
+    global referenceSet
+    if referenceSet is None:
+        referenceSet = StandardReferenceSet(os.path.join(os.path.split(os.path.abspath(__file__))[0], "reference"))
+    return referenceSet
+
+
 def analyzeStandardResult(dada2ResultTable:dict):
+    references = getReferenceSet()
     cleanedTable = dada2ResultTable.copy()
     del cleanedTable["totalReads"]
     del cleanedTable["calledReads"]
     for genus in cleanedTable["genusCalls"]:
         cleanedTable[genus] = cleanedTable["genusCalls"][genus]
     del cleanedTable["genusCalls"]
-    referenceDataFile = os.path.join(os.path.split(__file__)[0], "reference", "zrCommunityStandard.json")
-    referenceData = miqScoreNGSReadCountPublic.referenceHandler.StandardReference(referenceDataFile)
-    calculator = miqScoreNGSReadCountPublic.MiqScoreCalculator(referenceData, analysisMethod="16s", percentToleranceInStandard=15, floor=0)
+    calculator = miqScoreNGSReadCountPublic.MiqScoreCalculator(references.referenceData, analysisMethod="16s", percentToleranceInStandard=15, floor=0)
     miqScoreResult = calculator.calculateMiq(cleanedTable, parameters.sampleName.value)
     miqScoreResult.makeReadFateChart(readFatePrintNames=readFatePrintNames)
     miqScoreResult.makeRadarPlots()
-    goodMiqPath = os.path.join(os.path.split(__file__)[0], "reference", "goodMiq.json")
-    badMiqPath = os.path.join(os.path.split(__file__)[0], "reference", "badMiq.json")
-    goodComposition, badComposition = miqScoreNGSReadCountPublic.loadReferenceCompositionFromExampleMiq(goodMiqPath, badMiqPath)
-    miqScoreResult.makeCompositionBarPlot(goodComposition, badComposition)
+    miqScoreResult.makeCompositionBarPlot(references.goodComposition, references.badComposition)
     return miqScoreResult
 
 
@@ -379,17 +565,9 @@ def saveResult(result:miqScoreNGSReadCountPublic.MiqScoreData):
 
 
 def generateReport(result:miqScoreNGSReadCountPublic.MiqScoreData):
-    referenceDataFile = os.path.join(os.path.split(__file__)[0], "reference", "zrCommunityStandard.json")
-    referenceData = miqScoreNGSReadCountPublic.referenceHandler.StandardReference(referenceDataFile)
-    templateFilePath = os.path.join(os.path.split(os.path.abspath(__file__))[0], "reference", "16SReportTemplate.html")
-    templateFile = open(templateFilePath, 'r')
-    template = templateFile.read()
-    templateFile.close()
-    goodMiqPath = os.path.join(os.path.split(__file__)[0], "reference", "goodMiq.json")
-    badMiqPath = os.path.join(os.path.split(__file__)[0], "reference", "badMiq.json")
-    goodMiq, badMiq = miqScoreNGSReadCountPublic.loadExampleData(goodMiqPath, badMiqPath, referenceData, "16s")
-    replacementTable = miqScore16SPublicSupport.reporting.generateReplacementTable(result, goodMiq, badMiq, readFatePrintNames=readFatePrintNames)
-    report = miqScoreNGSReadCountPublic.reportGeneration.generateReport(template, replacementTable)
+    references = getReferenceSet()
+    replacementTable = miqScore16SPublicSupport.reporting.generateReplacementTable(result, references.goodMiq, references.badMiq, readFatePrintNames=readFatePrintNames)
+    report = miqScoreNGSReadCountPublic.reportGeneration.generateReport(references.template, replacementTable)
     reportFilePath = os.path.join(parameters.outputFolder.value, "%s.html" % parameters.sampleName.value)
     print("Output report to %s" % reportFilePath)
     outputFile = open(reportFilePath, 'w')
@@ -398,6 +576,43 @@ def generateReport(result:miqScoreNGSReadCountPublic.MiqScoreData):
     return reportFilePath
 
 
+def prepareSampleReads():
+    '''
+    :return: tuple of (forward reads, reverse reads, read pairs) for the reads to analyze after any downsampling
+    '''
+    inputReadSummary = scanInputReads(parameters.forwardReads.value, parameters.reverseReads.value)
+    return downsampleReadsIfNeeded(parameters.forwardReads.value, parameters.reverseReads.value, inputReadSummary.pe1.readCount)
+
+
+def trimSample(keepRWorkers:bool=False, preparedReads:tuple=None):
+    '''
+    :param preparedReads: result of prepareSampleReads if it has already been run for this sample
+    :return: tuple of forward and reverse trimmed read paths
+    '''
+    if preparedReads is None:
+        preparedReads = prepareSampleReads()
+    forwardReads, reverseReads, analysisReadCount = preparedReads
+    return runDada2Functions(forwardReads, reverseReads, keepRWorkers, trimOnly=True).trimmedReads
+
+
+def analyzeSample(keepRWorkers:bool=False, sharedErrorModels:tuple=None, preparedReads:tuple=None):
+    '''
+    :param keepRWorkers: leave the R workers running for another sample
+    :param sharedErrorModels: forward and reverse error models to use instead of learning them from this sample
+    :param preparedReads: result of prepareSampleReads if it has already been run for this sample
+    :return: tuple of (MiQ score result, path to JSON result, path to HTML report, read pairs analyzed)
+    '''
+    if preparedReads is None:
+        preparedReads = prepareSampleReads()
+    forwardReads, reverseReads, analysisReadCount = preparedReads
+    dada2Outputs = runDada2Functions(forwardReads, reverseReads, keepRWorkers, sharedErrorModels)
+    dada2Results = getDada2Results(dada2Outputs, analysisReadCount)
+    standardAnalysisResults = analyzeStandardResult(dada2Results)
+    resultPath = saveResult(standardAnalysisResults)
+    reportPath = generateReport(standardAnalysisResults)
+    return standardAnalysisResults, resultPath, reportPath, analysisReadCount
+
+
 if __name__ == "__main__":
     default = loadDefaultPackage()
     loggingFormat = "%(levelname)s:%(name)s:%(message)s"
@@ -407,9 +622,5 @@ if __name__ == "__main__":
     setLogging()
     parameters = getApplicationParameters()
     logger.debug("Starting analysis")
-    dada2Outputs = runDada2Functions(parameters.forwardReads.value, parameters.reverseReads.value)
-    dada2Results = getDada2Results(dada2Outputs)
-    standardAnalysisResults = analyzeStandardResult(dada2Results)
-    saveResult(standardAnalysisResults)
-    generateReport(standardAnalysisResults)
+    analyzeSample()
     exit(0)
@@ -0,0 +1,273 @@
+import os
+import logging
+import miqScore16SPublicSupport
+import analyzeStandardReads
+
+
+def getBatchParameters():
+    parameters = miqScore16SPublicSupport.parameters.environmentParameterParser.EnvParameters()
+    parameters.addParameter("manifest", str, default=default.manifestFile, expectedFile=True)
+    parameters.addParameter("sequenceFolder", str, default=default.sequenceFolder, expectedDirectory=True)
+    parameters.addParameter("outputFolder", str, default=default.outputFolder, createdDirectory=True)
+    parameters.addParameter("coreBudget", int, default=default.coreBudget, lowerBound=0)
+    parameters.addParameter("memoryBudget", int, default=default.memoryBudget, lowerBound=0)
+    parameters.addParameter("coresPerSample", int, default=default.coresPerSample, lowerBound=1)
+    parameters.addParameter("memoryPerSample", int, default=default.memoryPerSample, lowerBound=0)
+    parameters.addParameter("sharedErrorModels", bool, default=default.sharedErrorModels)
+    parameters.addParameter("errorModelBases", int, default=default.errorModelBases, lowerBound=1)
+    parameters.addParameter("rScriptFolder", str, default=default.rScriptFolder, expectedDirectory=True)
+    parameters.addParameter("noStepCache", bool, default=False)
+    parameters.addParameter("stepCacheSizeLimit", int, default=default.stepCacheSizeLimit, lowerBound=0)
+    parameters.checkCreatedFileStructures()
+    return parameters
+
+
+def setBatchLogging():
+    formatter = logging.Formatter(loggingFormat)
+    logStreamHandle = logging.StreamHandler()
+    logStreamHandle.setFormatter(formatter)
+    logStreamHandle.setLevel(default.loggingLevel)
+    logFileHandle = logging.FileHandler(os.path.join(batchParameters.outputFolder.value, "batch.%s.log" %default.timestamp))
+    logFileHandle.setFormatter(formatter)
+    logFileHandle.setLevel(default.loggingLevel)
+    logger.addHandler(logFileHandle)
+    logger.addHandler(logStreamHandle)
+
+
+def loadManifest(manifestPath:str):
+    masterTable = miqScore16SPublicSupport.projectData.microbiome.sixteenS.metadata.masterTable.MasterTable(manifestPath)
+    samples = analyzeStandardReads.removeFileRedundantEntries(masterTable)
+    logger.info("Loaded %s samples from %s" %(len(samples), manifestPath))
+    return samples
+
+
+def sampleReadPaths(sample:miqScore16SPublicSupport.projectData.microbiome.sixteenS.metadata.masterTable.MasterTableLine):
+    sequenceFolder = batchParameters.sequenceFolder.value
+    return os.path.join(sequenceFolder, sample.read1), os.path.join(sequenceFolder, sample.read2)
+
+
+def sampleReadBytes(sample:miqScore16SPublicSupport.projectData.microbiome.sixteenS.metadata.masterTable.MasterTableLine):
+    return sum([os.path.getsize(path) for path in sampleReadPaths(sample) if os.path.isfile(path)])
+
+
+def stageSampleReads(sample:miqScore16SPublicSupport.projectData.microbiome.sixteenS.metadata.masterTable.MasterTableLine, sampleFolder:str):
+    '''
+    Links a sample's reads into a sequence folder of their own, since Figaro picks its trimming parameters from every
+    read file in the folder it is given.
+    '''
+    sampleSequenceFolder = os.path.join(sampleFolder, "sequence")
+    os.makedirs(sampleSequenceFolder, exist_ok=True)
+    stagedPaths = []
+    for sourcePath in sampleReadPaths(sample):
+        if not os.path.isfile(sourcePath):
+            raise FileNotFoundError("Unable to find reads for sample %s at %s" %(sample.sampleID, sourcePath))
+        stagedPath = os.path.join(sampleSequenceFolder, os.path.split(sourcePath)[1])
+        if not os.path.lexists(stagedPath):
+            os.symlink(os.path.abspath(sourcePath), stagedPath)
+        stagedPaths.append(stagedPath)
+    return sampleSequenceFolder, stagedPaths[0], stagedPaths[1]
+
+
+def analyzeBatchSample(task:tuple):
+    '''
+    Runs in a pool worker process. The sample's settings are passed to the single sample analysis through the same
+    environment variables it reads when run on its own, so every sample gets the same validation.
+    :param task: tuple of (manifest line, cores this sample may use, shared error models or None, whether to stop after
+    trimming, trimming record or None)
+    :return: batch summary record for the sample. If it stopped after trimming, the record also holds the trimmed read
+    paths, the prepared reads and their checksums, which are handed back in the trimming record for the analysis.
+    '''
+    import time
+    stepCache = miqScore16SPublicSupport.pipeline.stepCache
+    sample, coreBudget, sharedErrorModels, trimOnly, trimRecord = task
+    startTime = time.time()
+    sampleFolder = os.path.join(batchParameters.outputFolder.value, sample.sampleID)
+    record = {"sampleName": sample.sampleLabel, "sampleID": sample.sampleID, "outputFolder": sampleFolder}
+    existingHandlers = list(analyzeStandardReads.logger.handlers)
+    try:
+        sampleSequenceFolder, forwardReads, reverseReads = stageSampleReads(sample, sampleFolder)
+        os.environ.update({"SAMPLENAME": sample.sampleLabel,
+                           "FORWARDREADS": forwardReads,
+                           "REVERSEREADS": reverseReads,
+                           "SEQUENCEFOLDER": sampleSequenceFolder,
+                           "OUTPUTFOLDER": sampleFolder,
+                           "LOGFILE": os.path.join(sampleFolder, "dada2.%s%s.log" %(default.timestamp, ".trim" if trimOnly else "")),
+                           "COREBUDGET": str(coreBudget)})
+        analyzeStandardReads.setLogging()
+        analyzeStandardReads.parameters = analyzeStandardReads.getApplicationParameters()
+        if trimOnly:
+            logger.info("Trimming sample %s (%s)" %(sample.sampleLabel, sample.sampleID))
+            preparedReads = analyzeStandardReads.prepareSampleReads()
+            record.update({"status": "trimmed",
+                           "trimmedReads": analyzeStandardReads.trimSample(keepRWorkers=True, preparedReads=preparedReads),
+                           "preparedReads": preparedReads,
+                           "checksums": {path: stepCache.fileChecksum(path) for path in preparedReads[:2]}})  #already known here, saves hashing them in another worker
+            return record
+        preparedReads = None
+        if trimRecord:
+            preparedReads = trimRecord["preparedReads"]
+            for path, checksum in trimRecord["checksums"].items():
+                stepCache.rememberChecksum(path, checksum)
+        logger.info("Starting sample %s (%s)" %(sample.sampleLabel, sample.sampleID))
+        result, resultPath, reportPath, readPairs = analyzeStandardReads.analyzeSample(keepRWorkers=True, sharedErrorModels=sharedErrorModels, preparedReads=preparedReads)
+        record.update({"status": "succeeded",
+                       "miqScore": round(result.miqScore),
+                       "readPairs": readPairs,
+                       "resultFile": resultPath,
+                       "reportFile": reportPath})
+    except Exception as error:  #one bad sample should not stop the batch
+        logger.exception("Sample %s (%s) failed" %(sample.sampleLabel, sample.sampleID))
+        record.update({"status": "failed", "error": "%s: %s" %(type(error).__name__, error)})
+    finally:
+        for handler in analyzeStandardReads.logger.handlers[:]:
+            if not handler in existingHandlers:
+                analyzeStandardReads.logger.removeHandler(handler)
+                handler.close()
+        record["seconds"] = round(time.time() - startTime, 1)
+    return record
+
+
+def getErrorModelCache():
+    if batchParameters.noStepCache.value:
+        return None
+    return miqScore16SPublicSupport.pipeline.stepCache.StepCache(os.environ["STEPCACHEFOLDER"], batchParameters.stepCacheSizeLimit.value * 1024 * 1024)
+
+
+def buildGroupErrorModels(groupName:str, trimmedReadPairs:list, coreBudget:int):
+    '''
+    Learns one pair of error models from the pooled trimmed reads of every sample in an error model group. learnErrors
+    stops reading files once it has errorModelBases bases, so the files are put in a shuffled (but repeatable) order to
+    keep the first few samples in the manifest from supplying all of them.
+    :param trimmedReadPairs: list of (forward, reverse) trimmed read paths for the group's samples
+    :return: tuple of forward and reverse error model paths
+    '''
+    import random
+    rRunner = miqScore16SPublicSupport.pipeline.rRunner
+    stepCache = miqScore16SPublicSupport.pipeline.stepCache
+    naming = miqScore16SPublicSupport.projectData.utilities.validations.naming
+    modelFolder = os.path.join(batchParameters.outputFolder.value, "errorModels")
+    os.makedirs(modelFolder, exist_ok=True)
+    fileBaseName = naming.alphaNumericString(groupName, "._-", replacement="_")
+    outputFiles = {"forward": os.path.join(modelFolder, "%s_1.Rda" %fileBaseName),
+                   "reverse": os.path.join(modelFolder, "%s_2.Rda" %fileBaseName)}
+    trimmedReadPairs = sorted(trimmedReadPairs)
+    random.Random(groupName).shuffle(trimmedReadPairs)
+    forwardReads = [pair[0] for pair in trimmedReadPairs]
+    reverseReads = [pair[1] for pair in trimmedReadPairs]
+    scriptPath = os.path.join(batchParameters.rScriptFolder.value, "dada2.builderrormodels.R")
+    cache = getErrorModelCache()
+    if cache:
+        key = stepCache.makeStepKey("groupErrorModels", "1", {"nbases": batchParameters.errorModelBases.value}, forwardReads + reverseReads, [scriptPath])
+        if cache.restore(key, outputFiles) is not None:
+            logger.info("Reusing cached error models for group %s (%s)" %(groupName, key))
+            return outputFiles["forward"], outputFiles["reverse"]
+    jobs = []
+    threadCounts = rRunner.splitCores(coreBudget, 2)
+    for direction, readPaths, threads in zip(("forward", "reverse"), (forwardReads, reverseReads), threadCounts):
+        fileListPath = os.path.join(modelFolder, "%s.%s.fileList.txt" %(fileBaseName, direction))
+        fileList = open(fileListPath, "w")
+        for path in readPaths:
+            print(path, file=fileList)
+        fileList.close()
+        arguments = {"i": fileListPath, "o": outputFiles[direction], "t": threads, "n": batchParameters.errorModelBases.value}
+        command = rRunner.buildRscriptCommand(default.rScriptExecutable, scriptPath, arguments)
+        jobs.append(rRunner.RScriptJob("Error model build for group %s %s reads" %(groupName, direction), command))
+    logger.info("Building error models for group %s from %s samples" %(groupName, len(trimmedReadPairs)))
+    rRunner.runConcurrently(jobs)
+    if cache:
+        cache.store(key, "groupErrorModels", outputFiles)
+    return outputFiles["forward"], outputFiles["reverse"]
+
+
+def buildSharedErrorModels(pool, tasks:list, samples:list, summary:miqScore16SPublicSupport.pipeline.batchScheduler.BatchSummary, coreBudget:int):
+    '''
+    Trims every sample, then builds error models for each error model group from its members' trimmed reads. Samples
+    that fail trimming, or whose group's models fail, go straight into the summary.
+    :return: tuple of (analysis tasks carrying each sample's group models, dictionary of trimming records by sample ID)
+    '''
+    trimRecords = {}
+    for record in pool.imap_unordered(analyzeBatchSample, [(sample, cores, None, True, None) for sample, cores, sharedErrorModels, trimOnly, trimRecord in tasks]):
+        if record["status"] == "failed":
+            summary.add(record)
+        else:
+            trimRecords[record["sampleID"]] = record
+    groups = {}
+    for sample in samples:
+        if sample.sampleID in trimRecords:
+            groups.setdefault(sample.errorModelGroup, []).append(sample)
+    groupModels = {}
+    for groupName, members in groups.items():
+        try:
+            groupModels[groupName] = buildGroupErrorModels(groupName, [trimRecords[member.sampleID]["trimmedReads"] for member in members], coreBudget)
+        except Exception as error:
+            logger.exception("Unable to build error models for group %s" %groupName)
+            for member in members:
+                record = trimRecords.pop(member.sampleID)
+                record.update({"status": "failed", "error": "Error model group %s failed. %s: %s" %(groupName, type(error).__name__, error)})
+                summary.add(record)
+    analysisTasks = [(sample, cores, groupModels[sample.errorModelGroup], False, trimRecords[sample.sampleID]) for sample, cores, sharedErrorModels, trimOnly, trimRecord in tasks if sample.sampleID in trimRecords]
+    return analysisTasks, trimRecords
+
+
+def initializeBatchProcess():
+    import multiprocessing.util
+    multiprocessing.util.Finalize(None, analyzeStandardReads.stopRWorkerPool, exitpriority=10)
+
+
+def runBatch(samples:list):
+    '''
+    Runs samples in a pool of forked worker processes, which inherit the reference data already loaded here.
+    :return: BatchSummary with one record per sample
+    '''
+    import multiprocessing
+    batchScheduler = miqScore16SPublicSupport.pipeline.batchScheduler
+    coreBudget = batchParameters.coreBudget.value or miqScore16SPublicSupport.pipeline.rRunner.availableCores()
+    concurrentSamples = batchScheduler.concurrentSampleCount(len(samples), coreBudget, batchParameters.memoryBudget.value, batchParameters.coresPerSample.value, batchParameters.memoryPerSample.value)
+    coresPerRunningSample = max(coreBudget // concurrentSamples, 1)
+    logger.info("Running %s samples, %s at a time with %s cores each" %(len(samples), concurrentSamples, coresPerRunningSample))
+    summary = batchScheduler.BatchSummary([sample.sampleID for sample in samples])
+    tasks = [(sample, coresPerRunningSample, None, False, None) for sample in batchScheduler.largestFirst(samples, sampleReadBytes)]
+    trimRecords = {}
+    pool = multiprocessing.get_context("fork").Pool(concurrentSamples, initializer=initializeBatchProcess)
+    try:
+        if batchParameters.sharedErrorModels.value:
+            tasks, trimRecords = buildSharedErrorModels(pool, tasks, samples, summary, coreBudget)
+        for record in pool.imap_unordered(analyzeBatchSample, tasks):
+            if record["sampleID"] in trimRecords:
+                record["seconds"] += trimRecords[record["sampleID"]]["seconds"]
+            summary.add(record)
+            logger.info("Sample %s %s in %s seconds (%s of %s done)" %(record["sampleName"], record["status"], record["seconds"], len(summary.records), len(samples)))
+    finally:
+        pool.close()
+        pool.join()
+    return summary
+
+
+def saveBatchSummary(summary:miqScore16SPublicSupport.pipeline.batchScheduler.BatchSummary):
+    outputFolder = batchParameters.outputFolder.value
+    summary.writeCSV(os.path.join(outputFolder, "batchSummary.csv"))
+    summaryPath = summary.writeJSON(os.path.join(outputFolder, "batchSummary.json"))
+    print("Output batch summary to %s" %summaryPath)
+    return summaryPath
+
+
+if __name__ == "__main__":
+    default = analyzeStandardReads.loadDefaultPackage()
+    loggingFormat = "%(levelname)s:%(name)s:%(message)s"
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.DEBUG)
+    analyzeStandardReads.default = default
+    analyzeStandardReads.loggingFormat = loggingFormat
+    analyzeStandardReads.logger = logging.getLogger(analyzeStandardReads.__name__)
+    analyzeStandardReads.logger.setLevel(logging.DEBUG)
+    batchParameters = getBatchParameters()
+    os.environ.setdefault("STEPCACHEFOLDER", default.stepCacheFolder)
+    setBatchLogging()
+    if batchParameters.sharedErrorModels.value and batchParameters.noStepCache.value:
+        logger.warning("Shared error models with the step cache off will trim every sample twice")
+    batchSamples = loadManifest(batchParameters.manifest.value)
+    analyzeStandardReads.getReferenceSet()  #loaded once here and shared with every worker process
+    batchSummary = runBatch(batchSamples)
+    saveBatchSummary(batchSummary)
+    logger.info(str(batchSummary))
+    exit(1 if batchSummary.count("failed") else 0)
@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+import gzip
+import tempfile
+sys.path.insert(0, os.path.split(os.path.split(os.path.abspath(__file__))[0])[0])
+import miqScore16SPublicSupport
+
+fastqHandler = miqScore16SPublicSupport.formatReaders.fastq.fastqHandler
+
+
+def makeSyntheticFastq(path:str, readCount:int, readLength:int=250, compress:bool=False):
+    import random
+    generator = random.Random(0)
+    if compress:
+        file = gzip.open(path, "wt", compresslevel=1)
+    else:
+        file = open(path, "w")
+    for i in range(readCount):
+        sequence = "".join(generator.choice("ACGT") for base in range(readLength))
+        quality = "".join(generator.choice("FFF:,#") for base in range(readLength))
+        print("@M00123:45:000000000-ABCDE:1:1101:%s:%s 1:N:0:1" %(i % 30000, i // 30000), file=file)
+        print(sequence, file=file)
+        print("+", file=file)
+        print(quality, file=file)
+    file.close()
+    return path
+
+
+def timeCall(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmarkFile(path:str):
+    fileSize = os.path.getsize(path)
+    print("Benchmarking %s (%s bytes on disk)" %(path, fileSize))
+    for name, function in (("countReads", fastqHandler.countReads), ("getLongestReadInFile", fastqHandler.getLongestReadInFile), ("validFastqFile", fastqHandler.validFastqFile)):
+        lineResult, lineTime = timeCall(function, path, useBlockReader=False)
+        blockResult, blockTime = timeCall(function, path, useBlockReader=True)
+        if not lineResult == blockResult:
+            raise RuntimeError("Line and block readers disagree for %s: %s vs. %s" %(name, lineResult, blockResult))
+        print("%s: line reader %.3fs (%.1f MB/s), block reader %.3fs (%.1f MB/s), speedup %.1fx" %(name, lineTime, fileSize / lineTime / 1e6, blockTime, fileSize / blockTime / 1e6, lineTime / blockTime))
+    if not path.endswith(".gz"):
+        workers = os.cpu_count() or 1
+        for name, function in (("countReads", fastqHandler.countReads), ("validFastqFile", fastqHandler.validFastqFile)):
+            serialResult, serialTime = timeCall(function, path)
+            parallelResult, parallelTime = timeCall(function, path, workers=max(workers, 2))
+            if not serialResult == parallelResult:
+                raise RuntimeError("Serial and parallel readers disagree for %s: %s vs. %s" %(name, serialResult, parallelResult))
+            print("%s: serial %.3fs, %s worker processes %.3fs, speedup %.1fx" %(name, serialTime, max(workers, 2), parallelTime, serialTime / parallelTime))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            benchmarkFile(path)
+    else:
+        readCount = 200000
+        with tempfile.TemporaryDirectory() as workingFolder:
+            benchmarkFile(makeSyntheticFastq(os.path.join(workingFolder, "synthetic.fastq"), readCount))
+            benchmarkFile(makeSyntheticFastq(os.path.join(workingFolder, "synthetic.fastq.gz"), readCount, compress=True))
@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+import random
+sys.path.insert(0, os.path.split(os.path.split(os.path.abspath(__file__))[0])[0])
+import miqScore16SPublicSupport
+
+qualityScoreHandler = miqScore16SPublicSupport.formatReaders.qualityScore.qualityScoreHandler
+
+
+def perCharacterExpectedError(qualityStrings:list, encoding:qualityScoreHandler.EncodingScheme):
+    expectedErrors = []
+    for qualityString in qualityStrings:
+        cumulativeExpectedErrorArray = []
+        cumulativeExpectedError = 0.0
+        for character in qualityString:
+            cumulativeExpectedError += encoding.toPError(character)
+            cumulativeExpectedErrorArray.append(cumulativeExpectedError)
+        expectedErrors.append(cumulativeExpectedErrorArray)
+    return expectedErrors
+
+
+if __name__ == "__main__":
+    readCount = 20000
+    generator = random.Random(0)
+    qualityStrings = ["".join(generator.choice("FFF:,#") for base in range(250)) for read in range(readCount)]
+    encoding = qualityScoreHandler.encodingSchemes.illumina
+    start = time.perf_counter()
+    perCharacterExpectedError(qualityStrings, encoding)
+    slowTime = time.perf_counter() - start
+    start = time.perf_counter()
+    qualityScoreHandler.cumulativeExpectedErrorMatrix(qualityStrings, encoding)
+    vectorizedTime = time.perf_counter() - start
+    print("Cumulative expected error for %s reads: per-character %.3fs, lookup table %.3fs, speedup %.1fx" %(readCount, slowTime, vectorizedTime, slowTime / vectorizedTime))
@@ -7,9 +7,12 @@ dataFolder = "/data"
 projectFolder = os.path.split(os.path.split(os.path.abspath(__file__))[0])[0]
 inputFolder = os.path.join(dataFolder, "input")
 outputFolder = os.path.join(dataFolder, "output")
+workingFolder = os.path.join(dataFolder, "working")
 sequenceFolder = os.path.join(inputFolder, "sequence")
 forwardReads = os.path.join(sequenceFolder, "standard_submitted_R1.fastq")
 reverseReads = os.path.join(sequenceFolder, "standard_submitted_R2.fastq")
 rScriptFolder = os.path.join(projectFolder, "rscripts")
 databaseFile = os.path.join(os.path.split(__main__.__file__)[0], "reference", "zrCommunityStandardrRNA.rdp.fa.gz")
 logFile = os.path.join(outputFolder, "dada2.%s.log" %timestamp)
+stepCacheFolder = os.path.join(workingFolder, "stepCache")  #kept out of the output folder so cached intermediates are not mixed in with deliverables
+manifestFile = os.path.join(inputFolder, "manifest.csv")
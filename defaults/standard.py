@@ -7,4 +7,15 @@ minOverlap = 10
 maxMismatch = 2
 loggingLevel = "INFO"
 maxReadCount = 0
-trimParameterDownsample = -1
\ No newline at end of file
+rejectOversizedSamples = False
+downsampleSeed = 0
+trimParameterDownsample = -1
+stepCacheSizeLimit = 20480  #MB
+coreBudget = 0  #0 uses every available core
+rBackend = "script"  #or "worker" to run R steps in warm R processes
+rWorkerJobTimeout = 21600  #seconds an R worker may spend on one job before it is killed and the job rerun with Rscript
+coresPerSample = 8  #batch mode
+memoryPerSample = 8192  #MB, batch mode, including the R worker processes each sample keeps when rBackend is "worker"
+memoryBudget = 0  #MB, 0 uses the memory available when a batch starts
+sharedErrorModels = False  #batch mode, one pair of error models per errorModelGroup
+errorModelBases = 100000000  #bases learnErrors reads for each shared error model
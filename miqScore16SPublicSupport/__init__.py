@@ -1,9 +1,11 @@
 __all__ = ["parameters",
            "projectData",
            "formatReaders",
-           "reporting"]
+           "reporting",
+           "pipeline"]
 
 from . import parameters
 from . import projectData
 from . import formatReaders
 from . import reporting
+from . import pipeline
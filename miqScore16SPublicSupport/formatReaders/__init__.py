@@ -1,7 +1,11 @@
 from . import fastq
 from . import qualityScore
 from . import gzipIdentifier
+from . import compressionCodecs
+from . import diagnostics
 
 __all__ = ["fastq",
            "qualityScore",
-           "gzipIdentifier"]
\ No newline at end of file
+           "gzipIdentifier",
+           "compressionCodecs",
+           "diagnostics"]
\ No newline at end of file
@@ -0,0 +1,243 @@
+'''
+Detection and decompression of compressed sequence files. Codecs are recognized from the first bytes of the file rather
+than the file name, and each codec has an ordered list of decompression backends to try: fast external programs (when
+found on the PATH) first, then the Python standard library. Every opened stream reports the name of the backend it used.
+'''
+import io
+import os
+import logging
+logger = logging.getLogger(__name__)
+
+plain = "plain"
+gzip = "gzip"
+bgzf = "bgzf"
+bzip2 = "bzip2"
+xz = "xz"
+zstd = "zstd"
+
+magicBytes = [(gzip, b"\x1f\x8b"),
+              (bzip2, b"BZh"),
+              (xz, b"\xfd7zXZ\x00"),
+              (zstd, b"\x28\xb5\x2f\xfd")]
+
+externalDecompressors = {gzip: [("igzip", ["igzip", "-dc"]), ("pigz", ["pigz", "-dc"])],
+                         bgzf: [("igzip", ["igzip", "-dc"]), ("pigz", ["pigz", "-dc"]), ("bgzip", ["bgzip", "-dc"])],
+                         bzip2: [("lbzip2", ["lbzip2", "-dc"]), ("pbzip2", ["pbzip2", "-dc"])],
+                         xz: [("xz", ["xz", "-T0", "-dc"])],
+                         zstd: [("zstd", ["zstd", "-dcq"])]}
+
+preferExternalDecompressors = True
+
+
+def sniffCodec(path:str):
+    '''
+    Identifies the compression codec of a file from its magic bytes. BGZF is told apart from ordinary gzip by the BC
+    subfield in the gzip extra field of the first member.
+    :return: one of plain, gzip, bgzf, bzip2, xz or zstd
+    '''
+    if not os.path.isfile(path):
+        raise FileNotFoundError("Unable to determine the compression type of %s because that file does not exist." %path)
+    with open(path, "rb") as file:
+        header = file.read(18)
+    for codec, magic in magicBytes:
+        if header.startswith(magic):
+            if codec == gzip and len(header) >= 14 and header[3] & 4 and header[12:14] == b"BC":
+                return bgzf
+            return codec
+    return plain
+
+
+def isGzipCodec(codec:str):
+    return codec in (gzip, bgzf)
+
+
+def isCompressed(path:str):
+    return not sniffCodec(path) == plain
+
+
+def findExternalDecompressor(codec:str):
+    '''
+    :return: tuple of (backend name, command list) for the first external decompressor found on the PATH, or None
+    '''
+    import shutil
+    for name, command in externalDecompressors.get(codec, []):
+        if shutil.which(command[0]):
+            return name, command
+    return None
+
+
+class ExternalDecompressorStream(object):
+    '''
+    Binary read-only stream over the standard output of an external decompression program. Standard error goes to a
+    temporary file so that a chatty program can never fill a pipe and stall.
+    If raw observers are given, the program reads the file from standard input instead of by path, fed by a background
+    thread that passes each compressed chunk to every observer first. This lets checksums of the file as stored be taken
+    in the same pass as an external decompressor.
+    '''
+
+    def __init__(self, path:str, command:list, backendName:str, rawObservers:list=None, feedSize:int=1024 * 1024):
+        import subprocess
+        import tempfile
+        self.path = path
+        self.backendName = backendName
+        self.rawObservers = rawObservers
+        self.stderrFile = tempfile.TemporaryFile()
+        self.feeder = None
+        self.feedError = None
+        if rawObservers:
+            import threading
+            self.command = command
+            self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self.stderrFile)
+            self.feeder = threading.Thread(target=self.feedInput, args=(feedSize,), daemon=True)
+            self.feeder.start()
+        else:
+            self.command = command + [path]
+            self.process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stderr=self.stderrFile)
+        self.reachedEnd = False
+
+    def feedInput(self, feedSize:int):
+        inputFile = open(self.path, "rb")
+        try:
+            chunk = inputFile.read(feedSize)
+            while chunk:
+                for observer in self.rawObservers:
+                    observer(chunk)
+                self.process.stdin.write(chunk)
+                chunk = inputFile.read(feedSize)
+        except (BrokenPipeError, ValueError):
+            pass  #the program exited or the stream was closed early, and checkExit reports any failure
+        except Exception as error:
+            self.feedError = error
+        finally:
+            inputFile.close()
+            try:
+                self.process.stdin.close()
+            except (BrokenPipeError, ValueError):
+                pass
+
+    def read(self, size:int=-1):
+        data = self.process.stdout.read(size)
+        if not data and not self.reachedEnd:
+            self.reachedEnd = True
+            self.checkExit()
+        return data
+
+    def checkExit(self):
+        returnCode = self.process.wait()
+        if self.feeder:
+            self.feeder.join()
+        if returnCode:
+            self.stderrFile.seek(0)
+            errorMessage = self.stderrFile.read().decode(errors="replace").strip()
+            raise OSError("%s failed to decompress %s (exit status %s): %s" %(self.backendName, self.path, returnCode, errorMessage))
+        if self.feedError:
+            raise self.feedError
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        if self.feeder:
+            self.feeder.join()
+        self.process.stdout.close()
+        self.stderrFile.close()
+
+    @property
+    def closed(self):
+        return self.process.stdout.closed
+
+
+def openStandardLibraryStream(source, codec:str):
+    '''
+    :param source: path to the compressed file, or an open binary handle on it (which the caller remains responsible for closing)
+    :return: tuple of (binary stream, backend name) decompressing the source with the standard library
+    '''
+    if isGzipCodec(codec):
+        from .fastq.fastqBlockReader import GzipMemberStream
+        if isinstance(source, str):
+            source = open(source, "rb")
+        return GzipMemberStream(source), "zlib"
+    if codec == bzip2:
+        import bz2
+        return bz2.BZ2File(source, "rb"), "bz2"
+    if codec == xz:
+        import lzma
+        return lzma.LZMAFile(source, "rb"), "lzma"
+    if codec == zstd:
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Reading zstd compressed files needs either the zstd program on the PATH or the zstandard Python package.")
+        if isinstance(source, str):
+            return zstandard.ZstdDecompressor().stream_reader(open(source, "rb"), closefd=True), "zstandard"
+        return zstandard.ZstdDecompressor().stream_reader(source, closefd=False), "zstandard"
+    raise ValueError("Unknown compression codec: %s" %codec)
+
+
+def openDecompressedStream(path:str, codec:str=None, allowExternal:bool=None, filehandle=None, rawObservers:list=None):
+    '''
+    Opens a binary stream of the decompressed contents of a file using the fastest backend available.
+    :param path: path to the file
+    :param codec: codec from sniffCodec, found from the file if not given
+    :param allowExternal: allow external programs to be used, defaults to preferExternalDecompressors. This should be
+    False whenever the caller needs gzip member positions.
+    :param filehandle: already open binary handle on the compressed file for standard library backends to read from
+    :param rawObservers: callables to pass each chunk of the file as stored to when an external program is used (callers
+    using the standard library backends observe their own filehandle instead)
+    :return: tuple of (binary stream, backend name)
+    '''
+    if codec is None:
+        codec = sniffCodec(path)
+    if allowExternal is None:
+        allowExternal = preferExternalDecompressors
+    if codec == plain:
+        if filehandle is None:
+            filehandle = open(path, "rb")
+        return filehandle, "none"
+    if allowExternal and filehandle is None:
+        externalDecompressor = findExternalDecompressor(codec)
+        if externalDecompressor:
+            backendName, command = externalDecompressor
+            return ExternalDecompressorStream(path, command, backendName, rawObservers), backendName
+    if filehandle is None:
+        return openStandardLibraryStream(path, codec)
+    return openStandardLibraryStream(filehandle, codec)
+
+
+def openTextStream(path:str, codec:str=None, allowExternal:bool=None):
+    '''
+    :return: tuple of (text stream, backend name)
+    '''
+    stream, backendName = openDecompressedStream(path, codec, allowExternal)
+    if backendName == "none":
+        stream.close()
+        return open(path, "r"), backendName
+    return io.TextIOWrapper(io.BufferedReader(RawStreamWrapper(stream))), backendName
+
+
+class RawStreamWrapper(io.RawIOBase):
+    '''
+    Raw IO interface over decompression streams that only provide read and close (and may return more data than asked
+    for), so that they can sit under io.BufferedReader and io.TextIOWrapper.
+    '''
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.pending:
+            self.pending = self.stream.read(len(buffer))
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stream.close()
+        super().close()
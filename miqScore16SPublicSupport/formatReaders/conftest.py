@@ -0,0 +1,49 @@
+import os
+import gzip
+from pytest import fixture
+
+
+def fastqText(readCount:int, readLength:int=150, direction:int=1):
+    records = []
+    for i in range(readCount):
+        header = "@M00123:45:000000000-ABCDE:1:%s:%s:%s %s:N:0:1" %(1101 + i % 3, 1000 + i, 2000 + i, direction)
+        sequence = "ACGT" * (readLength // 4) + "A" * (readLength % 4)
+        quality = "I" * (readLength - 10) + "#" * 10
+        records.append("%s\n%s\n+\n%s\n" %(header, sequence, quality))
+    return "".join(records)
+
+
+def fastqFile(folder, name:str, text:str, compress:bool=False):
+    path = os.path.join(str(folder), name)
+    if compress:
+        file = gzip.open(path, "wt")
+    else:
+        file = open(path, "w")
+    file.write(text)
+    file.close()
+    return path
+
+
+def multiMemberGzipFile(folder, name:str, text:str, memberSize:int=37001):
+    path = os.path.join(str(folder), name)
+    data = text.encode()
+    file = open(path, "wb")
+    for start in range(0, len(data), memberSize):
+        file.write(gzip.compress(data[start:start + memberSize]))
+    file.close()
+    return path
+
+
+@fixture
+def makeFastqText():
+    return fastqText
+
+
+@fixture
+def writeFastq():
+    return fastqFile
+
+
+@fixture
+def writeMultiMemberGzip():
+    return multiMemberGzipFile
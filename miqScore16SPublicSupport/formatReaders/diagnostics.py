@@ -0,0 +1,145 @@
+'''
+Aggregated reporting for problems found record by record. Instead of logging every bad record as it is found (which on a
+badly malformed file means millions of log lines and string formatting that costs more than the parsing), issues are
+counted by type and only the first few examples of each are kept. A single summary is logged when the scan or file is
+finished. Messages are stored as a format string and arguments and are only formatted when they are actually shown.
+Set logEachIssue (or pass logEach=True) to get the old behavior of logging every record as it comes.
+'''
+import logging
+logger = logging.getLogger(__name__)
+
+defaultExampleLimit = 5
+logEachIssue = False
+
+
+class IssueTally(object):
+
+    __slots__ = ["issueType", "level", "count", "examples"]
+
+    def __init__(self, issueType:str, level:int):
+        self.issueType = issueType
+        self.level = level
+        self.count = 0
+        self.examples = []
+
+
+class DiagnosticsCollector(object):
+    '''
+    Counts issues by type and keeps the first exampleLimit examples of each.
+    :param name: what the issues are about (usually a file path), used in the summary
+    :param exampleLimit: number of example messages to keep for each issue type
+    :param logEach: also log every issue as it is reported, defaults to the module's logEachIssue setting
+    :param issueLogger: logger that per-issue messages and the summary go to
+    '''
+
+    def __init__(self, name:str="", exampleLimit:int=defaultExampleLimit, logEach:bool=None, issueLogger:logging.Logger=None):
+        self.name = name
+        self.exampleLimit = exampleLimit
+        if logEach is None:
+            logEach = logEachIssue
+        self.logEach = logEach
+        if issueLogger is None:
+            issueLogger = logger
+        self.issueLogger = issueLogger
+        self.tallies = {}
+        self.summaryEmitted = False
+
+    def report(self, issueType:str, level:int, message:str, *arguments):
+        '''
+        Records one occurrence of an issue.
+        :param issueType: short name grouping issues of the same kind, such as "invalidBase"
+        :param level: logging level for the issue
+        :param message: %-style format string, only formatted if it is kept as an example or logged right away
+        :param arguments: values for the format string
+        '''
+        tally = self.tallies.get(issueType)
+        if tally is None:
+            tally = IssueTally(issueType, level)
+            self.tallies[issueType] = tally
+        tally.count += 1
+        tally.level = max(tally.level, level)
+        if len(tally.examples) < self.exampleLimit:
+            tally.examples.append((message, arguments))
+        if self.logEach:
+            self.issueLogger.log(level, message, *arguments)
+        self.summaryEmitted = False
+
+    def error(self, issueType:str, message:str, *arguments):
+        self.report(issueType, logging.ERROR, message, *arguments)
+
+    def warning(self, issueType:str, message:str, *arguments):
+        self.report(issueType, logging.WARNING, message, *arguments)
+
+    def count(self, issueType:str=None):
+        '''
+        :return: occurrences of the given issue type, or of all issues if no type is given
+        '''
+        if issueType is None:
+            return sum([tally.count for tally in self.tallies.values()])
+        tally = self.tallies.get(issueType)
+        if tally is None:
+            return 0
+        return tally.count
+
+    @property
+    def counts(self):
+        return {issueType: tally.count for issueType, tally in self.tallies.items()}
+
+    def examples(self, issueType:str):
+        tally = self.tallies.get(issueType)
+        if tally is None:
+            return []
+        return [message %arguments for message, arguments in tally.examples]
+
+    def merge(self, other):
+        for issueType, otherTally in other.tallies.items():
+            tally = self.tallies.get(issueType)
+            if tally is None:
+                tally = IssueTally(issueType, otherTally.level)
+                self.tallies[issueType] = tally
+            tally.count += otherTally.count
+            tally.level = max(tally.level, otherTally.level)
+            tally.examples.extend(otherTally.examples[:self.exampleLimit - len(tally.examples)])
+        return self
+
+    def summary(self):
+        if not self.tallies:
+            return "No issues found for %s" %self.name
+        summaryLines = ["Found %s issues of %s types for %s:" %(self.count(), len(self.tallies), self.name)]
+        for tally in sorted(self.tallies.values(), key=lambda tally: tally.count, reverse=True):
+            summaryLines.append("  %s: %s (%s)" %(tally.issueType, tally.count, logging.getLevelName(tally.level)))
+            for example in self.examples(tally.issueType):
+                summaryLines.append("    e.g. %s" %example)
+            if tally.count > len(tally.examples):
+                summaryLines.append("    ...and %s more" %(tally.count - len(tally.examples)))
+        return "\n".join(summaryLines)
+
+    def emitSummary(self):
+        '''
+        Logs the summary once, at the level of the most serious issue found. Nothing is logged if there were no issues
+        or the summary has already been logged since the last issue came in.
+        '''
+        if not self.tallies or self.summaryEmitted:
+            return
+        level = max([tally.level for tally in self.tallies.values()])
+        self.issueLogger.log(level, self.summary())
+        self.summaryEmitted = True
+
+    def __bool__(self):
+        return bool(self.tallies)
+
+    def __str__(self):
+        return "Diagnostics for %s: %s" %(self.name, self.counts)
+
+
+def collectorOrDefault(diagnostics:DiagnosticsCollector=None):
+    '''
+    Objects made outside of any scan (a lone ReadMetadataLine, for instance) report to this shared collector. Nothing
+    ever summarizes it, so it logs each issue as it comes in.
+    '''
+    if diagnostics is None:
+        return sharedCollector
+    return diagnostics
+
+
+sharedCollector = DiagnosticsCollector("records read outside of a scan", logEach=True)
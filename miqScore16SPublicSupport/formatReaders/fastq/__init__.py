@@ -1,7 +1,31 @@
 from . import fastqHandler
 from . import fastqAnalysis
 from . import fileNamingStandards
+from . import fastqBlockReader
+from . import fastqScanner
+from . import fastqParallel
+from . import fastqGzipIndex
+from . import fastqMmap
+from . import fastqDownsampler
+from . import fastqThreadedReader
+from . import fastqWriter
+from . import fastqBatch
+from . import fastqHeaders
+from . import fastqSampler
+from . import fastqComposition
 
 __all__ = ["fastqHandler",
            "fastqAnalysis",
-           "fileNamingStandards"]
\ No newline at end of file
+           "fileNamingStandards",
+           "fastqBlockReader",
+           "fastqScanner",
+           "fastqParallel",
+           "fastqGzipIndex",
+           "fastqMmap",
+           "fastqDownsampler",
+           "fastqThreadedReader",
+           "fastqWriter",
+           "fastqBatch",
+           "fastqHeaders",
+           "fastqSampler",
+           "fastqComposition"]
\ No newline at end of file
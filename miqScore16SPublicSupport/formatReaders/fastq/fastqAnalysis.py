@@ -4,12 +4,11 @@ from . import fileNamingStandards
 
 def buildQualityMatrix(path:str):
     import numpy
-    from .fastqHandler import FastqFile
-    fastq = FastqFile(path, depth=1)
-    qualityMatrix = []
-    for read in fastq:
-        qualityMatrix.append(read.quality.phredScores)
-    fastq.close()
+    compactQualities = buildCompactQualities(path)
+    qualityMatrix = numpy.zeros((compactQualities.readCount, compactQualities.longestRead), dtype='uint8')
+    for start, stop in compactQualities.iterReadRanges():
+        qualityBytes, lengths = compactQualities.qualityMatrix(start, stop, padCharacter=compactQualities.encoding.base)
+        qualityMatrix[start:stop, :qualityBytes.shape[1]] = qualityBytes - compactQualities.encoding.base
     return numpy.matrix(qualityMatrix, dtype='uint8') #Memory efficient, but if someone feeds in a phred score > 255, this will break. PacBio, I'm looking at you.
 
 
@@ -17,20 +16,61 @@ def buildQualityMatrixPaired(forward:str, reverse:str):
     return buildQualityMatrix(forward), buildQualityMatrix(reverse)
 
 
+def iterSubsampledLineBatches(path:str, subsample:int=0, lineOffset:int=3):
+    '''
+    Yields lists of one raw line from each record of a fastq file (the quality line by default, or the sequence line
+    with a lineOffset of 1), keeping every subsample-th record (counting from the first) the same way FastqFile does.
+    '''
+    from . import fastqBlockReader
+    subsample = max(int(subsample), 1)
+    reader = fastqBlockReader.FastqBlockReader(path)
+    recordsSeen = 0
+    for lines in reader.iterLineBatches():
+        firstIncluded = -recordsSeen % subsample
+        recordsSeen += len(lines) // 4
+        selectedLines = lines[lineOffset + 4 * firstIncluded::4 * subsample]
+        if selectedLines:
+            yield selectedLines
+
+
+def iterSubsampledQualityBatches(path:str, subsample:int=0):
+    return iterSubsampledLineBatches(path, subsample, 3)
+
+
+def iterSubsampledSequenceBatches(path:str, subsample:int=0):
+    return iterSubsampledLineBatches(path, subsample, 1)
+
+
+def buildCompactQualities(path:str, subsample:int=0):
+    '''
+    Reads every (or every subsample-th) quality string in a fastq file into run-length encoded storage, which takes a
+    fraction of the memory of the quality strings themselves on binned data.
+    '''
+    from .. import qualityScore
+    from .fastqHandler import findQualityScoreEncoding
+    compactQualities = qualityScore.qualityRunLength.RunLengthQualities(findQualityScoreEncoding(path))
+    for qualities in iterSubsampledQualityBatches(path, subsample):
+        compactQualities.addBatch(qualities)
+    return compactQualities
+
+
 def buildExpectedErrorMatrix(path:str, superLean:bool = False, startPosition:int = 0, subsample:int=0):
     import numpy
-    from .. import qualityScore
-    from .fastqHandler import FastqFile
-    fastq = FastqFile(path, depth = 0, subsample = subsample)
-    expectedErrorMatrix = []
-    dataType = 'float16'
+    dataType = 'float16' #low precision floating point. Usually users are looking for whole numbers anyway
     if superLean:
         dataType = 'uint8'
-    for line in fastq:
-        expectedErrorLineList = qualityScore.qualityScoreHandler.cumulativeExpectedErrorArray(line.quality, fastq.qualityScoreScheme)[startPosition:]
-        expectedErrorMatrix.append(expectedErrorLineList)  #low precision floating point. Usually users are looking for whole numbers anyway
-    fastq.close()
-    return numpy.array(expectedErrorMatrix, dataType, order='F')
+    compactQualities = buildCompactQualities(path, subsample)
+    if not compactQualities.readCount:
+        return numpy.array([], dataType, order='F')
+    columns = max(compactQualities.longestRead - startPosition, 0)
+    outputMatrix = numpy.full((compactQualities.readCount, columns), numpy.nan if not superLean else 255, dtype=dataType, order='F')
+    for start, stop in compactQualities.iterReadRanges():
+        expectedErrorMatrix, lengths = compactQualities.cumulativeExpectedErrorMatrix(start, stop)
+        expectedErrorMatrix = expectedErrorMatrix[:, startPosition:]
+        if superLean:
+            expectedErrorMatrix = numpy.where(numpy.isnan(expectedErrorMatrix), 255, numpy.minimum(expectedErrorMatrix, 255))
+        outputMatrix[start:stop, :expectedErrorMatrix.shape[1]] = expectedErrorMatrix.astype(dataType)
+    return outputMatrix
 
 
 def buildExpectedErrorMatrixPaired(forward:str, reverse:str, superLean:bool = False, startPositions:tuple = (0, 0), subsample:int=0):
@@ -46,61 +86,63 @@ def findCutoffByPercentile(path:str, phredScore:int, percentile:int):
     :param percentile:  percentile to use in cutoff
     :return:base position (integer)
     '''
-    import numpy
-    qualityMatrix = buildQualityMatrix(path).transpose() #faster calclation of percentiles if we have positions as rows and reads as columns
-    for position, row in enumerate(qualityMatrix):
-        nthPercentile = numpy.percentile(row, percentile)
-        if nthPercentile < percentile:
+    qualityHistogram = buildQualityHistogram(path)
+    for position, nthPercentile in enumerate(qualityHistogram.percentiles(percentile)):
+        if nthPercentile < phredScore:
             return position
-    return numpy.size(qualityMatrix, 0)
+    return qualityHistogram.length
 
 
-def makeQualityMatrix(path:str):
-    import numpy
+def buildQualityHistogram(path:str, subsample:int=0):
+    from .. import qualityScore
     from . import fastqHandler
-    readLength, variance = fastqHandler.estimateReadLength(path, getVariance=True)
-    if variance != 0:
-        readLength = fastqHandler.getLongestReadInFile(path)
-    fastq = fastqHandler.FastqFile(path, depth=1)
-    qualityRange = fastq.qualityScoreScheme.range
-    readLengthMatrix = [0] * readLength
-    qualityCountMatrix = []
-    for i in range(qualityRange + 1):
-        qualityCountMatrix.append(readLengthMatrix.copy())
+    encoding = fastqHandler.findQualityScoreEncoding(path)
+    qualityHistogram = qualityScore.qualityAccumulators.PositionQualityHistogram(encoding)
+    for qualities in iterSubsampledQualityBatches(path, subsample):
+        qualityHistogram.addBatch(qualities)
+    return qualityHistogram
+
+
+def buildExpectedErrorSketch(path:str, subsample:int=0, relativeAccuracy:float=0.01):
+    from .. import qualityScore
+    from . import fastqHandler
+    encoding = fastqHandler.findQualityScoreEncoding(path)
+    expectedErrorSketch = qualityScore.qualityAccumulators.PositionExpectedErrorSketch(encoding, relativeAccuracy)
+    for qualities in iterSubsampledQualityBatches(path, subsample):
+        expectedErrorSketch.addBatch(qualities)
+    return expectedErrorSketch
+
+
+def buildBaseComposition(path:str, subsample:int=0, gcBins:int=100):
+    '''
+    Counts bases at each read position and bins reads by GC content in a single pass over the sequence lines.
+    :return: tuple of (fastqComposition.PositionBaseComposition, fastqComposition.GCContentHistogram)
+    '''
+    from . import fastqComposition
+    composition = fastqComposition.PositionBaseComposition()
+    gcHistogram = fastqComposition.GCContentHistogram(gcBins)
+    for sequences in iterSubsampledSequenceBatches(path, subsample):
+        codes, lengths = fastqComposition.sequenceCodes(sequences)
+        composition.addCodes(codes, lengths)
+        gcHistogram.addBaseCounts(fastqComposition.readBaseCounts(codes, lengths))
+    return composition, gcHistogram
+
+
+def makeQualityMatrix(path:str):
     '''
-    Building a matrix here where the correspond to all possibly quality scores and columns represent each base position of each read (indexed to zero)
+    Builds a matrix where rows correspond to all possible quality scores and columns represent each base position of
+    each read (indexed to zero) in a single pass over the file.
     Calling a specific value is done by qualityMatrix[qualityScore][readPosition]
     '''
-    for read in fastq:
-        for position, phred in enumerate(read.quality.phredScores):
-            qualityCountMatrix[phred][position] = qualityCountMatrix[phred][position] + 1
-    fastq.close()
-    qualityCountMatrix = numpy.matrix(qualityCountMatrix)
-    return qualityCountMatrix
-    # plt.imshow(qualityCountMatrix, origin='lower', aspect='auto')
-    # plt.xlabel("Position")
-    # plt.ylabel("Quality (Phred)")
-    # plt.title("Read quality for %s" %path)
-    # if not testingOnly:
-    #     if outputFile:
-    #         plt.savefig(outputFile)
-    #     else:
-    #         plt.show()
-    # return qualityCountMatrix
+    return buildQualityHistogram(path).qualityCountMatrix()
 
 
 def makeAverageExpectedErrorLine(path:str):
-    import numpy
-    expectedErrorMatrix = buildExpectedErrorMatrix(path)
-    expectedErrorMatrix = expectedErrorMatrix.transpose()
-    means = []
-    for line in expectedErrorMatrix:
-        means.append(numpy.mean(line))
-    return means
-    # plt.plot(means, 'k-')
-    # plt.xlabel("Position")
-    # plt.ylabel("Average Expected Error")
-    # plt.show()
+    return buildExpectedErrorSketch(path).means().tolist()
+
+
+def makeExpectedErrorPercentileLine(path:str, percentile:[int, float]):
+    return buildExpectedErrorSketch(path).percentiles(percentile).tolist()
 
 
 def getDataForFastqPlots(forwardFastq:fileNamingStandards.NamingStandard, reverseFastq:fileNamingStandards.NamingStandard = None):
@@ -115,7 +157,40 @@ def getDataForFastqPlots(forwardFastq:fileNamingStandards.NamingStandard, revers
     return forwardQualityMatrix, reverseQualityMatrix, forwardExpectedErrorLine, reverseExpectedErrorLine
 
 
-def generateFastqPlotPaired(forwardFastq:fileNamingStandards.NamingStandard, reverseFastq:fileNamingStandards.NamingStandard, sampleTitle:str = None, outputFile:str = None, base64Format:str = None):
+def getCompositionDataForFastqPlots(forwardFastq:fileNamingStandards.NamingStandard, reverseFastq:fileNamingStandards.NamingStandard = None):
+    forwardComposition, forwardGCHistogram = buildBaseComposition(forwardFastq.filePath)
+    if reverseFastq is None:
+        reverseComposition = None
+        reverseGCHistogram = None
+    else:
+        reverseComposition, reverseGCHistogram = buildBaseComposition(reverseFastq.filePath)
+    return forwardComposition, reverseComposition, forwardGCHistogram, reverseGCHistogram
+
+
+def plotBaseComposition(composition, positionLabel:str):
+    import matplotlib.pyplot as plt
+    from . import fastqComposition
+    fractions = composition.fractions()
+    for row, base in enumerate(fastqComposition.baseCodes):
+        plt.plot(fractions[row], label=base)
+    plt.ylim(0, 1)
+    plt.xlabel(positionLabel)
+    plt.ylabel("Base Fraction")
+    plt.legend(loc="upper right", fontsize=6, ncol=5)
+
+
+def plotGCHistogram(gcHistogram, readLabel:str):
+    import matplotlib.pyplot as plt
+    binEdges = gcHistogram.binEdges()
+    plt.bar(binEdges[:-1], gcHistogram.fractions(), width=binEdges[1] - binEdges[0], align="edge", color="k")
+    plt.xlabel("%s GC Content" %readLabel)
+    plt.ylabel("Fraction of Reads")
+
+
+def generateFastqPlotPaired(forwardFastq:fileNamingStandards.NamingStandard, reverseFastq:fileNamingStandards.NamingStandard, sampleTitle:str = None, outputFile:str = None, base64Format:str = None, includeComposition:bool = False):
+    '''
+    :param includeComposition: add base composition by position and GC content plots next to the quality plots for each read
+    '''
     import matplotlib.pyplot as plt
     if base64Format:
         import base64
@@ -130,52 +205,77 @@ def generateFastqPlotPaired(forwardFastq:fileNamingStandards.NamingStandard, rev
     else:
         sampleTitle = str(sampleTitle)
     forwardQualityMatrix, reverseQualityMatrix, forwardExpectedErrorLine, reverseExpectedErrorLine = getDataForFastqPlots(forwardFastq, reverseFastq)
+    columns = 2
+    figureSize = None
+    if includeComposition:
+        columns = 4
+        forwardComposition, reverseComposition, forwardGCHistogram, reverseGCHistogram = getCompositionDataForFastqPlots(forwardFastq, reverseFastq)
+        figureSize = (16, 8)
+    figure = plt.figure(figsize=figureSize)
     plt.suptitle("Analysis of %s" % sampleTitle, horizontalalignment="center", fontsize=18, fontweight="bold")
 
     #make plots for forward reads
-    plt.subplot(221)
+    plt.subplot(2, columns, 1)
     plt.imshow(forwardQualityMatrix, origin='lower', aspect='auto')
     plt.xlabel("Read 1 Position")
     plt.ylabel("Quality (Phred)")
     plt.title(" ", fontsize = 16) #making a whitespace buffer
-    plt.subplot(222)
+    plt.subplot(2, columns, 2)
     plt.plot(forwardExpectedErrorLine, 'k-')
     plt.xlabel("Read 1 Position")
     plt.ylabel("Average Expected Error")
     plt.title(" ", fontsize = 16) #making a whitespace buffer
+    if includeComposition:
+        plt.subplot(2, columns, 3)
+        plotBaseComposition(forwardComposition, "Read 1 Position")
+        plt.title(" ", fontsize = 16) #making a whitespace buffer
+        plt.subplot(2, columns, 4)
+        plotGCHistogram(forwardGCHistogram, "Read 1")
+        plt.title(" ", fontsize = 16) #making a whitespace buffer
 
     #make plots for reverse reads
-    plt.subplot(223)
+    plt.subplot(2, columns, columns + 1)
     plt.imshow(reverseQualityMatrix, origin='lower', aspect='auto')
     plt.xlabel("Read 2 Position")
     plt.ylabel("Quality (Phred)")
     #plt.title("Read quality for %s" %reverseFastq.fileName)
-    plt.subplot(224)
+    plt.subplot(2, columns, columns + 2)
     plt.plot(reverseExpectedErrorLine, 'k-')
     plt.xlabel("Read 2 Position")
     plt.ylabel("Average Expected Error")
     #plt.title("Expected error for %s" % reverseFastq.fileName)
+    if includeComposition:
+        plt.subplot(2, columns, columns + 3)
+        plotBaseComposition(reverseComposition, "Read 2 Position")
+        plt.subplot(2, columns, columns + 4)
+        plotGCHistogram(reverseGCHistogram, "Read 2")
 
     plt.tight_layout()
-    if outputFile:
-        plt.savefig(outputFile)
-        if base64Format:
-            imageFile = open(outputFile)
-            encodedFile = base64.b64encode(imageFile.read())
-            imageFile.close()
+    try:
+        if outputFile:
+            plt.savefig(outputFile)
+            if base64Format:
+                imageFile = open(outputFile)
+                encodedFile = base64.b64encode(imageFile.read())
+                imageFile.close()
+                return encodedFile
+        elif base64Format:
+            import io
+            byteStream = io.BytesIO()
+            plt.savefig(byteStream, format=base64Format)
+            byteStream.seek(0)
+            encodedFile = base64.b64encode(byteStream.read())
             return encodedFile
-    elif base64Format:
-        import io
-        byteStream = io.BytesIO()
-        plt.savefig(byteStream, format=base64Format)
-        byteStream.seek(0)
-        encodedFile = base64.b64encode(byteStream.read())
-        return encodedFile
-    else:
-        plt.show()
+        else:
+            plt.show()
+    finally:
+        plt.close(figure)  #plot agents live for many samples, and pyplot keeps every open figure until it is closed
 
 
-def generateFastqPlotSingle(forwardFastq: fileNamingStandards.NamingStandard, sampleTitle: str = None, outputFile: str = None, base64Format:str = None):
+def generateFastqPlotSingle(forwardFastq: fileNamingStandards.NamingStandard, sampleTitle: str = None, outputFile: str = None, base64Format:str = None, includeComposition:bool = False):
+    '''
+    :param includeComposition: add base composition by position and GC content plots next to the quality plots
+    '''
     import matplotlib.pyplot as plt
     if base64Format:
         import base64
@@ -188,44 +288,62 @@ def generateFastqPlotSingle(forwardFastq: fileNamingStandards.NamingStandard, sa
     else:
         sampleTitle = str(sampleTitle)
     forwardQualityMatrix, reverseQualityMatrix, forwardExpectedErrorLine, reverseExpectedErrorLine = getDataForFastqPlots(forwardFastq)
+    columns = 1
+    figureSize = None
+    if includeComposition:
+        columns = 2
+        forwardComposition, reverseComposition, forwardGCHistogram, reverseGCHistogram = getCompositionDataForFastqPlots(forwardFastq)
+        figureSize = (12, 8)
+    figure = plt.figure(figsize=figureSize)
     plt.suptitle(sampleTitle, horizontalalignment="center", fontsize = 18, fontweight = "bold")
 
     # make plots for reads
-    plt.subplot(211)
+    plt.subplot(2, columns, 1)
     plt.imshow(forwardQualityMatrix, origin='lower', aspect='auto')
     plt.xlabel("Position")
     plt.ylabel("Quality (Phred)")
     plt.title(" ", fontsize = 16) #making a whitespace buffer
-    plt.subplot(212)
+    if includeComposition:
+        plt.subplot(2, columns, 2)
+        plotBaseComposition(forwardComposition, "Position")
+        plt.title(" ", fontsize = 16) #making a whitespace buffer
+    plt.subplot(2, columns, columns + 1)
     plt.plot(forwardExpectedErrorLine, 'k-')
     plt.xlabel("Position")
     plt.ylabel("Average Expected Error")
+    if includeComposition:
+        plt.subplot(2, columns, 4)
+        plotGCHistogram(forwardGCHistogram, "Read")
 
     plt.tight_layout()
-    if outputFile:
-        plt.savefig(outputFile)
-        if base64Format:
-            imageFile = open(outputFile)
-            encodedFile = base64.b64encode(imageFile.read())
-            imageFile.close()
+    try:
+        if outputFile:
+            plt.savefig(outputFile)
+            if base64Format:
+                imageFile = open(outputFile)
+                encodedFile = base64.b64encode(imageFile.read())
+                imageFile.close()
+                return encodedFile
+        elif base64Format:
+            import io
+            byteStream = io.BytesIO()
+            plt.savefig(byteStream, format=base64Format)
+            byteStream.seek(0)
+            encodedFile = base64.b64encode(byteStream.read())
             return encodedFile
-    elif base64Format:
-        import io
-        byteStream = io.BytesIO()
-        plt.savefig(byteStream, format=base64Format)
-        byteStream.seek(0)
-        encodedFile = base64.b64encode(byteStream.read())
-        return encodedFile
-    else:
-        plt.show()
+        else:
+            plt.show()
+    finally:
+        plt.close(figure)  #plot agents live for many samples, and pyplot keeps every open figure until it is closed
 
 
 class ParallelPlotAgent(object):
 
-    def __init__(self, outputDirectory:str = None, base64Output:bool = False, outputFormat:str = None):
+    def __init__(self, outputDirectory:str = None, base64Output:bool = False, outputFormat:str = None, includeComposition:bool = False):
         self.outputDirectory = outputDirectory
         self.outputFormat = outputFormat
         self.base64Output = base64Output
+        self.includeComposition = includeComposition
         if outputDirectory or base64Output:
             if not outputFormat:
                 raise ValueError("If output to file (directory) or base64 is set, an output format must be provided, but none was.")
@@ -247,13 +365,16 @@ class ParallelPlotAgent(object):
         else:
             base64Format = None
         if type(fastq) == tuple:
-            base64EncodedPlot = generateFastqPlotPaired(fastq[0], fastq[1], outputFile=outputFileName, base64Format=base64Format)
+            base64EncodedPlot = generateFastqPlotPaired(fastq[0], fastq[1], outputFile=outputFileName, base64Format=base64Format, includeComposition=self.includeComposition)
         else:
-            base64EncodedPlot = generateFastqPlotSingle(fastq, outputFile=outputFileName, base64Format=base64Format)
+            base64EncodedPlot = generateFastqPlotSingle(fastq, outputFile=outputFileName, base64Format=base64Format, includeComposition=self.includeComposition)
         return returnFastq, outputFileName, base64EncodedPlot #returnValue will be None unless a base64 encoded image was returned
 
 
-def plotFastqFilesInFolder(directory:str, namingStandard:fileNamingStandards.NamingStandard, outputDirectory:str = None, base64Output:bool = False, outputFormat:str = None):
+def plotFastqFilesInFolder(directory:str, namingStandard:fileNamingStandards.NamingStandard, outputDirectory:str = None, base64Output:bool = False, outputFormat:str = None, includeComposition:bool = False):
+    '''
+    :param includeComposition: add base composition by position and GC content plots next to the quality plots
+    '''
     import os
     from . import fastqHandler
     from ... import easyMultiprocessing
@@ -273,7 +394,7 @@ def plotFastqFilesInFolder(directory:str, namingStandard:fileNamingStandards.Nam
                 fastqSetList.append(fastq)
         else:
             fastqSetList.append(fastqTable[key])
-    parallelPlotAgent = ParallelPlotAgent(outputDirectory=outputDirectory, base64Output=base64Output, outputFormat=outputFormat)
+    parallelPlotAgent = ParallelPlotAgent(outputDirectory=outputDirectory, base64Output=base64Output, outputFormat=outputFormat, includeComposition=includeComposition)
     if outputDirectory or base64Output:
         plotReturnValues = easyMultiprocessing.parallelProcessRunner(parallelPlotAgent.parallelPlotter, fastqSetList)
     else:
@@ -0,0 +1,273 @@
+'''
+Compact in-memory storage for large numbers of fastq records. A FastqBatch keeps all of its sequences 2-bit packed (four
+bases per byte) with a separate bit mask marking anything that is not A, C, G or T (stored as N), all quality strings in
+one uint8 buffer, and all headers in one bytes blob, with offset arrays into each. That comes to a little over 1.3 bytes
+per base plus the headers, against several Python objects per read for FastqLineSet.
+Length, base count and GC queries run over the whole batch at once with numpy. Records are only turned back into
+strings when a FastqBatchRecord view is asked for them.
+'''
+import logging
+logger = logging.getLogger(__name__)
+
+baseCodes = "ACGTN"
+nCode = 4
+decodeChunkBases = 16 * 1024 * 1024
+
+
+def baseCodeTable():
+    import numpy
+    table = numpy.full(256, nCode, dtype="uint8")
+    for code, base in enumerate("ACGT"):
+        table[ord(base)] = code
+        table[ord(base.lower())] = code
+    return table
+
+
+def packBaseCodes(codes):
+    '''
+    :param codes: uint8 numpy array of base codes (0-3 for A, C, G and T, 4 for N)
+    :return: tuple of (packed 2-bit bases, packed N bit mask)
+    '''
+    import numpy
+    nMask = numpy.packbits(codes == nCode)
+    twoBitCodes = codes & 3
+    padding = (-len(twoBitCodes)) % 4
+    if padding:
+        twoBitCodes = numpy.concatenate((twoBitCodes, numpy.zeros(padding, dtype="uint8")))
+    groups = twoBitCodes.reshape(-1, 4)
+    packed = (groups[:, 0] << 6) | (groups[:, 1] << 4) | (groups[:, 2] << 2) | groups[:, 3]
+    return packed.astype("uint8"), nMask
+
+
+def unpackBaseCodes(packedBases, nMask, start:int, end:int):
+    '''
+    :return: uint8 numpy array of base codes for bases start through end - 1
+    '''
+    import numpy
+    if end <= start:
+        return numpy.zeros(0, dtype="uint8")
+    packedSlice = packedBases[start // 4:(end + 3) // 4]
+    codes = numpy.empty((len(packedSlice), 4), dtype="uint8")
+    for position, shift in enumerate((6, 4, 2, 0)):
+        codes[:, position] = (packedSlice >> shift) & 3
+    codes = codes.reshape(-1)[start % 4:start % 4 + end - start]
+    maskSlice = numpy.unpackbits(nMask[start // 8:(end + 7) // 8])[start % 8:start % 8 + end - start]
+    codes[maskSlice.astype(bool)] = nCode
+    return codes
+
+
+class FastqBatchRecord(object):
+    '''
+    Lightweight view of one record in a FastqBatch. Nothing is decoded until it is asked for.
+    '''
+
+    __slots__ = ["batch", "index"]
+
+    def __init__(self, batch, index:int):
+        self.batch = batch
+        self.index = index
+
+    @property
+    def header(self):
+        return self.batch.header(self.index)
+
+    @property
+    def sequence(self):
+        return self.batch.sequence(self.index)
+
+    @property
+    def quality(self):
+        return self.batch.quality(self.index)
+
+    @property
+    def raw(self):
+        return b"%s\n%s\n+\n%s\n" %(self.header, self.sequence, self.quality)
+
+    def toFastqLineSet(self, depth:int=0, analyzeMetadata:bool=False, analyzeSequence:bool=False, analyzeSequenceInDepth:bool=False, analyzeQuality:bool=False, qualityBase:int=33, diagnostics=None):
+        from .fastqHandler import FastqLineSet
+        return FastqLineSet(self.header.decode(), self.sequence.decode(), "+", self.quality.decode(), depth, analyzeMetadata, analyzeSequence, analyzeSequenceInDepth, analyzeQuality, qualityBase, diagnostics)
+
+    def __len__(self):
+        return int(self.batch.lengths[self.index])
+
+    def __str__(self):
+        return self.raw.decode().strip()
+
+
+class FastqBatch(object):
+    '''
+    Column-oriented store for many fastq records. Build one with batchFromLines, batchFromFile or concatenateBatches.
+    Spacer lines are not kept, since they carry nothing once the file has been validated.
+    '''
+
+    def __init__(self, headerBlob:bytes, headerOffsets, packedBases, nMask, qualities, baseOffsets):
+        self.headerBlob = headerBlob
+        self.headerOffsets = headerOffsets
+        self.packedBases = packedBases
+        self.nMask = nMask
+        self.qualities = qualities
+        self.baseOffsets = baseOffsets
+
+    @property
+    def lengths(self):
+        import numpy
+        return numpy.diff(self.baseOffsets)
+
+    @property
+    def totalBases(self):
+        return int(self.baseOffsets[-1])
+
+    @property
+    def nbytes(self):
+        return len(self.headerBlob) + self.headerOffsets.nbytes + self.packedBases.nbytes + self.nMask.nbytes + self.qualities.nbytes + self.baseOffsets.nbytes
+
+    def header(self, index:int):
+        return self.headerBlob[self.headerOffsets[index]:self.headerOffsets[index + 1]]
+
+    def baseCodes(self, index:int):
+        return unpackBaseCodes(self.packedBases, self.nMask, int(self.baseOffsets[index]), int(self.baseOffsets[index + 1]))
+
+    def sequence(self, index:int):
+        import numpy
+        baseLetters = numpy.frombuffer(baseCodes.encode(), dtype="uint8")
+        return baseLetters[self.baseCodes(index)].tobytes()
+
+    def quality(self, index:int):
+        return self.qualities[self.baseOffsets[index]:self.baseOffsets[index + 1]].tobytes()
+
+    def phredScores(self, index:int, base:int=33):
+        return self.qualities[self.baseOffsets[index]:self.baseOffsets[index + 1]].astype("int16") - base
+
+    def iterReadChunks(self, chunkBases:int=decodeChunkBases):
+        '''
+        Yields (first read, last read + 1, base codes) for runs of whole reads covering about chunkBases bases, so that
+        whole-batch queries never need every base unpacked at once.
+        '''
+        import numpy
+        readCount = len(self)
+        firstRead = 0
+        while firstRead < readCount:
+            lastRead = int(numpy.searchsorted(self.baseOffsets, self.baseOffsets[firstRead] + chunkBases, side="right")) - 1
+            lastRead = min(max(lastRead, firstRead + 1), readCount)
+            yield firstRead, lastRead, unpackBaseCodes(self.packedBases, self.nMask, int(self.baseOffsets[firstRead]), int(self.baseOffsets[lastRead]))
+            firstRead = lastRead
+
+    def baseCounts(self):
+        '''
+        :return: numpy array with one row per read and columns counting A, C, G, T and N
+        '''
+        import numpy
+        counts = numpy.zeros((len(self), len(baseCodes)), dtype="int64")
+        lengths = self.lengths
+        for firstRead, lastRead, codes in self.iterReadChunks():
+            readIndices = numpy.repeat(numpy.arange(lastRead - firstRead), lengths[firstRead:lastRead])
+            chunkCounts = numpy.bincount(readIndices * len(baseCodes) + codes, minlength=(lastRead - firstRead) * len(baseCodes))
+            counts[firstRead:lastRead] = chunkCounts.reshape(-1, len(baseCodes))
+        return counts
+
+    def gcContent(self):
+        '''
+        Fraction of called bases (N excluded) that are G or C in each read, the same way SequenceLine calculates it.
+        '''
+        import numpy
+        counts = self.baseCounts()
+        calledBases = counts[:, :4].sum(axis=1)
+        gcBases = counts[:, 1] + counts[:, 2]
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return numpy.where(calledBases > 0, gcBases / numpy.maximum(calledBases, 1), 0.0)
+
+    def take(self, indices):
+        '''
+        :return: new FastqBatch holding only the reads at the given indices, in the order given
+        '''
+        lines = []
+        for index in indices:
+            lines.extend((self.header(index), self.sequence(index), b"+", self.quality(index)))
+        return batchFromLines(lines)
+
+    def sample(self, sampleSize:int, seed:int=None):
+        import random
+        sampleSize = min(sampleSize, len(self))
+        return self.take(sorted(random.Random(seed).sample(range(len(self)), sampleSize)))
+
+    def __len__(self):
+        return len(self.headerOffsets) - 1
+
+    def __getitem__(self, index:int):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Read %s is out of range for a batch of %s reads" %(index, len(self)))
+        return FastqBatchRecord(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield FastqBatchRecord(self, index)
+
+    def __str__(self):
+        return "Fastq batch of %s reads (%s bases in %s bytes)" %(len(self), self.totalBases, self.nbytes)
+
+
+def offsetsFromLengths(lengths):
+    import numpy
+    offsets = numpy.zeros(len(lengths) + 1, dtype="int64")
+    numpy.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def batchFromLines(lines:list):
+    '''
+    Builds a FastqBatch from raw fastq lines (four per record) as produced by FastqBlockReader.iterLineBatches.
+    '''
+    import numpy
+    from .fastqHandler import FastqValidationError
+    headers = [header[1:] if header.startswith(b"@") else header for header in lines[0::4]]
+    sequences = lines[1::4]
+    qualities = lines[3::4]
+    sequenceLengths = numpy.fromiter(map(len, sequences), dtype="int64", count=len(sequences))
+    qualityLengths = numpy.fromiter(map(len, qualities), dtype="int64", count=len(qualities))
+    if not numpy.array_equal(sequenceLengths, qualityLengths):
+        mismatch = int(numpy.flatnonzero(sequenceLengths != qualityLengths)[0])
+        raise FastqValidationError("Got mismatched sequence and quality line lengths for line %s" %lines[mismatch * 4])
+    codes = baseCodeTable()[numpy.frombuffer(b"".join(sequences), dtype="uint8")]
+    packedBases, nMask = packBaseCodes(codes)
+    qualityBuffer = numpy.frombuffer(b"".join(qualities), dtype="uint8").copy()
+    headerOffsets = offsetsFromLengths(numpy.fromiter(map(len, headers), dtype="int64", count=len(headers)))
+    return FastqBatch(b"".join(headers), headerOffsets, packedBases, nMask, qualityBuffer, offsetsFromLengths(sequenceLengths))
+
+
+def concatenateBatches(batches:list):
+    '''
+    Joins batches into one. Packed bases are unpacked and packed again since batch boundaries rarely fall on a byte.
+    '''
+    import numpy
+    batches = [batch for batch in batches if len(batch)]
+    if not batches:
+        return batchFromLines([])
+    if len(batches) == 1:
+        return batches[0]
+    codes = numpy.concatenate([unpackBaseCodes(batch.packedBases, batch.nMask, 0, batch.totalBases) for batch in batches])
+    packedBases, nMask = packBaseCodes(codes)
+    headerOffsets = offsetsFromLengths(numpy.concatenate([numpy.diff(batch.headerOffsets) for batch in batches]))
+    baseOffsets = offsetsFromLengths(numpy.concatenate([batch.lengths for batch in batches]))
+    qualities = numpy.concatenate([batch.qualities for batch in batches])
+    return FastqBatch(b"".join(batch.headerBlob for batch in batches), headerOffsets, packedBases, nMask, qualities, baseOffsets)
+
+
+def batchFromFile(path:str, maxReads:int=None):
+    '''
+    Loads a whole fastq file (or its first maxReads reads) into a FastqBatch.
+    '''
+    from . import fastqBlockReader
+    batches = []
+    readCount = 0
+    reader = fastqBlockReader.FastqBlockReader(path)
+    for lines in reader.iterLineBatches():
+        if maxReads is not None and readCount + len(lines) // 4 > maxReads:
+            lines = lines[:(maxReads - readCount) * 4]
+        batches.append(batchFromLines(lines))
+        readCount += len(lines) // 4
+        if maxReads is not None and readCount >= maxReads:
+            break
+    reader.close()
+    return concatenateBatches(batches)
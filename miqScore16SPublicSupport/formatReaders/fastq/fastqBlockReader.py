@@ -0,0 +1,354 @@
+import os
+import logging
+logger = logging.getLogger(__name__)
+
+defaultBlockSize = 8 * 1024 * 1024  #8MB reads keep the decompressor busy without holding much of the file in memory
+
+
+def findRecordStart(data:bytes, position:int=0):
+    '''
+    Finds the first fastq record that starts at or after position in a chunk of data taken from an arbitrary offset in a
+    file. A line is taken as a record start if it begins with @ and the line two below it begins with +. Quality lines
+    may begin with @, but the line two below a quality line is a sequence, so it can never be mistaken for a header.
+    :param data: bytes read from somewhere in a fastq file
+    :param position: offset in data to start searching from (treated as a line start only if it is 0 or follows a line break)
+    :return: offset of the record start within data, or -1 if none could be confirmed in the data given
+    '''
+    if position == 0 or data[position - 1:position] == b"\n":
+        lineStart = position
+    else:
+        lineStart = data.find(b"\n", position) + 1
+        if lineStart == 0:
+            return -1
+    while lineStart < len(data):
+        nextLineStart = data.find(b"\n", lineStart) + 1
+        if nextLineStart == 0:
+            return -1
+        if data.startswith(b"@", lineStart):
+            spacerStart = data.find(b"\n", nextLineStart) + 1
+            if spacerStart == 0 or spacerStart >= len(data):
+                return -1
+            if data.startswith(b"+", spacerStart):
+                return lineStart
+        lineStart = nextLineStart
+    return -1
+
+
+class FastqRecordView(object):
+
+    __slots__ = ["header", "sequence", "spacer", "quality"]
+
+    def __init__(self, header:bytes, sequence:bytes, spacer:bytes, quality:bytes):
+        self.header = header
+        self.sequence = sequence
+        self.spacer = spacer
+        self.quality = quality
+
+    def toFastqLineSet(self, depth:int=0, analyzeMetadata:bool=False, analyzeSequence:bool=False, analyzeSequenceInDepth:bool=False, analyzeQuality:bool=False, qualityBase:int=33, diagnostics=None):
+        from .fastqHandler import FastqLineSet
+        return FastqLineSet(self.header.decode(), self.sequence.decode(), self.spacer.decode(), self.quality.decode(), depth, analyzeMetadata, analyzeSequence, analyzeSequenceInDepth, analyzeQuality, qualityBase, diagnostics)
+
+    @property
+    def raw(self):
+        return b"%s\n%s\n%s\n%s\n" %(self.header, self.sequence, self.spacer, self.quality)
+
+    def __len__(self):
+        return len(self.sequence)
+
+    def __str__(self):
+        return self.raw.decode().strip()
+
+
+class ObservedFile(object):
+    '''
+    Thin wrapper around a binary file handle that passes every chunk read from disk to a list of observer callables.
+    This lets things like checksums see the on-disk (possibly compressed) bytes during the same pass that decompresses
+    and parses them.
+    '''
+
+    def __init__(self, filehandle, observers:list):
+        self.filehandle = filehandle
+        self.observers = observers
+
+    def read(self, size:int=-1):
+        data = self.filehandle.read(size)
+        for observer in self.observers:
+            observer(data)
+        return data
+
+    def seek(self, offset:int, whence:int=0):
+        return self.filehandle.seek(offset, whence)
+
+    def close(self):
+        self.filehandle.close()
+
+    @property
+    def closed(self):
+        return self.filehandle.closed
+
+
+class GzipMemberStream(object):
+    '''
+    Decompresses a gzip file (including multi-member files such as BGZF) with zlib directly instead of through GzipFile,
+    so that the compressed offset of every gzip member start is known. Member starts since the last read are collected in
+    memberStarts as (compressed offset, uncompressed offset) pairs for anything that wants to index the file.
+    Reads return whatever a chunk of compressed input expands to, which may be somewhat more than the size requested.
+    '''
+
+    def __init__(self, filehandle, compressedOffset:int=0, uncompressedOffset:int=0, readSize:int=1024 * 1024):
+        self.filehandle = filehandle
+        self.compressedOffset = compressedOffset
+        self.uncompressedOffset = uncompressedOffset
+        self.readSize = readSize
+        self.decompressor = None
+        self.unusedData = b""
+        self.memberStarts = []
+
+    def read(self, size:int=-1):
+        import zlib
+        blocks = []
+        produced = 0
+        while size < 0 or produced < size:
+            if self.unusedData:
+                data = self.unusedData
+                self.unusedData = b""
+            else:
+                data = self.filehandle.read(self.readSize)
+                if not data:
+                    if self.decompressor is not None:
+                        raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+                    break
+                self.compressedOffset += len(data)
+            if self.decompressor is None:
+                if not data.strip(b"\x00"):  #zero padding after the last member is allowed, same as in the gzip module
+                    continue
+                self.decompressor = zlib.decompressobj(31)
+                self.memberStarts.append((self.compressedOffset - len(data), self.uncompressedOffset))
+            try:
+                block = self.decompressor.decompress(data)
+            except zlib.error as error:
+                raise OSError("Unable to decompress gzip data in %s: %s" %(getattr(self.filehandle, "name", "file"), error))
+            if self.decompressor.eof:
+                self.unusedData = self.decompressor.unused_data
+                self.decompressor = None
+            if block:
+                blocks.append(block)
+                produced += len(block)
+                self.uncompressedOffset += len(block)
+        return b"".join(blocks)
+
+    def popMemberStarts(self):
+        memberStarts = self.memberStarts
+        self.memberStarts = []
+        return memberStarts
+
+    def tell(self):
+        return self.uncompressedOffset
+
+    def close(self):
+        self.filehandle.close()
+
+    @property
+    def closed(self):
+        return self.filehandle.closed
+
+
+class FastqBlockReader(object):
+    '''
+    Reads a fastq file as large binary blocks and splits each block into records in a single bytes.split call instead of
+    calling readline four times per record. Records come back as FastqRecordView objects holding undecoded byte slices, so callers that
+    only need counts or lengths never pay for decoding or building FastqLineSet objects.
+    Compressed files are decompressed with the fastest backend compressionCodecs can find, and the name of the backend
+    used is kept in decompressionBackend. Uncompressed files can also be read over a (start, end) byteRange, which should begin on a record boundary (see
+    findRecordStart) so that chunks of one file can be handled independently.
+    '''
+
+    def __init__(self, path:str, blockSize:int=defaultBlockSize, rawObservers:list=None, byteRange:tuple=None, buildIndex:bool=None, checkpointSpacing:int=None, startCheckpoint=None):
+        from .. import compressionCodecs
+        self.path = path
+        if not os.path.isfile(path):
+            logger.critical("Unable to find fastq file at %s" %path)
+            raise FileNotFoundError("Unable to find fastq file at %s" %path)
+        self.blockSize = int(blockSize)
+        if self.blockSize < 1:
+            raise ValueError("Block size must be a positive integer. %s was given." %blockSize)
+        self.codec = compressionCodecs.sniffCodec(path)
+        self.gzipped = compressionCodecs.isGzipCodec(self.codec)
+        self.compressed = not self.codec == compressionCodecs.plain
+        if byteRange and self.compressed:
+            raise ValueError("Byte ranges can only be read from uncompressed fastq files. %s is %s compressed." %(path, self.codec))
+        if startCheckpoint and not self.gzipped:
+            raise ValueError("Checkpoints can only be used with gzipped fastq files. %s is not gzipped." %path)
+        self.indexBuilder = None
+        self.index = None
+        self.skipBytes = 0
+        if self.gzipped and not startCheckpoint:
+            from . import fastqGzipIndex
+            if buildIndex is None:
+                buildIndex = fastqGzipIndex.buildIndexesDuringFullPass and fastqGzipIndex.loadIndex(path) is None
+            if buildIndex:
+                if checkpointSpacing is None:
+                    checkpointSpacing = fastqGzipIndex.defaultCheckpointSpacing
+                self.indexBuilder = fastqGzipIndex.GzipIndexBuilder(path, checkpointSpacing)
+        needsGzipMembers = startCheckpoint or self.indexBuilder  #these have to follow gzip members as stored, so no external decompressors
+        externalDecompressor = None
+        if self.compressed and not needsGzipMembers and compressionCodecs.preferExternalDecompressors:
+            externalDecompressor = compressionCodecs.findExternalDecompressor(self.codec)
+        if externalDecompressor:
+            backendName, command = externalDecompressor
+            self.filehandle = compressionCodecs.ExternalDecompressorStream(path, command, backendName, rawObservers)  #raw observers are fed the file as it goes to the program
+            self.decompressionBackend = backendName
+            self.rawFilehandle = self.filehandle
+        else:
+            self.rawFilehandle = open(path, "rb")
+            if rawObservers:
+                self.rawFilehandle = ObservedFile(self.rawFilehandle, rawObservers)
+            if startCheckpoint:
+                self.rawFilehandle.seek(startCheckpoint.compressedOffset)
+                self.filehandle = GzipMemberStream(self.rawFilehandle, startCheckpoint.compressedOffset, startCheckpoint.uncompressedOffset)
+                self.skipBytes = startCheckpoint.recordOffset - startCheckpoint.uncompressedOffset
+                self.decompressionBackend = "zlib"
+            elif self.compressed:
+                self.filehandle, self.decompressionBackend = compressionCodecs.openStandardLibraryStream(self.rawFilehandle, self.codec)
+            else:
+                self.filehandle = self.rawFilehandle
+                self.decompressionBackend = "none"
+        self.byteRange = byteRange
+        if byteRange:
+            self.filehandle.seek(byteRange[0])
+        self.open = True
+        self.reachedEnd = False
+        self.truncated = False
+        self.recordsRead = 0
+
+    def readBlocks(self):
+        if not self.open:
+            logger.critical("Attempting to read from a closed fastq file at %s" %self.path)
+            raise ValueError("I/O operation on a closed file")
+        if self.byteRange:
+            remaining = self.byteRange[1] - self.byteRange[0]
+        else:
+            remaining = None
+        while True:
+            if remaining is None:
+                block = self.filehandle.read(self.blockSize)
+            else:
+                block = self.filehandle.read(min(self.blockSize, remaining))
+                remaining -= len(block)
+            if self.skipBytes and block:
+                skipped = min(self.skipBytes, len(block))
+                block = block[skipped:]
+                self.skipBytes -= skipped
+                if not block:
+                    continue
+            if not block:
+                break
+            if self.indexBuilder:
+                self.indexBuilder.addBlock(block, self.filehandle.popMemberStarts())
+            yield block
+        self.reachedEnd = True
+
+    def splitLines(self, block:bytes):
+        lines = block.split(b"\n")
+        lineCount = ((len(lines) - 1) // 4) * 4  #the last element is whatever followed the final line break
+        leftover = b"\n".join(lines[lineCount:])
+        del lines[lineCount:]
+        return lines, leftover
+
+    def finalPartialRecord(self, leftover:bytes):
+        lines = [line for line in leftover.split(b"\n") if line.strip()]
+        if not lines:
+            return None
+        logger.error("Fastq file at %s appears to me missing lines (found something not a multiple of 4." %self.path)
+        self.truncated = True
+        while len(lines) < 4:
+            lines.append(b"")
+        return lines[:4]
+
+    def iterLineBatches(self):
+        '''
+        Yields lists of raw lines with a length that is always a multiple of four, so that lines[1::4] are all of the
+        sequences in the batch and lines[3::4] all of the quality strings.
+        '''
+        leftover = b""
+        for block in self.readBlocks():
+            if leftover:
+                block = leftover + block
+            if b"\r" in block:
+                block = block.replace(b"\r\n", b"\n")
+            lines, leftover = self.splitLines(block)
+            if lines:
+                self.recordsRead += len(lines) // 4
+                yield lines
+        if leftover and not leftover.endswith(b"\n"):
+            lines, leftover = self.splitLines(leftover + b"\n")
+            if lines:
+                self.recordsRead += len(lines) // 4
+                yield lines
+        partialRecord = self.finalPartialRecord(leftover)
+        if partialRecord:
+            self.recordsRead += 1
+        self.finishIndex()
+        if partialRecord:
+            yield partialRecord
+        self.close()
+
+    def iterBatches(self):
+        for lines in self.iterLineBatches():
+            yield list(map(FastqRecordView, lines[0::4], lines[1::4], lines[2::4], lines[3::4]))
+
+    def countRecords(self, maxRecords:int=0):
+        '''
+        Counts records by counting line breaks in each block. Trailing blank lines are ignored, and a trailing partial
+        record is counted (and logged) the same way getNextRead would return it.
+        :param maxRecords: stop reading as soon as the file is known to hold more than this many records (0 for no limit)
+        :return: number of records in the file, or a number above maxRecords (not the total) if the limit was passed
+        '''
+        tailLength = 65536
+        newlineCount = 0
+        tail = b""
+        for block in self.readBlocks():
+            newlineCount += block.count(b"\n")
+            if maxRecords and newlineCount > (maxRecords + 1) * 4:
+                self.close()
+                self.recordsRead = newlineCount // 4
+                return self.recordsRead
+            if len(block) >= tailLength:
+                tail = block
+            else:
+                tail = (tail + block)[-tailLength:]
+        self.close()
+        if not tail.strip():
+            self.finishIndex()
+            return 0
+        contentEnd = len(tail.rstrip(b"\r\n"))
+        lineCount = newlineCount - tail.count(b"\n", contentEnd) + 1
+        recordCount, remainingLines = divmod(lineCount, 4)
+        if remainingLines:
+            logger.error("Fastq file at %s appears to me missing lines (found something not a multiple of 4." %self.path)
+            self.truncated = True
+            recordCount += 1
+        self.recordsRead = recordCount
+        self.finishIndex()
+        return recordCount
+
+    def finishIndex(self):
+        if self.indexBuilder and self.reachedEnd:
+            self.index = self.indexBuilder.finish(self.recordsRead)
+            self.index.save()
+            self.indexBuilder = None
+
+    def close(self):
+        if not self.filehandle.closed:
+            self.filehandle.close()
+        if not self.rawFilehandle.closed:
+            self.rawFilehandle.close()
+        self.open = False
+
+    def __iter__(self):
+        for batch in self.iterBatches():
+            for record in batch:
+                yield record
+
+    def __str__(self):
+        return "Fastq block reader object at %s" %self.path
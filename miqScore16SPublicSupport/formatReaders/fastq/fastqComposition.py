@@ -0,0 +1,181 @@
+'''
+Streaming base composition statistics for screening a run. PositionBaseComposition counts A, C, G, T and N at each read
+position, which shows primer and adapter sequence (positions dominated by one base) and low-diversity libraries at a
+glance. GCContentHistogram bins reads by their GC fraction. Both take batches of raw sequence lines or packed
+FastqBatch objects and are counted with numpy, never one base at a time.
+'''
+import logging
+logger = logging.getLogger(__name__)
+from . import fastqBatch
+
+baseCodes = fastqBatch.baseCodes
+defaultGCBins = 100
+
+
+def sequenceCodes(sequences:list):
+    '''
+    :param sequences: list of raw sequence lines (bytes or str)
+    :return: tuple of (uint8 numpy array of base codes for all sequences end to end, int64 array of sequence lengths)
+    '''
+    import numpy
+    sequences = [sequence.encode() if type(sequence) == str else sequence for sequence in sequences]
+    lengths = numpy.fromiter(map(len, sequences), dtype="int64", count=len(sequences))
+    codes = fastqBatch.baseCodeTable()[numpy.frombuffer(b"".join(sequences), dtype="uint8")]
+    return codes, lengths
+
+
+def readBaseCounts(codes, lengths):
+    '''
+    :return: int64 numpy array with one row per read and columns counting A, C, G, T and N
+    '''
+    import numpy
+    readIndices = numpy.repeat(numpy.arange(len(lengths)), lengths)
+    return numpy.bincount(readIndices * len(baseCodes) + codes, minlength=len(lengths) * len(baseCodes)).reshape(-1, len(baseCodes))
+
+
+class PositionBaseComposition(object):
+    '''
+    Count of each base (A, C, G, T and N, in that row order) at each read position. The position dimension grows as
+    longer reads show up, so memory stays at five counters per position no matter how many reads go through it.
+    '''
+
+    def __init__(self, initialLength:int=0):
+        import numpy
+        self.counts = numpy.zeros((len(baseCodes), initialLength), dtype="int64")
+        self.readCount = 0
+
+    @property
+    def length(self):
+        return self.counts.shape[1]
+
+    def growTo(self, length:int):
+        import numpy
+        if length > self.length:
+            self.counts = numpy.hstack((self.counts, numpy.zeros((len(baseCodes), length - self.length), dtype="int64")))
+
+    def addCodes(self, codes, lengths):
+        import numpy
+        if not len(lengths):
+            return
+        self.growTo(int(lengths.max()))
+        positions = numpy.arange(len(codes)) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+        flatIndex = codes.astype("int64") * self.length + positions
+        self.counts += numpy.bincount(flatIndex, minlength=len(baseCodes) * self.length).reshape(len(baseCodes), self.length)
+        self.readCount += len(lengths)
+
+    def addBatch(self, sequences:list):
+        if not sequences:
+            return
+        self.addCodes(*sequenceCodes(sequences))
+
+    def addFastqBatch(self, batch:fastqBatch.FastqBatch):
+        lengths = batch.lengths
+        for firstRead, lastRead, codes in batch.iterReadChunks():
+            self.addCodes(codes, lengths[firstRead:lastRead])
+
+    def merge(self, other):
+        self.growTo(other.length)
+        self.counts[:, :other.length] += other.counts
+        self.readCount += other.readCount
+        return self
+
+    def readsCovering(self):
+        return self.counts.sum(axis=0)
+
+    def fractions(self):
+        '''
+        :return: float64 array with rows for A, C, G, T and N giving the fraction of reads with that base at each position
+        '''
+        import numpy
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return self.counts / self.readsCovering()
+
+    def gcFractions(self):
+        '''
+        GC fraction of called bases (N excluded) at each position.
+        '''
+        import numpy
+        calledBases = self.counts[:4].sum(axis=0)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return (self.counts[1] + self.counts[2]) / calledBases
+
+    def dominantBaseFractions(self):
+        '''
+        Fraction of reads carrying the most common called base at each position. Values near one mean every read has the
+        same base there, as in a primer or a low-diversity library.
+        '''
+        import numpy
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return self.counts[:4].max(axis=0) / self.readsCovering()
+
+    def lowDiversityPositions(self, threshold:float=0.9):
+        '''
+        :return: numpy array of positions where the most common base is in at least threshold of the reads
+        '''
+        import numpy
+        return numpy.flatnonzero(self.dominantBaseFractions() >= threshold)
+
+    def __str__(self):
+        return "Position base composition for %s reads over %s positions" %(self.readCount, self.length)
+
+
+class GCContentHistogram(object):
+    '''
+    Reads binned by the fraction of their called bases (N excluded) that are G or C, calculated the same way as
+    SequenceLine.gcContent. A read with no called bases counts as 0, as it does there.
+    '''
+
+    def __init__(self, binCount:int=defaultGCBins):
+        import numpy
+        self.binCount = binCount
+        self.counts = numpy.zeros(binCount, dtype="int64")
+        self.gcTotal = 0.0
+
+    @property
+    def readCount(self):
+        return int(self.counts.sum())
+
+    def binEdges(self):
+        import numpy
+        return numpy.linspace(0, 1, self.binCount + 1)
+
+    def addBaseCounts(self, baseCounts):
+        '''
+        :param baseCounts: array with one row per read and columns counting A, C, G, T and N
+        '''
+        import numpy
+        if not len(baseCounts):
+            return
+        calledBases = baseCounts[:, :4].sum(axis=1)
+        gcContent = (baseCounts[:, 1] + baseCounts[:, 2]) / numpy.maximum(calledBases, 1)
+        bins = numpy.minimum((gcContent * self.binCount).astype("int64"), self.binCount - 1)
+        self.counts += numpy.bincount(bins, minlength=self.binCount)
+        self.gcTotal += float(gcContent.sum())
+
+    def addBatch(self, sequences:list):
+        if not sequences:
+            return
+        self.addBaseCounts(readBaseCounts(*sequenceCodes(sequences)))
+
+    def addFastqBatch(self, batch:fastqBatch.FastqBatch):
+        self.addBaseCounts(batch.baseCounts())
+
+    def merge(self, other):
+        if not self.binCount == other.binCount:
+            raise ValueError("Unable to merge GC content histograms with different bin counts: %s and %s" %(self.binCount, other.binCount))
+        self.counts += other.counts
+        self.gcTotal += other.gcTotal
+        return self
+
+    def mean(self):
+        if not self.readCount:
+            return 0.0
+        return self.gcTotal / self.readCount
+
+    def fractions(self):
+        if not self.readCount:
+            return self.counts.astype("float64")
+        return self.counts / self.readCount
+
+    def __str__(self):
+        return "GC content histogram for %s reads in %s bins (mean %.3f)" %(self.readCount, self.binCount, self.mean())
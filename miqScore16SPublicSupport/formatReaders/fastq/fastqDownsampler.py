@@ -0,0 +1,80 @@
+'''
+Pair-preserving downsampling of paired-end fastq files. The records to keep are picked up front from the known read
+count with a seeded random generator, so the same seed always keeps the same pairs. Both mates are then streamed once
+in aligned raw line batches and only the chosen records are copied out. Records that are not kept are never decoded or
+parsed.
+'''
+import os
+import logging
+logger = logging.getLogger(__name__)
+from . import fastqBlockReader
+
+
+def chooseRecordIndices(totalRecords:int, sampleSize:int, seed:int=0):
+    '''
+    :return: sorted list of sampleSize record indices picked uniformly at random from range(totalRecords)
+    '''
+    import random
+    if sampleSize >= totalRecords:
+        return list(range(totalRecords))
+    return sorted(random.Random(seed).sample(range(totalRecords), sampleSize))
+
+
+def selectedRecordLines(lines:list, batchStart:int, selectedIndices:list, selectionPosition:int):
+    '''
+    Picks out the lines of the selected records from one batch.
+    :return: tuple of (list of kept lines, position in selectedIndices to continue from with the next batch)
+    '''
+    batchEnd = batchStart + len(lines) // 4
+    keptLines = []
+    while selectionPosition < len(selectedIndices) and selectedIndices[selectionPosition] < batchEnd:
+        lineStart = (selectedIndices[selectionPosition] - batchStart) * 4
+        keptLines.extend(lines[lineStart:lineStart + 4])
+        selectionPosition += 1
+    return keptLines, selectionPosition
+
+
+def downsampleFastqPair(pe1Path:str, pe2Path:str, pe1OutputPath:str, pe2OutputPath:str, sampleSize:int, seed:int=0, readCount:int=None, compressionLevel:int=1):
+    '''
+    Writes a uniformly random, seed-reproducible subset of read pairs to new fastq files.
+    :param pe1Path: path to the paired-end 1 fastq
+    :param pe2Path: path to the paired-end 2 fastq
+    :param pe1OutputPath: where to write the kept paired-end 1 reads (gzipped if this ends with .gz)
+    :param pe2OutputPath: where to write the kept paired-end 2 reads (gzipped if this ends with .gz)
+    :param sampleSize: number of read pairs to keep
+    :param seed: seed for picking which pairs to keep
+    :param readCount: read pairs in the input if already known, counted from paired-end 1 otherwise
+    :param compressionLevel: gzip level for compressed outputs, kept low since these are intermediate files
+    :return: number of read pairs written
+    '''
+    from . import fastqThreadedReader, fastqWriter
+    from .fastqHandler import countReads, FastqValidationError
+    if readCount is None:
+        readCount = countReads(pe1Path)
+    selectedIndices = chooseRecordIndices(readCount, sampleSize, seed)
+    logger.info("Downsampling %s read pairs from %s and %s to %s using seed %s" %(readCount, pe1Path, pe2Path, len(selectedIndices), seed))
+    pairReader = fastqThreadedReader.ThreadedFastqPairReader(pe1Path, pe2Path)
+    pe1Output = fastqWriter.FastqWriter(pe1OutputPath, compressionLevel=compressionLevel)
+    pe2Output = fastqWriter.FastqWriter(pe2OutputPath, compressionLevel=compressionLevel)
+    batchStart = 0
+    selectionPosition = 0
+    for pe1Lines, pe2Lines in pairReader.iterLineBatchPairs():
+        if not len(pe1Lines) == len(pe2Lines):
+            pairReader.close()
+            pe1Output.close()
+            pe2Output.close()
+            raise FastqValidationError("Reached end of one paired-end file before the other while downsampling %s and %s" %(pe1Path, pe2Path))
+        pe1KeptLines, nextSelectionPosition = selectedRecordLines(pe1Lines, batchStart, selectedIndices, selectionPosition)
+        pe2KeptLines, nextSelectionPosition = selectedRecordLines(pe2Lines, batchStart, selectedIndices, selectionPosition)
+        pe1Output.writeLines(pe1KeptLines)
+        pe2Output.writeLines(pe2KeptLines)
+        selectionPosition = nextSelectionPosition
+        batchStart += len(pe1Lines) // 4
+        if selectionPosition >= len(selectedIndices):
+            break
+    pairReader.close()
+    pe1Output.close()
+    pe2Output.close()
+    if not selectionPosition == len(selectedIndices):
+        raise FastqValidationError("Expected %s reads in %s but only found %s while downsampling" %(readCount, pe1Path, batchStart))
+    return selectionPosition
@@ -0,0 +1,247 @@
+'''
+Sidecar checkpoint index for gzipped fastq files. The index lives next to the fastq as <path>.fqidx and holds the total
+record count plus decompression checkpoints spaced every few MB of uncompressed data. Each checkpoint records where a
+gzip member starts in the compressed file, where that lands in the uncompressed stream, and the index and offset of the
+first record that starts there or after it.
+Checkpoints can only be placed where a gzip member starts, because that is the only place the standard zlib module can
+start decompressing from with no earlier state. BGZF files and output from block-parallel compressors are made of many
+small members and get a full set of checkpoints. An ordinary single-member gzip file gets only the checkpoint at the start
+of the file, but its index still makes read counts free.
+Indexes are built with buildIndex, or as a side effect of any full pass through a gzipped file with FastqBlockReader when
+buildIndexesDuringFullPass is set. That is off by default, since input folders may be read-only or shared, and building
+an index forces the standard zlib path instead of a faster external decompressor. Indexes are keyed by the size and
+modification time of the fastq file and ignored (then rebuilt on the next full pass) when those no longer match.
+'''
+import os
+import logging
+logger = logging.getLogger(__name__)
+
+indexExtension = ".fqidx"
+indexVersion = 1
+defaultCheckpointSpacing = 16 * 1024 * 1024
+buildIndexesDuringFullPass = False
+
+
+def indexPath(path:str):
+    return path + indexExtension
+
+
+class GzipCheckpoint(object):
+
+    __slots__ = ["compressedOffset", "uncompressedOffset", "recordIndex", "recordOffset"]
+
+    def __init__(self, compressedOffset:int, uncompressedOffset:int, recordIndex:int, recordOffset:int):
+        self.compressedOffset = compressedOffset
+        self.uncompressedOffset = uncompressedOffset
+        self.recordIndex = recordIndex
+        self.recordOffset = recordOffset
+
+    def toList(self):
+        return [self.compressedOffset, self.uncompressedOffset, self.recordIndex, self.recordOffset]
+
+    def __str__(self):
+        return "Checkpoint at compressed byte %s (uncompressed %s), record %s starting at uncompressed byte %s" %(self.compressedOffset, self.uncompressedOffset, self.recordIndex, self.recordOffset)
+
+
+class FastqGzipIndex(object):
+
+    def __init__(self, path:str, fileSize:int, modificationTime:int, totalRecords:int, uncompressedSize:int, checkpoints:list, checkpointSpacing:int=defaultCheckpointSpacing):
+        self.path = path
+        self.fileSize = fileSize
+        self.modificationTime = modificationTime
+        self.totalRecords = totalRecords
+        self.uncompressedSize = uncompressedSize
+        self.checkpoints = checkpoints
+        self.checkpointSpacing = checkpointSpacing
+
+    @property
+    def indexPath(self):
+        return indexPath(self.path)
+
+    def isCurrent(self):
+        if not os.path.isfile(self.path):
+            return False
+        fileStats = os.stat(self.path)
+        return fileStats.st_size == self.fileSize and fileStats.st_mtime_ns == self.modificationTime
+
+    def checkpointForRecord(self, recordIndex:int):
+        '''
+        :return: the last checkpoint at or before the given record index
+        '''
+        import bisect
+        checkpointRecords = [checkpoint.recordIndex for checkpoint in self.checkpoints]
+        return self.checkpoints[max(bisect.bisect_right(checkpointRecords, recordIndex) - 1, 0)]
+
+    def checkpointRecordRanges(self):
+        '''
+        :return: list of (checkpoint, number of records from that checkpoint up to the next one)
+        '''
+        recordEnds = [checkpoint.recordIndex for checkpoint in self.checkpoints[1:]] + [self.totalRecords]
+        return [(checkpoint, recordEnd - checkpoint.recordIndex) for checkpoint, recordEnd in zip(self.checkpoints, recordEnds)]
+
+    def save(self):
+        import json
+        indexData = {"version": indexVersion,
+                     "fileSize": self.fileSize,
+                     "modificationTime": self.modificationTime,
+                     "totalRecords": self.totalRecords,
+                     "uncompressedSize": self.uncompressedSize,
+                     "checkpointSpacing": self.checkpointSpacing,
+                     "checkpoints": [checkpoint.toList() for checkpoint in self.checkpoints]}
+        temporaryPath = "%s.%s.tmp" %(self.indexPath, os.getpid())
+        try:
+            file = open(temporaryPath, "w")
+            json.dump(indexData, file)
+            file.close()
+            os.replace(temporaryPath, self.indexPath)
+        except OSError as error:
+            logger.debug("Unable to write gzip index for %s: %s" %(self.path, error))
+            if os.path.isfile(temporaryPath):
+                os.remove(temporaryPath)
+            return False
+        return True
+
+    def __str__(self):
+        return "Gzip index for %s: %s records, %s checkpoints" %(self.path, self.totalRecords, len(self.checkpoints))
+
+
+def loadIndex(path:str):
+    '''
+    :return: FastqGzipIndex for the file, or None if there is no index or the index is out of date
+    '''
+    import json
+    if not os.path.isfile(indexPath(path)):
+        return None
+    try:
+        file = open(indexPath(path), "r")
+        indexData = json.load(file)
+        file.close()
+        if not indexData["version"] == indexVersion:
+            return None
+        checkpoints = [GzipCheckpoint(*checkpoint) for checkpoint in indexData["checkpoints"]]
+        index = FastqGzipIndex(path, indexData["fileSize"], indexData["modificationTime"], indexData["totalRecords"], indexData["uncompressedSize"], checkpoints, indexData["checkpointSpacing"])
+    except (ValueError, KeyError, TypeError, OSError) as error:
+        logger.warning("Ignoring unreadable gzip index at %s: %s" %(indexPath(path), error))
+        return None
+    if not index.isCurrent():
+        logger.debug("Ignoring stale gzip index at %s" %indexPath(path))
+        return None
+    return index
+
+
+class GzipIndexBuilder(object):
+    '''
+    Watches the decompressed blocks of a full pass through a gzipped fastq, along with the member starts reported by the
+    decompressor, and turns member starts spaced at least checkpointSpacing apart into checkpoints. The first record at or
+    after a member start may not begin until a later block, so checkpoints wait in pending until their record offset is
+    seen.
+    '''
+
+    def __init__(self, path:str, checkpointSpacing:int=defaultCheckpointSpacing):
+        self.path = path
+        self.checkpointSpacing = checkpointSpacing
+        self.checkpoints = []
+        self.pending = []
+        self.newlineCount = 0
+        self.uncompressedOffset = 0
+        self.lastCandidateOffset = None
+        self.previousByte = b""
+
+    def addBlock(self, block:bytes, memberStarts:list):
+        blockStart = self.uncompressedOffset
+        for compressedOffset, uncompressedOffset in memberStarts:
+            if self.lastCandidateOffset is not None and uncompressedOffset - self.lastCandidateOffset < self.checkpointSpacing:
+                continue
+            position = uncompressedOffset - blockStart
+            lineIndex = self.newlineCount + block.count(b"\n", 0, position)
+            if position > 0:
+                atLineStart = block[position - 1:position] == b"\n"
+            else:
+                atLineStart = uncompressedOffset == 0 or self.previousByte == b"\n"
+            if not atLineStart:
+                lineIndex += 1
+            recordIndex = -(-lineIndex // 4)
+            self.pending.append(GzipCheckpoint(compressedOffset, uncompressedOffset, recordIndex, None))
+            self.lastCandidateOffset = uncompressedOffset
+        blockNewlines = block.count(b"\n")
+        while self.pending:
+            checkpoint = self.pending[0]
+            targetLine = checkpoint.recordIndex * 4
+            if targetLine == 0:
+                checkpoint.recordOffset = 0
+            elif targetLine <= self.newlineCount + blockNewlines:
+                position = -1
+                for line in range(targetLine - self.newlineCount):
+                    position = block.find(b"\n", position + 1)
+                checkpoint.recordOffset = blockStart + position + 1
+            else:
+                break
+            self.checkpoints.append(self.pending.pop(0))
+        self.newlineCount += blockNewlines
+        self.uncompressedOffset += len(block)
+        if block:
+            self.previousByte = block[-1:]
+
+    def finish(self, totalRecords:int):
+        fileStats = os.stat(self.path)
+        checkpoints = [checkpoint for checkpoint in self.checkpoints if checkpoint.recordIndex < totalRecords or checkpoint.recordIndex == 0]
+        return FastqGzipIndex(self.path, fileStats.st_size, fileStats.st_mtime_ns, totalRecords, self.uncompressedOffset, checkpoints, self.checkpointSpacing)
+
+
+def buildIndex(path:str, checkpointSpacing:int=defaultCheckpointSpacing):
+    '''
+    Makes a full counting pass through a gzipped fastq to build and save its index.
+    :return: FastqGzipIndex object
+    '''
+    from . import fastqBlockReader
+    reader = fastqBlockReader.FastqBlockReader(path, buildIndex=True, checkpointSpacing=checkpointSpacing)
+    reader.countRecords()
+    return reader.index
+
+
+def getIndex(path:str, build:bool=False):
+    '''
+    :param build: make a full pass to build the index if there is no current one
+    :return: FastqGzipIndex object, or None if there is no current index and build was not requested
+    '''
+    index = loadIndex(path)
+    if index is None and build:
+        index = buildIndex(path)
+    return index
+
+
+def iterLineBatchesFromCheckpoint(path:str, checkpoint:GzipCheckpoint, recordLimit:int=None, blockSize:int=None):
+    '''
+    Decompresses a gzipped fastq starting from a checkpoint, yielding line batches beginning with the checkpoint's
+    record. Several of these can run at once over disjoint checkpoint ranges of the same file.
+    '''
+    from . import fastqBlockReader
+    from .fastqParallel import recordRangeLineBatches
+    if blockSize is None:
+        blockSize = fastqBlockReader.defaultBlockSize
+    reader = fastqBlockReader.FastqBlockReader(path, blockSize=blockSize, startCheckpoint=checkpoint)
+    lineBatches = reader.iterLineBatches()
+    if recordLimit is not None:
+        lineBatches = recordRangeLineBatches(lineBatches, recordLimit)
+    for lines in lineBatches:
+        yield lines
+    reader.close()
+
+
+def iterLineBatchesFromRecord(path:str, index:FastqGzipIndex, recordIndex:int, recordLimit:int=None):
+    '''
+    Yields line batches starting at any record, decompressing only from the nearest checkpoint before it.
+    '''
+    checkpoint = index.checkpointForRecord(recordIndex)
+    skipLines = (recordIndex - checkpoint.recordIndex) * 4
+    limit = None
+    if recordLimit is not None:
+        limit = recordIndex - checkpoint.recordIndex + recordLimit
+    for lines in iterLineBatchesFromCheckpoint(path, checkpoint, limit):
+        if skipLines >= len(lines):
+            skipLines -= len(lines)
+            continue
+        if skipLines:
+            lines = lines[skipLines:]
+            skipLines = 0
+        yield lines
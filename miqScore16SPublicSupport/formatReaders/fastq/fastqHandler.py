@@ -3,14 +3,20 @@ import logging
 import typing
 logger = logging.getLogger(__name__)
 from .. import qualityScore
+from ..diagnostics import DiagnosticsCollector, collectorOrDefault
 from . import fileNamingStandards
+from . import fastqBlockReader
 
 class ReadMetadataLine(object):
 
-    def __init__(self, rawMetadata):
+    def __init__(self, rawMetadata, diagnostics:DiagnosticsCollector=None):
+        '''
+        :param diagnostics: collector that problems with individual fields are reported to
+        '''
         self.rawMetadata = rawMetadata
+        self.diagnostics = collectorOrDefault(diagnostics)
         if not rawMetadata.startswith("@"):
-            logger.warning("Got a metadata line that did not start with an @ symobol. This goes against the fastq standard and may suggest a corrupt file. Line: %s" %rawMetadata)
+            self.diagnostics.warning("missingAtSymbol", "Got a metadata line that did not start with an @ symobol. This goes against the fastq standard and may suggest a corrupt file. Line: %s", rawMetadata)
         metadataSplit = rawMetadata.strip().split(" ")
         if not len(metadataSplit) == 2:
             errorMessage = "Got a metadata line that appears to have more than two elements divided by space. %s" %rawMetadata
@@ -33,10 +39,10 @@ class ReadMetadataLine(object):
             self.direction = int(self.direction)
             if self.direction not in [1, 2]:
                 validFields = False
-                logger.error("Read direction found that was not 1 or 2. Line: %s" %rawMetadata)
+                self.diagnostics.error("invalidDirection", "Read direction found that was not 1 or 2. Line: %s", rawMetadata)
         except ValueError:
             validFields = False
-            logger.error("Read direction could not be cast to integer. Line: %s" %rawMetadata)
+            self.diagnostics.error("nonIntegerDirection", "Read direction could not be cast to integer. Line: %s", rawMetadata)
         if self.filtered.upper() == "Y":
             self.filtered = True
             self.passedFilter = False
@@ -46,15 +52,15 @@ class ReadMetadataLine(object):
         else:
             self.passedFilter = None
             validFields = False
-            logger.error("Got a value for filtered that was not Y or N. Line: %s" %rawMetadata)
+            self.diagnostics.error("invalidFilterFlag", "Got a value for filtered that was not Y or N. Line: %s", rawMetadata)
         try:
             self.controlBits = int(self.controlBits)
             if not self.controlBits % 2 == 0:
                 validFields = False
-                logger.error("Got a control bits value of %s. Control bits should be an even number. Line: %s " %(self.controlBits, rawMetadata))
+                self.diagnostics.error("oddControlBits", "Got a control bits value of %s. Control bits should be an even number. Line: %s ", self.controlBits, rawMetadata)
         except ValueError:
             validFields = False
-            logger.error("Unable to cast control bits to an integer. Line: %s " %rawMetadata)
+            self.diagnostics.error("nonIntegerControlBits", "Unable to cast control bits to an integer. Line: %s ", rawMetadata)
         return validFields
 
     def processEquipmentInfo(self, equipmentInfo:str, rawMetadata:str=""):
@@ -69,27 +75,27 @@ class ReadMetadataLine(object):
             self.runID = int(self.runID)
         except ValueError:
             validFields = False
-            logger.error("Run ID number could not be cast to integer. Metadata line: %s" %rawMetadata)
+            self.diagnostics.error("nonIntegerRunID", "Run ID number could not be cast to integer. Metadata line: %s", rawMetadata)
         try:
             self.laneNumber = int(self.laneNumber)
         except ValueError:
             validFields = False
-            logger.error("Lane number could not be cast to integer. Metadata line: %s" %rawMetadata)
+            self.diagnostics.error("nonIntegerLane", "Lane number could not be cast to integer. Metadata line: %s", rawMetadata)
         try:
             self.tileNumber = int(self.tileNumber)
         except ValueError:
             validFields = False
-            logger.error("Tile number could not be cast to integer. Metadata line: %s" %rawMetadata)
+            self.diagnostics.error("nonIntegerTile", "Tile number could not be cast to integer. Metadata line: %s", rawMetadata)
         try:
             self.xCoordinate = int(self.xCoordinate)
         except ValueError:
             validFields = False
-            logger.error("X-coordinate could not be cast to integer. Metadata line: %s" %rawMetadata)
+            self.diagnostics.error("nonIntegerXCoordinate", "X-coordinate could not be cast to integer. Metadata line: %s", rawMetadata)
         try:
             self.yCoordinate = int(self.yCoordinate)
         except ValueError:
             validFields = False
-            logger.error("Y-coordinate could not be cast to integer. Metadata line: %s" %rawMetadata)
+            self.diagnostics.error("nonIntegerYCoordinate", "Y-coordinate could not be cast to integer. Metadata line: %s", rawMetadata)
         return validFields
 
     def __str__(self):
@@ -100,12 +106,17 @@ class QualityScoreLine(object):
 
     def __init__(self, rawQualityLine:str, base:int = 33):
         self.qualityString = rawQualityLine
+        self.base = base
         self.phredScores = self.calculatePhredScores(base)
 
     def calculatePhredScores(self, base:int = 33):
         from .. import qualityScore
         return qualityScore.qualityScoreHandler.convertToNumericArray(self.qualityString, base)
 
+    def phredArray(self):
+        from .. import qualityScore
+        return qualityScore.qualityScoreHandler.convertToNumpyArray(self.qualityString, self.base)
+
     def __str__(self):
         return self.qualityString
 
@@ -119,24 +130,20 @@ class QualityScoreLine(object):
 
 class SequenceLine(object):
 
-    def __init__(self, rawSequence, runAnalysis:bool=False):
+    def __init__(self, rawSequence, runAnalysis:bool=False, diagnostics:DiagnosticsCollector=None):
         self.sequence = rawSequence.strip().upper().replace(".", "N")
+        self.diagnostics = diagnostics
         self.length = len(self.sequence)
         if runAnalysis:
             self.baseFrequency = self.getBaseFrequencyTable()
             self.gcContent = self.calculateGCContent()
 
     def getBaseFrequencyTable(self):
-        freq = {"A" : 0,
-                "G" : 0,
-                "C" : 0,
-                "T" : 0,
-                "N" : 0}
-        for base in self.sequence:
-            try:
-                freq[base] += 1
-            except KeyError:
-                logger.error("Found a sequence with an invalid character. Character: %s  Sequence: %s" %(base, self.sequence))
+        freq = {base: self.sequence.count(base) for base in "AGCTN"}
+        if sum(freq.values()) < self.length:  #only walk the sequence when something in it is not a base
+            for base in self.sequence:
+                if not base in freq:
+                    collectorOrDefault(self.diagnostics).error("invalidBase", "Found a sequence with an invalid character. Character: %s  Sequence: %s", base, self.sequence)
         return freq
 
     def calculateGCContent(self):
@@ -160,42 +167,56 @@ class SequenceLine(object):
         if type(other) == SequenceLine:
             return self.sequence == other.sequence
         elif type(other) == str:
-            return self.sequence == SequenceLine(other).sequence
+            return self.sequence == SequenceLine(other, diagnostics=self.diagnostics).sequence
         else:
             logger.critical("Attempted to compare a sequence to something that is not a sequence line type or string. Value in question was type %s: %s" %(type(other), other))
 
 
 class FastqLineSet(object):
 
-    def __init__(self, metadata:str, sequence:str, spacer:str, quality:str, depth:int=0, analyzeMetadata:bool=False, analyzeSequence:bool=False, analyzeSequenceInDepth:bool=False, analyzeQuality:bool=False, qualityBase:int=33):
+    def __init__(self, metadata:str, sequence:str, spacer:str, quality:str, depth:int=0, analyzeMetadata:bool=False, analyzeSequence:bool=False, analyzeSequenceInDepth:bool=False, analyzeQuality:bool=False, qualityBase:int=33, diagnostics:DiagnosticsCollector=None):
         self.metadata = metadata.strip()
         self.sequence = sequence.strip()
         self.spacer = spacer.strip()
         self.quality = quality.strip()
+        self.diagnostics = diagnostics
         if depth >= 1 or analyzeQuality:
             self.quality = QualityScoreLine(quality, qualityBase)
         if depth >= 2 or analyzeSequence or analyzeSequenceInDepth:
             if depth >= 4 or analyzeSequenceInDepth:
-                self.sequence = SequenceLine(self.sequence, runAnalysis=True)
+                self.sequence = SequenceLine(self.sequence, runAnalysis=True, diagnostics=diagnostics)
             else:
-                self.sequence = SequenceLine(self.sequence)
+                self.sequence = SequenceLine(self.sequence, diagnostics=diagnostics)
         if depth >= 3 or analyzeMetadata:
-            self.metadata = ReadMetadataLine(self.metadata)
+            self.metadata = ReadMetadataLine(self.metadata, diagnostics)
 
     def __str__(self):
         return "%s\n%s\n%s\n%s" %(self.metadata, self.sequence, self.spacer, self.quality)
 
-def reanalyzeFastqLineSet(fastqLineSet:FastqLineSet, depth:int=0, analyzeMetadata:bool=False, analyzeSequence:bool=False, analyzeSequenceInDepth:bool=False, analyzeQuality:bool=False, qualityBase:int=33):
+def reanalyzeFastqLineSet(fastqLineSet:FastqLineSet, depth:int=0, analyzeMetadata:bool=False, analyzeSequence:bool=False, analyzeSequenceInDepth:bool=False, analyzeQuality:bool=False, qualityBase:int=33, diagnostics:DiagnosticsCollector=None):
+    if diagnostics is None:
+        diagnostics = fastqLineSet.diagnostics
     return FastqLineSet(str(fastqLineSet.metadata),
                         str(fastqLineSet.sequence),
                         str(fastqLineSet.spacer),
                         str(fastqLineSet.quality),
-                        depth, analyzeMetadata, analyzeSequence, analyzeSequenceInDepth, analyzeQuality, qualityBase)
+                        depth, analyzeMetadata, analyzeSequence, analyzeSequenceInDepth, analyzeQuality, qualityBase, diagnostics)
 
 class FastqFile(object):
 
-    def __init__(self, path:str, depth:int=0, analyzeMetadata:bool=False, analyzeSequence:bool=False, analyzeSequenceInDepth:bool=False, analyzeQuality:bool=False, fullValidation:bool=False, qualityScoreScheme:[qualityScore.qualityScoreHandler.EncodingScheme, None]=None, subsample:int = 0):
+    def __init__(self, path:str, depth:int=0, analyzeMetadata:bool=False, analyzeSequence:bool=False, analyzeSequenceInDepth:bool=False, analyzeQuality:bool=False, fullValidation:bool=False, qualityScoreScheme:[qualityScore.qualityScoreHandler.EncodingScheme, None]=None, subsample:int = 0, backend:str="stream", persistIndex:bool=False, diagnostics:DiagnosticsCollector=None):
+        '''
+        :param backend: "stream" reads the file line by line. "mmap" maps an uncompressed file and indexes its record
+        starts, which adds len(), indexing and sample() (compressed files fall back to streaming).
+        :param persistIndex: save the mmap record offset index next to the file for reuse
+        :param diagnostics: collector for problems found in individual records. If none is given the file keeps its own
+        and logs a summary of everything it found when it is closed.
+        '''
         self.path = path
+        self.ownsDiagnostics = diagnostics is None
+        if diagnostics is None:
+            diagnostics = DiagnosticsCollector(path)
+        self.diagnostics = diagnostics
         if not os.path.isfile(path):
             logger.critical("Unable to find fastq file at %s" %path)
             raise FileNotFoundError("Unable to find fastq file at %s" %path)
@@ -213,12 +234,23 @@ class FastqFile(object):
         self.analyzeQuality = analyzeQuality
         self.fullValidation = fullValidation
         self.reachedEnd = False
-        self.gzipped = self.checkGzip(path)
-        if self.gzipped:
-            import gzip
-            self.filehandle = gzip.open(path, "rt")
+        from .. import compressionCodecs
+        self.codec = compressionCodecs.sniffCodec(path)
+        self.gzipped = compressionCodecs.isGzipCodec(self.codec)
+        if not backend in ("stream", "mmap"):
+            raise ValueError("Fastq file backend must be either stream or mmap. %s was given." %backend)
+        if backend == "mmap" and not self.codec == compressionCodecs.plain:
+            logger.warning("Unable to memory-map %s compressed fastq file %s. Reading it as a stream instead." %(self.codec, path))
+            backend = "stream"
+        self.backend = backend
+        self.mappedFile = None
+        if backend == "mmap":
+            from . import fastqMmap
+            self.mappedFile = fastqMmap.MappedFastq(path, persistIndex)
+            self.filehandle = self.mappedFile
+            self.decompressionBackend = "none"
         else:
-            self.filehandle = open(path, "r")
+            self.filehandle, self.decompressionBackend = compressionCodecs.openTextStream(path, self.codec)
         self.open = True
         subsample = int(subsample)
         if subsample == 0:
@@ -244,39 +276,83 @@ class FastqFile(object):
                     readBuffer.append(nextLine)
             if self.reachedEnd:
                 if readBuffer:
-                    logger.error(
-                        "Fastq file at %s appears to me missing lines (found something not a multiple of 4." % self.path)
+                    self.diagnostics.error("truncatedRecord", "Fastq file at %s appears to me missing lines (found something not a multiple of 4.", self.path)
                     for i in range(4 - len(readBuffer)):
                         readBuffer.append("")
             return readBuffer
 
+        def readMappedRecord():
+            if self.currentLine >= len(self.mappedFile):
+                self.reachedEnd = True
+                return []
+            return [line.decode().strip() for line in self.mappedFile.lineBatch(self.currentLine, self.currentLine + 1)]
+
         if not self.open:
             logger.critical("Attempting to read from a closed fastq file at %s" %self.path)
             raise ValueError("I/O operation on a closed file")
         readBuffer = None
         includedLine = False
         while not includedLine:
-            readBuffer = read4Lines()
+            if self.mappedFile is not None:
+                if self.currentLine % self.subsample:  #records that will be skipped are never sliced from the map
+                    self.currentLine += self.subsample - self.currentLine % self.subsample
+                readBuffer = readMappedRecord()
+            else:
+                readBuffer = read4Lines()
             self.currentLine += 1
             includedLine = (self.currentLine - 1) % self.subsample == 0 or self.reachedEnd
         if not readBuffer:
             return readBuffer
         else:
-            fastqLineSet = FastqLineSet(*readBuffer, depth=self.depth, analyzeMetadata=self.analyzeMetadata, analyzeSequence=self.analyzeSequence, analyzeSequenceInDepth=self.analyzeSequenceInDepth, analyzeQuality=self.analyzeQuality, qualityBase=self.qualityScoreScheme.base)
-            if self.fullValidation:
-                if not len(readBuffer[1]) == len(readBuffer[3]):
-                    raise FastqValidationError("Got mismatched sequence and quality line lengths for line %s" %readBuffer)
-                if type(fastqLineSet.metadata) == str:
-                    metadata = ReadMetadataLine(str(fastqLineSet.metadata))
-                else:
-                    metadata = fastqLineSet.metadata
-                if not metadata.allValidInfo:
-                    raise FastqValidationError("Got some invalid metadata for line %s" %readBuffer)
-            return fastqLineSet
+            return self.makeLineSet(readBuffer)
+
+    def makeLineSet(self, readBuffer:list):
+        fastqLineSet = FastqLineSet(*readBuffer, depth=self.depth, analyzeMetadata=self.analyzeMetadata, analyzeSequence=self.analyzeSequence, analyzeSequenceInDepth=self.analyzeSequenceInDepth, analyzeQuality=self.analyzeQuality, qualityBase=self.qualityScoreScheme.base, diagnostics=self.diagnostics)
+        if self.fullValidation:
+            if not len(readBuffer[1]) == len(readBuffer[3]):
+                raise FastqValidationError("Got mismatched sequence and quality line lengths for line %s" %readBuffer)
+            if type(fastqLineSet.metadata) == str:
+                metadata = ReadMetadataLine(str(fastqLineSet.metadata), self.diagnostics)
+            else:
+                metadata = fastqLineSet.metadata
+            if not metadata.allValidInfo:
+                raise FastqValidationError("Got some invalid metadata for line %s" %readBuffer)
+        return fastqLineSet
+
+    def requireMappedFile(self, operation:str):
+        if self.mappedFile is None:
+            raise TypeError("%s requires a fastq file opened with the mmap backend. %s was opened as a %s." %(operation, self.path, self.backend))
+
+    def getRead(self, index:int):
+        self.requireMappedFile("Random access")
+        if index < 0:
+            index += len(self.mappedFile)
+        if not 0 <= index < len(self.mappedFile):
+            raise IndexError("Read %s is out of range for %s with %s reads" %(index, self.path, len(self.mappedFile)))
+        return self.makeLineSet([line.decode().strip() for line in self.mappedFile.lineBatch(index, index + 1)])
+
+    def sample(self, sampleSize:int, seed:int=None):
+        '''
+        :return: list of FastqLineSet objects for a uniform random sample of reads, in file order
+        '''
+        self.requireMappedFile("Random sampling")
+        return [self.getRead(index) for index in self.mappedFile.sampleIndices(sampleSize, seed)]
 
     def close(self):
         if not self.filehandle.closed:
             self.filehandle.close()
+        if self.ownsDiagnostics:
+            self.diagnostics.emitSummary()
+
+    def __getitem__(self, item:int):
+        return self.getRead(item)
+
+    def __len__(self):
+        self.requireMappedFile("Getting the read count with len()")
+        return len(self.mappedFile)
+
+    def __bool__(self):  #len() only works on mapped files, and an open file is true however many reads it holds
+        return True
 
     def __iter__(self):
         return self
@@ -295,7 +371,7 @@ class FastqFile(object):
 
 class FastqFilePair(object):
 
-    def __init__(self, pe1Path:str, pe2Path:str, depth:int=0, analyzeMetadata:bool=False, analyzeSequence:bool=False, analyzeSequenceInDepth:bool=False, analyzeQuality:bool=False, fullValidation:bool=False, qualityScoreScheme:qualityScore.qualityScoreHandler=None, subsample:int=0):
+    def __init__(self, pe1Path:str, pe2Path:str, depth:int=0, analyzeMetadata:bool=False, analyzeSequence:bool=False, analyzeSequenceInDepth:bool=False, analyzeQuality:bool=False, fullValidation:bool=False, qualityScoreScheme:qualityScore.qualityScoreHandler=None, subsample:int=0, diagnostics:DiagnosticsCollector=None):
         self.pe1Path = pe1Path
         if not os.path.isfile(pe1Path):
             logger.critical("Unable to find fastq file at %s" %pe1Path)
@@ -314,8 +390,12 @@ class FastqFilePair(object):
         if subsample == 0:
             subsample = 1
         self.subsample = subsample
-        self.pe1FileHandle = FastqFile(pe1Path, depth=depth, analyzeMetadata=analyzeMetadata, analyzeSequence=analyzeSequence, analyzeSequenceInDepth=analyzeSequenceInDepth, analyzeQuality=analyzeQuality, fullValidation=fullValidation, qualityScoreScheme=qualityScoreScheme, subsample=subsample)
-        self.pe2FileHandle = FastqFile(pe2Path, depth=depth, analyzeMetadata=analyzeMetadata, analyzeSequence=analyzeSequence, analyzeSequenceInDepth=analyzeSequenceInDepth, analyzeQuality=analyzeQuality, fullValidation=fullValidation, qualityScoreScheme=qualityScoreScheme, subsample=subsample)
+        self.ownsDiagnostics = diagnostics is None
+        if diagnostics is None:
+            diagnostics = DiagnosticsCollector("%s and %s" %(pe1Path, pe2Path))
+        self.diagnostics = diagnostics
+        self.pe1FileHandle = FastqFile(pe1Path, depth=depth, analyzeMetadata=analyzeMetadata, analyzeSequence=analyzeSequence, analyzeSequenceInDepth=analyzeSequenceInDepth, analyzeQuality=analyzeQuality, fullValidation=fullValidation, qualityScoreScheme=qualityScoreScheme, subsample=subsample, diagnostics=diagnostics)
+        self.pe2FileHandle = FastqFile(pe2Path, depth=depth, analyzeMetadata=analyzeMetadata, analyzeSequence=analyzeSequence, analyzeSequenceInDepth=analyzeSequenceInDepth, analyzeQuality=analyzeQuality, fullValidation=fullValidation, qualityScoreScheme=qualityScoreScheme, subsample=subsample, diagnostics=diagnostics)
         if not self.pe1FileHandle.qualityScoreScheme == self.pe2FileHandle.qualityScoreScheme:
             logger.warning("Paired end files appear to have different quality score encodings. Pe1: %s:%s. Pe2: %s%s" %(self.pe1FileHandle.qualityScoreScheme, self.pe1FileHandle.path, self.pe2FileHandle.qualityScoreScheme, self.pe2FileHandle.path))
         self.open = True
@@ -329,9 +409,9 @@ class FastqFilePair(object):
         nextPe2 = self.pe2FileHandle.getNextRead()
         if (nextPe1 and not nextPe2) or (not nextPe1 and nextPe2):
             if nextPe1:
-                logger.error("Ran out of paired-end 2 reads with remaining paired-end 1 reads for file pair %s and %s" %(self.pe1Path, self.pe2Path))
+                self.diagnostics.error("unpairedPe1Reads", "Ran out of paired-end 2 reads with remaining paired-end 1 reads for file pair %s and %s", self.pe1Path, self.pe2Path)
             else:
-                logger.error("Ran out of paired-end 1 reads with remaining paired-end 2 reads for file pair %s and %s" %(self.pe1Path, self.pe2Path))
+                self.diagnostics.error("unpairedPe2Reads", "Ran out of paired-end 1 reads with remaining paired-end 2 reads for file pair %s and %s", self.pe1Path, self.pe2Path)
             if self.fullValidation:
                 raise FastqValidationError("Reached end of one paired-end file before the other. Files: %s and %s" %(self.pe1Path, self.pe2Path))
         if not nextPe1 and not nextPe2:
@@ -343,26 +423,28 @@ class FastqFilePair(object):
 
     def runValidation(self, pe1:FastqLineSet, pe2:FastqLineSet):
         if type(pe1.metadata) == str:
-            pe1Metadata = ReadMetadataLine(str(pe1.metadata))
+            pe1Metadata = ReadMetadataLine(str(pe1.metadata), self.diagnostics)
         elif type(pe1.metadata) == ReadMetadataLine:
             pe1Metadata = pe1.metadata
         else:
             raise TypeError("Only able to compare metadata as string or metadata objects")
         if type(pe2.metadata) == str:
-            pe2Metadata = ReadMetadataLine(str(pe2.metadata))
+            pe2Metadata = ReadMetadataLine(str(pe2.metadata), self.diagnostics)
         elif type(pe1.metadata) == ReadMetadataLine:
             pe2Metadata = pe2.metadata
         else:
             raise TypeError("Only able to compare metadata as string or metadata objects")
         if not pe1Metadata.allValidInfo or not pe2Metadata.allValidInfo:
             raise FastqValidationError("Got invalid metadata field for at least one read in paired end mates:\n%s\n%s" %(pe1, pe2))
-        if not validPairedEndMetadata(pe1Metadata, pe2Metadata):
+        if not validPairedEndMetadata(pe1Metadata, pe2Metadata, self.diagnostics):
             raise FastqValidationError("Got invalid metadata match for paired end mates:\n%s\n%s" %(pe1, pe2))
 
     def close(self):
         self.pe1FileHandle.close()
         self.pe2FileHandle.close()
         self.open = False
+        if self.ownsDiagnostics:
+            self.diagnostics.emitSummary()
 
     def __iter__(self):
         return self
@@ -386,7 +468,7 @@ class FastqFormatError(Exception):
     pass
 
 
-def validPairedEndMetadata(pe1:ReadMetadataLine, pe2:ReadMetadataLine):
+def validPairedEndMetadata(pe1:ReadMetadataLine, pe2:ReadMetadataLine, diagnostics:DiagnosticsCollector=None):
     matchFields = ["instrumentName",
                    "runID",
                    "flowcellID",
@@ -399,14 +481,19 @@ def validPairedEndMetadata(pe1:ReadMetadataLine, pe2:ReadMetadataLine):
         pe1Value = getattr(pe1, field)
         pe2Value = getattr(pe2, field)
         if not pe1Value == pe2Value:
-            logger.error("Mismatch on %s" %matchFields)
+            collectorOrDefault(diagnostics).error("mateMismatch", "Mismatch on %s (%s against %s)", field, pe1Value, pe2Value)
             return False
     if not ((pe1.direction == 1 and pe2.direction == 2) or (pe2.direction == 1 and pe1.direction == 2)):
         return False
     return True
 
 
-def validFastqFile(path:str):
+def validFastqFile(path:str, useBlockReader:bool=True, workers:int=1):
+    if workers > 1:
+        from . import fastqParallel
+        return fastqParallel.validFastqFileParallel(path, workers)
+    if useBlockReader:
+        return validFastqFileFromBlocks(path)
     readCount = 0
     fastq = FastqFile(path, fullValidation=True)
     read = fastq.getNextRead()
@@ -421,7 +508,39 @@ def validFastqFile(path:str):
     return readCount
 
 
-def validFastqPair(pe1Path:str, pe2Path:str):
+def validFastqRecordLines(header:bytes, sequence:bytes, spacer:bytes, quality:bytes, fullValidation:bool=True, diagnostics:DiagnosticsCollector=None):
+    if not header.startswith(b"@"):
+        raise FastqFormatError("Got a metadata line that did not start with an @ symbol. Line: %s" %header)
+    if not spacer.startswith(b"+"):
+        raise FastqFormatError("Got a spacer line that did not start with a + symbol. Line: %s" %spacer)
+    if not len(sequence) == len(quality):
+        raise FastqValidationError("Got mismatched sequence and quality line lengths for line %s" %header)
+    if not fullValidation:
+        return None
+    metadata = ReadMetadataLine(header.decode(), diagnostics)
+    if not metadata.allValidInfo:
+        raise FastqValidationError("Got some invalid metadata for line %s" %header)
+    return metadata
+
+
+def validFastqRecordView(record:fastqBlockReader.FastqRecordView, diagnostics:DiagnosticsCollector=None):
+    return validFastqRecordLines(record.header, record.sequence, record.spacer, record.quality, diagnostics=diagnostics)
+
+
+def validFastqFileFromBlocks(path:str):
+    from . import fastqScanner
+    summary = fastqScanner.scanFastq(path, [fastqScanner.FormatValidator()])
+    return summary.validation
+
+
+def validFastqPair(pe1Path:str, pe2Path:str, useBlockReader:bool=True, workers:int=1):
+    if workers > 1:
+        from . import fastqParallel
+        return fastqParallel.validFastqPairParallel(pe1Path, pe2Path, workers)
+    if useBlockReader:
+        from . import fastqScanner
+        summary = fastqScanner.scanFastqPair(pe1Path, pe2Path, [], [], [fastqScanner.PairValidator()])
+        return summary.pairValidation
     readCount = 0
     fastqPair = FastqFilePair(pe1Path, pe2Path, fullValidation=True)
     read = fastqPair.getNextReadPair()
@@ -437,15 +556,97 @@ def validFastqPair(pe1Path:str, pe2Path:str):
     return readCount
 
 
-def estimateReadLength(path:str, samplesize:int=100, getVariance = False):
+def indexedReadCount(path:str):
+    from . import fastqGzipIndex
+    index = fastqGzipIndex.loadIndex(path)
+    if index:
+        return index.totalRecords
+    return None
+
+
+def checkFastqFile(path:str, maxReads:int=0, failFast:bool=True, fullValidation:bool=True, logErrors:bool=True, blockSize:int=fastqBlockReader.defaultBlockSize):
+    '''
+    Validates a fastq file, stopping as soon as the outcome is known.
+    :param path: path to the fastq file
+    :param maxReads: reject the file as soon as it is seen to hold more than this many reads (0 for no limit). A
+    gzipped file with a current index is rejected without being read at all.
+    :param failFast: stop at the first format error. Otherwise the rest of the file is still read to count its reads.
+    :param fullValidation: check read header contents as well as the record structure
+    :param logErrors: log the reason for a failure as it is found
+    :param blockSize: bytes to read at a time, which is also how often the read budget is checked
+    :return: fastqScanner.ValidationResult, which is truthy only for a valid, non-empty file within the budget
+    '''
+    from . import fastqScanner
+    indexedCount = indexedReadCount(path)
+    if maxReads and indexedCount is not None and indexedCount > maxReads:
+        return fastqScanner.ValidationResult(path, fastqScanner.readBudgetReason, indexedCount, "%s reads found in the gzip index, more than %s" %(indexedCount, maxReads), maxReads)
+    validator = fastqScanner.FormatValidator(fullValidation, logErrors, maxReads, failFast)
+    fastqScanner.scanFastq(path, [validator], blockSize)
+    return validator.validationResult(path)
+
+
+def indexedPairBudgetCheck(pe1Path:str, pe2Path:str, maxReads:int):
+    '''
+    :return: a readBudgetExceeded ValidationResult if a current gzip index shows either mate holds more than maxReads
+    reads, otherwise None (including when there is no index to go by)
+    '''
+    from . import fastqScanner
+    if not maxReads:
+        return None
+    for path in (pe1Path, pe2Path):
+        indexedCount = indexedReadCount(path)
+        if indexedCount is not None and indexedCount > maxReads:
+            return fastqScanner.ValidationResult((pe1Path, pe2Path), fastqScanner.readBudgetReason, indexedCount, "%s reads found in the gzip index for %s, more than %s" %(indexedCount, path, maxReads), maxReads)
+    return None
+
+
+def checkFastqPair(pe1Path:str, pe2Path:str, maxReads:int=0, failFast:bool=True, logErrors:bool=True, blockSize:int=fastqBlockReader.defaultBlockSize):
+    '''
+    Validates a paired-end set, stopping as soon as the outcome is known. This is validFastqPair with a read budget and
+    a reason for failure.
+    :param pe1Path: path to the paired-end 1 fastq
+    :param pe2Path: path to the paired-end 2 fastq
+    :param maxReads: reject the pair as soon as it is seen to hold more than this many read pairs (0 for no limit). A
+    gzipped pair with a current index is rejected without being read at all.
+    :param failFast: stop at the first format error. Otherwise the rest of the pair is still read to count its reads.
+    :param logErrors: log the reason for a failure as it is found
+    :param blockSize: bytes to read from each file at a time, which is also how often the read budget is checked
+    :return: fastqScanner.ValidationResult, which is truthy only for a valid, non-empty pair within the budget
+    '''
+    from . import fastqScanner
+    indexedResult = indexedPairBudgetCheck(pe1Path, pe2Path, maxReads)
+    if indexedResult is not None:
+        return indexedResult
+    validator = fastqScanner.PairValidator(logErrors, maxReads, failFast)
+    fastqScanner.scanFastqPair(pe1Path, pe2Path, [], [], [validator], blockSize)
+    return validator.validationResult((pe1Path, pe2Path))
+
+
+def estimateReadLength(path:str, samplesize:int=100, getVariance = False, useBlockReader:bool=True, uniformSample:bool=None):
+    '''
+    :param uniformSample: estimate from reads drawn uniformly across the file (see fastqSampler) instead of the first
+    samplesize reads, which come from the first tiles and can be unrepresentative, especially in sorted files. Defaults
+    to sampling uniformly only when that does not mean decompressing the whole file (see fastqSampler.cheapToSample).
+    '''
+    from . import fastqSampler
+    if uniformSample is None:
+        uniformSample = fastqSampler.cheapToSample(path)
+    if uniformSample:
+        readSample = fastqSampler.sampleReads(path, samplesize)
+        meanReadLength = readSample.meanLength()[0]
+        if getVariance:
+            return round(meanReadLength), readSample.lengthVariance()
+        return round(meanReadLength)
     lengths = []
-    fastq = FastqFile(path)
-    read = fastq.getNextRead()
-    while read:
+    if useBlockReader:
+        fastq = fastqBlockReader.FastqBlockReader(path, blockSize=min(fastqBlockReader.defaultBlockSize, 1024 * 1024))
+    else:
+        fastq = FastqFile(path)
+    for read in fastq:
         lengths.append(len(read.sequence))
         if len(lengths) >= samplesize:
             break
-        read = fastq.getNextRead()
+    fastq.close()
     meanReadLength = sum(lengths)/len(lengths)
     if getVariance:
         import statistics
@@ -454,8 +655,15 @@ def estimateReadLength(path:str, samplesize:int=100, getVariance = False):
     return round(meanReadLength)
 
 
-def getLongestReadInFile(path:str):
+def getLongestReadInFile(path:str, useBlockReader:bool=True):
     longestReadLength = 0
+    if useBlockReader:
+        reader = fastqBlockReader.FastqBlockReader(path)
+        for lines in reader.iterLineBatches():
+            batchLongest = max(map(len, lines[1::4]))
+            if batchLongest > longestReadLength:
+                longestReadLength = batchLongest
+        return longestReadLength
     fastq = FastqFile(path)
     for read in fastq:
         if len(read.sequence) > longestReadLength:
@@ -464,44 +672,108 @@ def getLongestReadInFile(path:str):
     return longestReadLength
 
 
-def countReads(path:str):
+def countReads(path:str, useBlockReader:bool=True, workers:int=1, maxReads:int=0):
+    '''
+    :param maxReads: stop counting once the file is known to hold more than this many reads (0 for no limit). The
+    count returned is then above maxReads but is not the file's total.
+    '''
+    if useBlockReader:
+        from . import fastqGzipIndex
+        index = fastqGzipIndex.loadIndex(path)
+        if index:
+            return index.totalRecords
+    if workers > 1 and not maxReads:
+        from . import fastqParallel
+        return fastqParallel.countReadsParallel(path, workers)
+    if useBlockReader:
+        return fastqBlockReader.FastqBlockReader(path).countRecords(maxReads)
     readCount = 0
     fastq = FastqFile(path)
     read = fastq.getNextRead()
     while read:
         readCount += 1
+        if maxReads and readCount > maxReads:
+            break
         read = fastq.getNextRead()
     fastq.close()
     return readCount
 
 
-def findQualityScoreEncoding(path:str, lineLimit:int=100):
-    from .. import qualityScore
-    candidates = qualityScore.qualityScoreHandler.makeEncodingTable()
-    for i in range(len(candidates)):
-        candidates[i].eliminated = False
-    fastq = FastqFile(path, qualityScoreScheme=qualityScore.qualityScoreHandler.encodingSchemes.sanger)
-    line = fastq.getNextRead()
-    lineCount = 0
-    while line:
-        for candidate in candidates:
-            candidate.qualifyWithQualityString(line.quality)
-        remaining = len([scheme for scheme in candidates if not scheme.eliminated])
-        lineCount += 1
-        if lineLimit > 0:
-            if lineCount >= lineLimit:
+qualityScoreEncodingCache = {}
+
+
+def fileCacheKey(path:str):
+    fileStats = os.stat(path)
+    return os.path.abspath(path), fileStats.st_size, fileStats.st_mtime_ns
+
+
+def sampleQualityLines(path:str, readsPerRegion:int=100, regions:int=8, regionBytes:int=256 * 1024, gzipSampleBytes:int=4 * 1024 * 1024):
+    '''
+    Pulls raw quality lines from several evenly spaced offsets in a plain fastq file, resyncing on record boundaries at
+    each offset. Gzipped files cannot be seeked into cheaply, so quality lines come from the first gzipSampleBytes of
+    decompressed data instead (the same goes for other compression codecs).
+    :return: list of quality lines as bytes
+    '''
+    qualityLines = []
+    reader = fastqBlockReader.FastqBlockReader(path, blockSize=regionBytes)
+    if reader.compressed:
+        sampledBytes = 0
+        for lines in reader.iterLineBatches():
+            qualityLines.extend(lines[3::4])
+            sampledBytes += sum(map(len, lines))
+            if sampledBytes >= gzipSampleBytes:
                 break
-        if remaining == 0:
+        reader.close()
+        return qualityLines
+    reader.close()
+    fileSize = os.path.getsize(path)
+    offsets = sorted(set([(fileSize * region) // regions for region in range(regions)]))
+    file = open(path, "rb")
+    for offset in offsets:
+        file.seek(offset)
+        data = file.read(regionBytes)
+        recordStart = fastqBlockReader.findRecordStart(data) if offset else 0
+        if recordStart == -1:
+            continue
+        lines = data[recordStart:].split(b"\n")
+        lineCount = min(((len(lines) - 1) // 4) * 4, readsPerRegion * 4)
+        qualityLines.extend(lines[3:lineCount:4])
+    file.close()
+    return qualityLines
+
+
+def findQualityScoreEncoding(path:str, lineLimit:int=100, useCache:bool=True):
+    '''
+    Detects the quality score encoding of a fastq file from the lowest and highest quality characters in a sample of
+    reads taken across the file. Results are cached by path, size and modification time, so repeated FastqFile opens of
+    an unchanged file skip detection entirely.
+    :param path: path to the fastq file
+    :param lineLimit: reads to sample from each region of the file. Values less than 1 scan every read in the file.
+    :param useCache: reuse a previous result for the same unchanged file
+    :return: EncodingScheme object, or None if no scheme fits the quality characters found
+    '''
+    from .. import qualityScore
+    cacheKey = fileCacheKey(path)
+    if useCache and cacheKey in qualityScoreEncodingCache:
+        return qualityScoreEncodingCache[cacheKey]
+    if lineLimit > 0:
+        qualityLines = sampleQualityLines(path, lineLimit)
+    else:
+        qualityLines = []
+        for lines in fastqBlockReader.FastqBlockReader(path).iterLineBatches():
+            qualityBytes = b"".join(lines[3::4])
+            if qualityBytes:
+                qualityLines.extend([bytes([min(qualityBytes)]), bytes([max(qualityBytes)])])
+    qualityBytes = b"".join(qualityLines).rstrip(b"\r")
+    qualityBytes = qualityBytes.replace(b"\r", b"")
+    if not qualityBytes:
+        encoding = qualityScore.qualityScoreHandler.makeEncodingTable()[0]
+    else:
+        encoding = qualityScore.qualityScoreHandler.findEncodingFromByteRange(min(qualityBytes), max(qualityBytes))
+        if encoding is None:
             logger.error("No valid quality scoring scheme found for fastq file %s" %path)
-            fastq.close()
-            return None
-        elif remaining == 1:
-            break
-    for candidate in candidates:
-        if not candidate.eliminated:
-            del candidate.eliminated
-            fastq.close()
-            return candidate
+    qualityScoreEncodingCache[cacheKey] = encoding
+    return encoding
 
 
 def findSamplesInFolder(directory:str, namingStandard:typing.Type[fileNamingStandards.NamingStandard] = fileNamingStandards.ZymoServicesNamingStandard):
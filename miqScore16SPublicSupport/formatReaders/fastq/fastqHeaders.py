@@ -0,0 +1,216 @@
+'''
+Batch validation of Illumina read headers as numpy arrays, with a record-by-record fallback.
+'''
+import collections
+import logging
+logger = logging.getLogger(__name__)
+
+fieldsPerHeader = 11
+separatorTemplate = b":::::: :::\n"
+instrumentField, runField, flowcellField, laneField, tileField, xField, yField, directionField, filterField, controlField, indexField = range(fieldsPerHeader)
+numericFields = (runField, laneField, tileField, xField, yField, directionField, controlField)
+# ReadMetadataLine names the lane and tile fields the other way around, but the fourth field is the lane in the Illumina
+# specification.
+
+
+def structureIsValid(lines:list):
+    '''
+    :return: True if every record starts with @, has a + spacer and has matching sequence and quality lengths
+    '''
+    headers = lines[0::4]
+    spacers = lines[2::4]
+    if not (b"\n" + b"\n".join(headers)).count(b"\n@") == len(headers):
+        return False
+    if not (b"\n" + b"\n".join(spacers)).count(b"\n+") == len(spacers):
+        return False
+    return list(map(len, lines[1::4])) == list(map(len, lines[3::4]))
+
+
+class ParsedHeaders(object):
+    '''
+    Joined header bytes and separator positions for a batch that passed the fast check.
+    '''
+
+    __slots__ = ["data", "separators"]
+
+    def __init__(self, data, separators):
+        self.data = data
+        self.separators = separators
+
+    def __len__(self):
+        return len(self.separators)
+
+    def fieldValues(self, field:int):
+        '''
+        :return: int64 array with the value of a numeric field for every header
+        '''
+        import numpy
+        ends = self.separators[:, field]
+        starts = self.separators[:, field - 1] + 1
+        lengths = ends - starts
+        positions = numpy.repeat(starts, lengths) + numpy.arange(int(lengths.sum())) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+        exponents = numpy.repeat(ends, lengths) - positions - 1
+        digits = self.data[positions].astype("int64") - ord("0")
+        headerNumbers = numpy.repeat(numpy.arange(len(self)), lengths)
+        return numpy.bincount(headerNumbers, weights=digits * 10.0 ** exponents, minlength=len(self)).astype("int64")
+
+    def directions(self):
+        return self.data[self.separators[:, yField] + 1]
+
+
+def parseHeaders(headers:list):
+    '''
+    :return: ParsedHeaders for the batch, or None if any header in it needs the record-by-record check
+    '''
+    import numpy
+    headerCount = len(headers)
+    data = numpy.frombuffer(b"\n".join(headers) + b"\n", dtype="uint8")
+    isSeparator = (data == ord(":")) | (data == ord(" ")) | (data == ord("\n"))
+    separatorPositions = numpy.flatnonzero(isSeparator)
+    if not len(separatorPositions) == headerCount * fieldsPerHeader:
+        return None
+    separators = separatorPositions.reshape(headerCount, fieldsPerHeader)
+    if not (data[separators] == numpy.frombuffer(separatorTemplate, dtype="uint8")).all():
+        return None
+    otherPositions = numpy.flatnonzero(~(isSeparator | ((data >= ord("0")) & (data <= ord("9")))))
+    otherFields = numpy.searchsorted(separatorPositions, otherPositions) % fieldsPerHeader
+    isNumeric = numpy.zeros(fieldsPerHeader, dtype=bool)
+    isNumeric[list(numericFields)] = True
+    if isNumeric[otherFields].any():
+        return None
+    previousSeparators = numpy.hstack((numpy.full((headerCount, 1), -1, dtype=separators.dtype), separators[:, :-1]))
+    previousSeparators[1:, 0] = separators[:-1, -1]
+    fieldLengths = separators - previousSeparators - 1
+    if not (fieldLengths[:, list(numericFields)] > 0).all():
+        return None
+    if not ((fieldLengths[:, directionField] == 1) & (fieldLengths[:, filterField] == 1)).all():
+        return None
+    directions = data[separators[:, yField] + 1]
+    if not ((directions == ord("1")) | (directions == ord("2"))).all():
+        return None
+    filterFlags = data[separators[:, directionField] + 1] | 0x20  #lower case
+    if not ((filterFlags == ord("y")) | (filterFlags == ord("n"))).all():
+        return None
+    if ((data[separators[:, controlField] - 1] - ord("0")) % 2).any():
+        return None
+    return ParsedHeaders(data, separators)
+
+
+def matesAgree(pe1Headers:ParsedHeaders, pe2Headers:ParsedHeaders):
+    '''
+    :return: True if the headers differ only in direction, filter flag and control bits, with one mate read 1 and the
+    other read 2 (False may still be a valid pair, so callers fall back to validPairedEndMetadata)
+    '''
+    import numpy
+    if not (len(pe1Headers) == len(pe2Headers) and len(pe1Headers.data) == len(pe2Headers.data)):
+        return False
+    differences = numpy.flatnonzero(pe1Headers.data != pe2Headers.data)
+    headerNumbers = numpy.searchsorted(pe1Headers.separators[:, indexField], differences)
+    allowedStart = pe1Headers.separators[headerNumbers, yField]
+    allowedEnd = pe1Headers.separators[headerNumbers, controlField]
+    if not ((differences > allowedStart) & (differences < allowedEnd)).all():
+        return False
+    return (pe1Headers.directions().astype("int16") + pe2Headers.directions() == ord("1") + ord("2")).all()
+
+
+def laneAndTile(header:bytes):
+    equipmentInfo = header.split(b" ")[0].split(b":")
+    try:
+        return int(equipmentInfo[laneField]), int(equipmentInfo[tileField])
+    except (IndexError, ValueError):
+        return None
+
+
+class HeaderValidator(object):
+    '''
+    Validates fastq records and mate pairs a batch at a time and keeps counts of reads seen per (lane, tile).
+    '''
+
+    def __init__(self, countTiles:bool=True, diagnostics=None):
+        '''
+        :param countTiles: keep read counts by lane and tile
+        :param diagnostics: DiagnosticsCollector that problems found in the record-by-record check are reported to
+        '''
+        self.countTiles = countTiles
+        self.diagnostics = diagnostics
+        self.tileCounts = collections.Counter()
+        self.fastBatches = 0
+        self.fallbackBatches = 0
+
+    def countParsedTiles(self, parsedHeaders:ParsedHeaders):
+        import numpy
+        if not self.countTiles:
+            return
+        lanes = parsedHeaders.fieldValues(laneField)
+        tiles = parsedHeaders.fieldValues(tileField)
+        runStarts = numpy.flatnonzero(numpy.concatenate(([True], (lanes[1:] != lanes[:-1]) | (tiles[1:] != tiles[:-1]))))  #reads come out tile by tile
+        runLengths = numpy.diff(numpy.append(runStarts, len(lanes)))
+        for lane, tile, count in zip(lanes[runStarts].tolist(), tiles[runStarts].tolist(), runLengths.tolist()):
+            self.tileCounts[(lane, tile)] += count
+
+    def countHeaderTiles(self, headers:list):
+        if self.countTiles:
+            self.tileCounts.update(filter(None, map(laneAndTile, headers)))
+
+    def validateLines(self, lines:list, fullValidation:bool=True):
+        '''
+        :return: number of records validated
+        :raises: FastqFormatError or FastqValidationError for the first invalid record, exactly as validFastqRecordLines
+        '''
+        if structureIsValid(lines):
+            if not fullValidation:
+                self.fastBatches += 1
+                return len(lines) // 4
+            parsedHeaders = parseHeaders(lines[0::4])
+            if parsedHeaders is not None:
+                self.countParsedTiles(parsedHeaders)
+                self.fastBatches += 1
+                return len(parsedHeaders)
+        self.validateLinesByRecord(lines, fullValidation)
+        return len(lines) // 4
+
+    def validateLinesByRecord(self, lines:list, fullValidation:bool=True):
+        from .fastqHandler import validFastqRecordLines
+        self.fallbackBatches += 1
+        for header, sequence, spacer, quality in zip(lines[0::4], lines[1::4], lines[2::4], lines[3::4]):
+            validFastqRecordLines(header, sequence, spacer, quality, fullValidation, self.diagnostics)
+        if fullValidation:
+            self.countHeaderTiles(lines[0::4])
+
+    def validatePairLines(self, pe1Lines:list, pe2Lines:list):
+        '''
+        :return: number of record pairs validated, up to the length of the shorter batch
+        '''
+        recordCount = min(len(pe1Lines), len(pe2Lines)) // 4
+        pe1Lines = pe1Lines[:recordCount * 4]
+        pe2Lines = pe2Lines[:recordCount * 4]
+        if structureIsValid(pe1Lines) and structureIsValid(pe2Lines):
+            pe1Headers = parseHeaders(pe1Lines[0::4])
+            pe2Headers = parseHeaders(pe2Lines[0::4])
+            if pe1Headers is not None and pe2Headers is not None and matesAgree(pe1Headers, pe2Headers):
+                self.countParsedTiles(pe1Headers)
+                self.fastBatches += 1
+                return recordCount
+        self.validatePairLinesByRecord(pe1Lines, pe2Lines)
+        return recordCount
+
+    def validatePairLinesByRecord(self, pe1Lines:list, pe2Lines:list):
+        from .fastqHandler import validFastqRecordLines, validPairedEndMetadata, FastqValidationError
+        self.fallbackBatches += 1
+        pe1Records = zip(pe1Lines[0::4], pe1Lines[1::4], pe1Lines[2::4], pe1Lines[3::4])
+        pe2Records = zip(pe2Lines[0::4], pe2Lines[1::4], pe2Lines[2::4], pe2Lines[3::4])
+        for pe1Record, pe2Record in zip(pe1Records, pe2Records):
+            pe1Metadata = validFastqRecordLines(*pe1Record, diagnostics=self.diagnostics)
+            pe2Metadata = validFastqRecordLines(*pe2Record, diagnostics=self.diagnostics)
+            if not validPairedEndMetadata(pe1Metadata, pe2Metadata, self.diagnostics):
+                raise FastqValidationError("Got invalid metadata match for paired end mates:\n%s\n%s" %(pe1Metadata, pe2Metadata))
+        self.countHeaderTiles(pe1Lines[0::4])
+
+    def readsPerTile(self):
+        '''
+        :return: dictionary of read counts keyed by (lane, tile)
+        '''
+        return dict(self.tileCounts)
+
+    def __str__(self):
+        return "Header validator (%s fast batches, %s record-by-record, %s tiles seen)" %(self.fastBatches, self.fallbackBatches, len(self.tileCounts))
@@ -0,0 +1,185 @@
+'''
+Memory-mapped access to uncompressed fastq files. MappedFastq maps the file and keeps a compact array('Q') of record
+start offsets, built in one vectorized scan for line breaks and optionally saved next to the file as <path>.fqoffsets.
+With the offsets in hand, the record count, any single record, or a random sample of records come straight from slices
+of the map without reading through the rest of the file.
+'''
+import os
+import logging
+logger = logging.getLogger(__name__)
+
+offsetIndexExtension = ".fqoffsets"
+scanSize = 64 * 1024 * 1024
+
+
+def offsetIndexPath(path:str):
+    return path + offsetIndexExtension
+
+
+def findRecordOffsets(mappedData, dataLength:int, scanSize:int=scanSize):
+    '''
+    Finds the start of every record by taking every fourth line break. The scan runs over windows of the map so that the
+    temporary arrays stay small.
+    :return: tuple of (array('Q') of record starts with the end of the record content appended, whether the final record was missing lines)
+    '''
+    import array
+    import numpy
+    recordOffsets = array.array("Q")
+    contentEnd = dataLength
+    tailStart = max(0, dataLength - 65536)
+    while contentEnd > 0:
+        tail = bytes(mappedData[tailStart:contentEnd])
+        strippedLength = len(tail.rstrip(b"\r\n"))
+        contentEnd = tailStart + strippedLength
+        if strippedLength or tailStart == 0:
+            break
+        tailStart = max(0, tailStart - 65536)
+    if not contentEnd:
+        recordOffsets.append(0)
+        return recordOffsets, False
+    recordOffsets.append(0)
+    lineBreaksSeen = 0
+    for windowStart in range(0, contentEnd, scanSize):
+        window = numpy.frombuffer(mappedData, dtype="uint8", count=min(scanSize, contentEnd - windowStart), offset=windowStart)
+        lineBreaks = numpy.flatnonzero(window == 10)
+        firstRecordBreak = (3 - lineBreaksSeen) % 4  #the fourth line break of each record ends it
+        recordEnds = lineBreaks[firstRecordBreak::4] + windowStart + 1
+        recordOffsets.frombytes(recordEnds.astype("uint64").tobytes())
+        lineBreaksSeen += len(lineBreaks)
+    lineCount = lineBreaksSeen + 1
+    truncated = bool(lineCount % 4)
+    if recordOffsets[-1] < contentEnd:
+        recordOffsets.append(contentEnd)
+    return recordOffsets, truncated
+
+
+class MappedFastq(object):
+    '''
+    Random access to the records of an uncompressed fastq file. len() gives the record count, indexing gives a
+    FastqRecordView, and lineBatch hands back raw lines for any run of records in the same layout as the block reader.
+    '''
+
+    def __init__(self, path:str, persistIndex:bool=False):
+        import mmap
+        from .. import compressionCodecs
+        self.path = path
+        if not os.path.isfile(path):
+            logger.critical("Unable to find fastq file at %s" %path)
+            raise FileNotFoundError("Unable to find fastq file at %s" %path)
+        if compressionCodecs.isCompressed(path):
+            raise ValueError("Memory-mapped reading is only possible for uncompressed fastq files. %s is compressed." %path)
+        self.fileSize = os.path.getsize(path)
+        self.filehandle = open(path, "rb")
+        if self.fileSize:
+            self.map = mmap.mmap(self.filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.map = b""
+        self.truncated = False
+        self.recordOffsets = self.loadOffsetIndex()
+        if self.recordOffsets is None:
+            self.recordOffsets, self.truncated = findRecordOffsets(self.map, self.fileSize)
+            if persistIndex:
+                self.saveOffsetIndex()
+        if self.truncated:
+            logger.error("Fastq file at %s appears to me missing lines (found something not a multiple of 4." %self.path)
+        self.open = True
+
+    def indexKey(self):
+        import struct
+        fileStats = os.stat(self.path)
+        return struct.pack("<QQ", fileStats.st_size, fileStats.st_mtime_ns)
+
+    def loadOffsetIndex(self):
+        import array
+        if not os.path.isfile(offsetIndexPath(self.path)):
+            return None
+        file = open(offsetIndexPath(self.path), "rb")
+        key = file.read(16)
+        data = file.read()
+        file.close()
+        if not key == self.indexKey() or len(data) % 8:
+            logger.debug("Ignoring stale record offset index at %s" %offsetIndexPath(self.path))
+            return None
+        recordOffsets = array.array("Q")
+        recordOffsets.frombytes(data)
+        return recordOffsets
+
+    def saveOffsetIndex(self):
+        temporaryPath = "%s.%s.tmp" %(offsetIndexPath(self.path), os.getpid())
+        try:
+            file = open(temporaryPath, "wb")
+            file.write(self.indexKey())
+            file.write(self.recordOffsets.tobytes())
+            file.close()
+            os.replace(temporaryPath, offsetIndexPath(self.path))
+        except OSError as error:
+            logger.debug("Unable to write record offset index for %s: %s" %(self.path, error))
+            if os.path.isfile(temporaryPath):
+                os.remove(temporaryPath)
+            return False
+        return True
+
+    def recordBytes(self, index:int):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Record %s is out of range for %s with %s records" %(index, self.path, len(self)))
+        return self.map[self.recordOffsets[index]:self.recordOffsets[index + 1]]
+
+    def lineBatch(self, start:int, stop:int):
+        '''
+        :return: raw lines for records start through stop - 1, four lines per record
+        '''
+        stop = min(stop, len(self))
+        if start >= stop:
+            return []
+        block = self.map[self.recordOffsets[start]:self.recordOffsets[stop]]
+        if b"\r" in block:
+            block = block.replace(b"\r\n", b"\n")
+        lines = block.split(b"\n")
+        if not lines[-1]:
+            del lines[-1]
+        while len(lines) < (stop - start) * 4:  #only a truncated final record can come up short
+            lines.append(b"")
+        return lines
+
+    def __getitem__(self, index:int):
+        from .fastqBlockReader import FastqRecordView
+        if index < 0:
+            index += len(self)
+        return FastqRecordView(*self.lineBatch(index, index + 1))
+
+    def __len__(self):
+        return len(self.recordOffsets) - 1
+
+    def sampleIndices(self, sampleSize:int, seed:int=None):
+        import random
+        sampleSize = min(sampleSize, len(self))
+        return sorted(random.Random(seed).sample(range(len(self)), sampleSize))
+
+    def sample(self, sampleSize:int, seed:int=None):
+        return [self[index] for index in self.sampleIndices(sampleSize, seed)]
+
+    def iterLineBatches(self, recordsPerBatch:int=50000):
+        for start in range(0, len(self), recordsPerBatch):
+            yield self.lineBatch(start, start + recordsPerBatch)
+
+    def close(self):
+        if self.open and self.fileSize:
+            self.map.close()
+        if not self.filehandle.closed:
+            self.filehandle.close()
+        self.open = False
+
+    @property
+    def closed(self):
+        return not self.open
+
+    def __iter__(self):
+        from .fastqBlockReader import FastqRecordView
+        for lines in self.iterLineBatches():
+            for record in map(FastqRecordView, lines[0::4], lines[1::4], lines[2::4], lines[3::4]):
+                yield record
+
+    def __str__(self):
+        return "Memory-mapped fastq file at %s with %s records" %(self.path, len(self))
@@ -0,0 +1,263 @@
+'''
+Parallel counting and validation of uncompressed fastq files. Each file is split into byte ranges that are moved forward
+to the next record boundary, and the ranges are handled in a process pool. Paired-end sets are validated as aligned
+chunk pairs: chunks are planned on paired-end 1 by byte offset, and each paired-end 2 chunk is located by record index
+starting from the nearest of its own boundaries, so every record is still checked against its own mate.
+Compressed files cannot be entered at arbitrary offsets. A single gzipped file with a multi-checkpoint index (see
+fastqGzipIndex) is split at its checkpoints instead, and anything else compressed goes through the single-pass scanner.
+'''
+import os
+import logging
+logger = logging.getLogger(__name__)
+from . import fastqBlockReader
+
+defaultMinimumChunkSize = 4 * 1024 * 1024
+boundarySearchSize = 64 * 1024
+
+
+def defaultWorkerCount():
+    return os.cpu_count() or 1
+
+
+def findChunkBoundary(file, offset:int, fileSize:int):
+    '''
+    Moves an arbitrary byte offset forward to the start of the next record in an open binary fastq file.
+    :return: byte offset of the record start, or the file size if no record starts after the offset
+    '''
+    if offset <= 0:
+        return 0
+    searchSize = boundarySearchSize
+    while True:
+        file.seek(offset - 1)  #starting one byte early shows whether the offset already sits at the start of a line
+        data = file.read(searchSize + 1)
+        recordStart = fastqBlockReader.findRecordStart(data, 1)
+        if recordStart >= 0:
+            return offset - 1 + recordStart
+        if offset - 1 + len(data) >= fileSize:
+            return fileSize
+        searchSize *= 2
+
+
+def planChunks(path:str, chunkCount:int, minimumChunkSize:int=defaultMinimumChunkSize):
+    '''
+    Splits an uncompressed fastq file into up to chunkCount byte ranges that each begin on a record boundary.
+    :return: list of (start, end) byte offsets covering the whole file
+    '''
+    fileSize = os.path.getsize(path)
+    chunkCount = max(1, min(chunkCount, fileSize // max(minimumChunkSize, 1)))
+    boundaries = [0]
+    file = open(path, "rb")
+    for chunk in range(1, chunkCount):
+        boundary = findChunkBoundary(file, (fileSize * chunk) // chunkCount, fileSize)
+        if boundaries[-1] < boundary < fileSize:
+            boundaries.append(boundary)
+    file.close()
+    boundaries.append(fileSize)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def findRecordOffset(path:str, startOffset:int, skipRecords:int, blockSize:int=fastqBlockReader.defaultBlockSize):
+    '''
+    Finds the byte offset of the record that is skipRecords records past a record boundary by counting line breaks,
+    without splitting or parsing any of the skipped lines.
+    '''
+    linesToSkip = skipRecords * 4
+    offset = startOffset
+    if not linesToSkip:
+        return offset
+    file = open(path, "rb")
+    file.seek(startOffset)
+    while linesToSkip:
+        block = file.read(blockSize)
+        if not block:
+            break
+        lineBreaks = block.count(b"\n")
+        if lineBreaks < linesToSkip:
+            linesToSkip -= lineBreaks
+            offset += len(block)
+            continue
+        position = -1
+        for line in range(linesToSkip):
+            position = block.find(b"\n", position + 1)
+        offset += position + 1
+        linesToSkip = 0
+    file.close()
+    return offset
+
+
+def recordRangeLineBatches(lineBatches, recordLimit:int):
+    '''
+    Passes along line batches until recordLimit records have been yielded.
+    '''
+    linesRemaining = recordLimit * 4
+    for lines in lineBatches:
+        if len(lines) >= linesRemaining:
+            if linesRemaining:
+                yield lines[:linesRemaining]
+            return
+        linesRemaining -= len(lines)
+        yield lines
+
+
+def countChunk(path:str, byteRange:tuple):
+    return fastqBlockReader.FastqBlockReader(path, byteRange=byteRange).countRecords()
+
+
+def validateChunk(path:str, byteRange:tuple, fullValidation:bool=True):
+    '''
+    :return: tuple of (valid records read, error message or None)
+    '''
+    from . import fastqScanner
+    validator = fastqScanner.FormatValidator(fullValidation, logErrors=False)
+    reader = fastqBlockReader.FastqBlockReader(path, byteRange=byteRange)
+    for lines in reader.iterLineBatches():
+        validator.consumeLines(lines)
+        if validator.finished:
+            break
+    reader.close()
+    if validator.error:
+        return validator.readCount, str(validator.error)
+    return validator.readCount, None
+
+
+def validateCheckpointRange(path:str, checkpointValues:list, recordCount:int, fullValidation:bool=True):
+    '''
+    Validates the records between two checkpoints of an indexed gzipped fastq.
+    :return: tuple of (valid records read, error message or None)
+    '''
+    from . import fastqScanner, fastqGzipIndex
+    validator = fastqScanner.FormatValidator(fullValidation, logErrors=False)
+    checkpoint = fastqGzipIndex.GzipCheckpoint(*checkpointValues)
+    for lines in fastqGzipIndex.iterLineBatchesFromCheckpoint(path, checkpoint, recordCount):
+        validator.consumeLines(lines)
+        if validator.finished:
+            break
+    if validator.error:
+        return validator.readCount, str(validator.error)
+    if not validator.readCount == recordCount:
+        return validator.readCount, "Expected %s records from %s but found %s. The gzip index may not match the file." %(recordCount, checkpoint, validator.readCount)
+    return validator.readCount, None
+
+
+def validatePairChunk(pe1Path:str, pe1Range:tuple, pe2Path:str, pe2BoundaryOffset:int, pe2SkipRecords:int, recordCount:int):
+    '''
+    Validates one paired-end 1 chunk against the same records from paired-end 2. The paired-end 2 records are found by
+    skipping forward from the nearest paired-end 2 chunk boundary at or before them.
+    :return: tuple of (valid pairs read, error message or None)
+    '''
+    from . import fastqScanner
+    validator = fastqScanner.PairValidator(logErrors=False)
+    pe2Start = findRecordOffset(pe2Path, pe2BoundaryOffset, pe2SkipRecords)
+    pe1Reader = fastqBlockReader.FastqBlockReader(pe1Path, byteRange=pe1Range)
+    pe2Reader = fastqBlockReader.FastqBlockReader(pe2Path, byteRange=(pe2Start, os.path.getsize(pe2Path)))
+    pe2Batches = recordRangeLineBatches(pe2Reader.iterLineBatches(), recordCount)
+    for pe1Lines, pe2Lines in fastqScanner.alignLineBatchIterators(pe1Reader.iterLineBatches(), pe2Batches):
+        validator.consumeLinePairs(pe1Lines, pe2Lines)
+        if validator.finished:
+            break
+    pe1Reader.close()
+    pe2Reader.close()
+    if validator.error:
+        return validator.readCount, str(validator.error)
+    return validator.readCount, None
+
+
+def mergeChunkResults(description:str, chunkResults:list, maxErrors:int=10):
+    '''
+    Combines per-chunk (readCount, error) results into the usual validation contract.
+    :return: False if any chunk reported an error, otherwise the total read count
+    '''
+    readCount = 0
+    errors = []
+    for chunkNumber, (chunkReadCount, error) in enumerate(chunkResults):
+        readCount += chunkReadCount
+        if error:
+            errors.append((chunkNumber, error))
+    if not errors:
+        return readCount
+    for chunkNumber, error in errors[:maxErrors]:
+        logger.error("Validation error in chunk %s of %s for %s: %s" %(chunkNumber + 1, len(chunkResults), description, error))
+    if len(errors) > maxErrors:
+        logger.error("%s more chunks of %s had validation errors that were not shown." %(len(errors) - maxErrors, description))
+    return False
+
+
+def anyCompressed(*paths):
+    from .. import compressionCodecs
+    for path in paths:
+        if compressionCodecs.isCompressed(path):
+            return True
+    return False
+
+
+def mapInProcessPool(workers:int, function, *iterables):
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, *iterables))
+
+
+def countReadsParallel(path:str, workers:int=None, chunksPerWorker:int=4, minimumChunkSize:int=defaultMinimumChunkSize):
+    if workers is None:
+        workers = defaultWorkerCount()
+    if anyCompressed(path):
+        from .fastqHandler import countReads
+        return countReads(path)
+    chunks = planChunks(path, workers * chunksPerWorker, minimumChunkSize)
+    return sum(mapInProcessPool(workers, countChunk, [path] * len(chunks), chunks))
+
+
+def validFastqFileParallel(path:str, workers:int=None, chunksPerWorker:int=4, minimumChunkSize:int=defaultMinimumChunkSize, maxErrors:int=10):
+    '''
+    Validates an uncompressed fastq file in chunks across a process pool.
+    :return: False if the file failed validation, otherwise its read count
+    '''
+    from . import fastqScanner
+    if workers is None:
+        workers = defaultWorkerCount()
+    if anyCompressed(path):
+        from . import fastqGzipIndex
+        index = fastqGzipIndex.loadIndex(path)
+        if not index or len(index.checkpoints) < 2:
+            return fastqScanner.scanFastq(path, [fastqScanner.FormatValidator()]).validation
+        checkpointRanges = index.checkpointRecordRanges()
+        checkpointValues = [checkpoint.toList() for checkpoint, recordCount in checkpointRanges]
+        recordCounts = [recordCount for checkpoint, recordCount in checkpointRanges]
+        chunkResults = mapInProcessPool(workers, validateCheckpointRange, [path] * len(checkpointRanges), checkpointValues, recordCounts)
+        return mergeChunkResults(path, chunkResults, maxErrors)
+    chunks = planChunks(path, workers * chunksPerWorker, minimumChunkSize)
+    chunkResults = mapInProcessPool(workers, validateChunk, [path] * len(chunks), chunks)
+    return mergeChunkResults(path, chunkResults, maxErrors)
+
+
+def validFastqPairParallel(pe1Path:str, pe2Path:str, workers:int=None, chunksPerWorker:int=4, minimumChunkSize:int=defaultMinimumChunkSize, maxErrors:int=10):
+    '''
+    Validates an uncompressed paired-end set in aligned chunk pairs across a process pool. Both files are first counted
+    chunk by chunk, which catches mismatched read counts before any parsing and gives the record index at each chunk
+    boundary. Each paired-end 1 chunk is then validated alongside the same span of records from paired-end 2.
+    :return: False if the pair failed validation, otherwise the number of read pairs
+    '''
+    import bisect
+    from . import fastqScanner
+    if workers is None:
+        workers = defaultWorkerCount()
+    if anyCompressed(pe1Path, pe2Path):
+        return fastqScanner.scanFastqPair(pe1Path, pe2Path, [], [], [fastqScanner.PairValidator()]).pairValidation
+    pe1Chunks = planChunks(pe1Path, workers * chunksPerWorker, minimumChunkSize)
+    pe2Chunks = planChunks(pe2Path, workers * chunksPerWorker, minimumChunkSize)
+    paths = [pe1Path] * len(pe1Chunks) + [pe2Path] * len(pe2Chunks)
+    chunkCounts = mapInProcessPool(workers, countChunk, paths, pe1Chunks + pe2Chunks)
+    pe1Counts = chunkCounts[:len(pe1Chunks)]
+    pe2Counts = chunkCounts[len(pe1Chunks):]
+    if not sum(pe1Counts) == sum(pe2Counts):
+        logger.error("Reached end of one paired-end file before the other. %s has %s reads and %s has %s." %(pe1Path, sum(pe1Counts), pe2Path, sum(pe2Counts)))
+        return False
+    pe1FirstRecords = [sum(pe1Counts[:chunk]) for chunk in range(len(pe1Chunks))]
+    pe2FirstRecords = [sum(pe2Counts[:chunk]) for chunk in range(len(pe2Chunks))]
+    pe2BoundaryOffsets = []
+    pe2SkipRecords = []
+    for firstRecord in pe1FirstRecords:
+        pe2Chunk = bisect.bisect_right(pe2FirstRecords, firstRecord) - 1
+        pe2BoundaryOffsets.append(pe2Chunks[pe2Chunk][0])
+        pe2SkipRecords.append(firstRecord - pe2FirstRecords[pe2Chunk])
+    chunkResults = mapInProcessPool(workers, validatePairChunk, [pe1Path] * len(pe1Chunks), pe1Chunks, [pe2Path] * len(pe1Chunks), pe2BoundaryOffsets, pe2SkipRecords, pe1Counts)
+    return mergeChunkResults("%s and %s" %(pe1Path, pe2Path), chunkResults, maxErrors)
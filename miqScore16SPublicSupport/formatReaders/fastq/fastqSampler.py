@@ -0,0 +1,323 @@
+'''
+Uniform sampling of reads from anywhere in a fastq file, for estimating read lengths and quality profiles without the
+bias of looking only at the first reads (which come from the first tiles, and in sorted files may not look like the rest
+of the file at all).
+Plain files are sampled by seeking to random byte offsets and taking the record each offset lands in, which costs a
+few small reads per sampled record however large the file is. An offset is more likely to land in a long record than a
+short one, so each record is weighted by the inverse of its size in bytes to put the estimates back on a per-read basis.
+Gzipped files with a current index (see fastqGzipIndex) are sampled by record number, decompressing only from the
+checkpoints before the chosen records. Anything else is reservoir sampled in a single streaming pass.
+'''
+import os
+import logging
+logger = logging.getLogger(__name__)
+from . import fastqBlockReader
+
+defaultSampleSize = 2000
+defaultWindowBytes = 16 * 1024
+maximumWindowBytes = 16 * 1024 * 1024
+confidenceZ = 1.96  #95% confidence bounds
+seekMethod = "seek"
+gzipIndexMethod = "gzipIndex"
+reservoirMethod = "reservoir"
+
+
+def wilsonInterval(fraction, sampleSize, z:float=confidenceZ):
+    '''
+    Wilson score interval for a proportion, which stays within 0 and 1 and behaves for proportions near either end.
+    :return: tuple of (lower bound, upper bound)
+    '''
+    import numpy
+    fraction = numpy.asarray(fraction, dtype="float64")
+    if not sampleSize:
+        return numpy.zeros_like(fraction), numpy.ones_like(fraction)
+    denominator = 1 + z * z / sampleSize
+    center = (fraction + z * z / (2 * sampleSize)) / denominator
+    halfWidth = z * numpy.sqrt(fraction * (1 - fraction) / sampleSize + z * z / (4 * sampleSize * sampleSize)) / denominator
+    return numpy.maximum(center - halfWidth, 0.0), numpy.minimum(center + halfWidth, 1.0)
+
+
+class ReadSample(object):
+    '''
+    Lengths and quality strings of a sample of reads, with the weight each read carries in the estimates. Weights are
+    all one for the index and reservoir methods. Bounds use the effective sample size given by the weights.
+    '''
+
+    def __init__(self, path:str, method:str, lengths:list, qualities:list, weights:list=None, encoding=None):
+        import numpy
+        self.path = path
+        self.method = method
+        self.lengths = numpy.array(lengths, dtype="int64")
+        self.qualities = qualities
+        if weights is None:
+            weights = numpy.ones(len(lengths))
+        self.weights = numpy.array(weights, dtype="float64")
+        if len(self.weights):
+            self.weights /= self.weights.max()  #only relative weights matter, and these keep the sums well scaled
+        if encoding is None:
+            from .fastqHandler import findQualityScoreEncoding
+            encoding = findQualityScoreEncoding(path)
+        self.encoding = encoding
+
+    @property
+    def sampleSize(self):
+        return len(self.lengths)
+
+    @property
+    def effectiveSampleSize(self):
+        weightSquaredTotal = float((self.weights ** 2).sum())
+        if not weightSquaredTotal:
+            return 0.0
+        return float(self.weights.sum()) ** 2 / weightSquaredTotal
+
+    @property
+    def maxLength(self):
+        if not self.sampleSize:
+            return 0
+        return int(self.lengths.max())
+
+    @property
+    def longerReadFractionBound(self):
+        '''
+        Upper 95% bound on the fraction of reads in the file longer than maxLength (the rule of three).
+        '''
+        if not self.sampleSize:
+            return 1.0
+        return min(3.0 / self.effectiveSampleSize, 1.0)
+
+    def meanLength(self):
+        '''
+        :return: tuple of (mean read length, lower bound, upper bound)
+        '''
+        import math
+        if not self.sampleSize:
+            return 0.0, 0.0, 0.0
+        mean = float((self.weights * self.lengths).sum() / self.weights.sum())
+        standardError = math.sqrt(self.lengthVariance() / self.effectiveSampleSize)
+        return mean, mean - confidenceZ * standardError, mean + confidenceZ * standardError
+
+    def lengthVariance(self):
+        '''
+        Weighted variance of read lengths, corrected for sample size the same way statistics.variance is for equal
+        weights.
+        '''
+        if self.sampleSize < 2 or self.lengths.min() == self.lengths.max():
+            return 0.0
+        weightTotal = float(self.weights.sum())
+        mean = float((self.weights * self.lengths).sum()) / weightTotal
+        squaredDeviationTotal = float((self.weights * (self.lengths - mean) ** 2).sum())
+        correctedTotal = weightTotal - float((self.weights ** 2).sum()) / weightTotal
+        if correctedTotal <= 0:
+            return 0.0
+        return squaredDeviationTotal / correctedTotal
+
+    def lengthDistribution(self):
+        '''
+        :return: dictionary of read length to (estimated fraction of reads, lower bound, upper bound)
+        '''
+        import numpy
+        if not self.sampleSize:
+            return {}
+        lengths, inverse = numpy.unique(self.lengths, return_inverse=True)
+        fractions = numpy.bincount(inverse, weights=self.weights) / self.weights.sum()
+        lowerBounds, upperBounds = wilsonInterval(fractions, self.effectiveSampleSize)
+        return {int(length): (float(fraction), float(lower), float(upper)) for length, fraction, lower, upper in zip(lengths, fractions, lowerBounds, upperBounds)}
+
+    def qualityProfile(self):
+        '''
+        Mean phred score at each read position across the reads long enough to reach it.
+        :return: dictionary of numpy arrays indexed by position: means, lower and upper bounds, and the number of
+        sampled reads covering the position
+        '''
+        import numpy
+        from .. import qualityScore
+        qualityStrings = [qualityScore.qualityScoreHandler.qualityBytes(quality) for quality in self.qualities]
+        lengths = numpy.fromiter(map(len, qualityStrings), dtype="int64", count=len(qualityStrings))
+        longest = int(lengths.max()) if len(lengths) else 0
+        scores = numpy.frombuffer(b"".join(qualityStrings), dtype="uint8").astype("float64") - self.encoding.base
+        readStarts = numpy.cumsum(lengths) - lengths
+        positions = numpy.arange(len(scores)) - numpy.repeat(readStarts, lengths)
+        baseWeights = numpy.repeat(self.weights, lengths)
+        weightTotals = numpy.bincount(positions, weights=baseWeights, minlength=longest)
+        weightSquaredTotals = numpy.bincount(positions, weights=baseWeights ** 2, minlength=longest)
+        scoreTotals = numpy.bincount(positions, weights=baseWeights * scores, minlength=longest)
+        squaredScoreTotals = numpy.bincount(positions, weights=baseWeights * scores * scores, minlength=longest)
+        readsCovering = numpy.bincount(positions, minlength=longest)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            means = scoreTotals / weightTotals
+            variances = numpy.maximum(squaredScoreTotals / weightTotals - means * means, 0.0)
+            effectiveSizes = weightTotals ** 2 / weightSquaredTotals
+            standardErrors = numpy.sqrt(variances / effectiveSizes)
+        return {"means": means,
+                "lower": means - confidenceZ * standardErrors,
+                "upper": means + confidenceZ * standardErrors,
+                "readsCovering": readsCovering}
+
+    def __len__(self):
+        return self.sampleSize
+
+    def __str__(self):
+        return "Sample of %s reads from %s by %s (effective size %.0f)" %(self.sampleSize, self.path, self.method, self.effectiveSampleSize)
+
+
+def recordAt(data:bytes, recordStart:int, atEndOfFile:bool):
+    '''
+    :return: tuple of (offset just past the record including its final line break, sequence, quality), or None if the
+    record runs past the end of data
+    '''
+    lineEnds = []
+    lineStart = recordStart
+    for lineNumber in range(4):
+        lineEnd = data.find(b"\n", lineStart)
+        if lineEnd == -1:
+            if not (atEndOfFile and lineNumber == 3 and lineStart < len(data)):
+                return None
+            lineEnd = len(data)
+        lineEnds.append(lineEnd)
+        lineStart = lineEnd + 1
+    sequence = data[lineEnds[0] + 1:lineEnds[1]].rstrip(b"\r")
+    quality = data[lineEnds[2] + 1:lineEnds[3]].rstrip(b"\r")
+    return min(lineEnds[3] + 1, len(data)), sequence, quality
+
+
+def recordContainingOffset(file, fileSize:int, offset:int, windowBytes:int=defaultWindowBytes):
+    '''
+    Finds the record that a byte offset falls in, reading a window around the offset and resyncing on record boundaries
+    from the start of the window. The window is widened until it holds a record boundary before the offset and the end
+    of the record.
+    :return: tuple of (record size in bytes, sequence, quality), or None for an offset in an incomplete final record
+    '''
+    while windowBytes <= maximumWindowBytes:
+        windowStart = max(0, offset - windowBytes)
+        file.seek(windowStart)
+        data = file.read(offset - windowStart + windowBytes)
+        atEndOfFile = windowStart + len(data) >= fileSize
+        recordStart = 0 if windowStart == 0 else fastqBlockReader.findRecordStart(data, 1)  #the window may start mid-line
+        relativeOffset = offset - windowStart
+        while 0 <= recordStart <= relativeOffset:
+            record = recordAt(data, recordStart, atEndOfFile)
+            if record is None:
+                if atEndOfFile:
+                    return None
+                break
+            recordEnd, sequence, quality = record
+            if relativeOffset < recordEnd:
+                return recordEnd - recordStart, sequence, quality
+            recordStart = recordEnd
+        if atEndOfFile and windowStart == 0:
+            return None
+        windowBytes *= 2
+    raise ValueError("Unable to find a fastq record around offset %s in %s within %s bytes" %(offset, file.name, maximumWindowBytes))
+
+
+def sampleBySeeking(path:str, sampleSize:int=defaultSampleSize, seed:int=0, windowBytes:int=defaultWindowBytes):
+    '''
+    Samples an uncompressed fastq by seeking to uniformly random byte offsets. Records are drawn with replacement and
+    with probability proportional to their size, which the weights undo.
+    '''
+    import random
+    fileSize = os.path.getsize(path)
+    lengths, qualities, weights = [], [], []
+    if not fileSize:
+        return ReadSample(path, seekMethod, lengths, qualities, weights)
+    randomGenerator = random.Random(seed)
+    offsets = sorted([randomGenerator.randrange(fileSize) for i in range(sampleSize)])
+    file = open(path, "rb")
+    for offset in offsets:
+        record = recordContainingOffset(file, fileSize, offset, windowBytes)
+        if record is None:
+            continue
+        recordBytes, sequence, quality = record
+        lengths.append(len(sequence))
+        qualities.append(quality)
+        weights.append(1.0 / recordBytes)
+    file.close()
+    return ReadSample(path, seekMethod, lengths, qualities, weights)
+
+
+def sampleFromGzipIndex(path:str, index, sampleSize:int=defaultSampleSize, seed:int=0):
+    '''
+    Samples a gzipped fastq by record number using its checkpoint index. Each checkpoint holding chosen records is
+    decompressed only as far as its last chosen record, so cost follows the checkpoint spacing rather than file size
+    for multi-member files. A single-member gzip file has one checkpoint and is read up to the last chosen record.
+    '''
+    from . import fastqGzipIndex
+    from .fastqDownsampler import chooseRecordIndices, selectedRecordLines
+    selectedIndices = chooseRecordIndices(index.totalRecords, sampleSize, seed)
+    lengths, qualities = [], []
+    selectionPosition = 0
+    for checkpoint, recordCount in index.checkpointRecordRanges():
+        checkpointEnd = checkpoint.recordIndex + recordCount
+        lastSelected = selectionPosition
+        while lastSelected < len(selectedIndices) and selectedIndices[lastSelected] < checkpointEnd:
+            lastSelected += 1
+        if lastSelected == selectionPosition:
+            continue
+        batchStart = checkpoint.recordIndex
+        recordLimit = selectedIndices[lastSelected - 1] - checkpoint.recordIndex + 1
+        for lines in fastqGzipIndex.iterLineBatchesFromCheckpoint(path, checkpoint, recordLimit):
+            keptLines, selectionPosition = selectedRecordLines(lines, batchStart, selectedIndices, selectionPosition)
+            lengths.extend([len(sequence.rstrip(b"\r")) for sequence in keptLines[1::4]])
+            qualities.extend([quality.rstrip(b"\r") for quality in keptLines[3::4]])
+            batchStart += len(lines) // 4
+        selectionPosition = lastSelected
+    return ReadSample(path, gzipIndexMethod, lengths, qualities)
+
+
+def sampleByReservoir(path:str, sampleSize:int=defaultSampleSize, seed:int=0):
+    '''
+    Samples any fastq in one streaming pass, keeping a uniform sample of sampleSize records without replacement
+    (Algorithm R, with the replacement draws for each batch made at once).
+    '''
+    import numpy
+    randomGenerator = numpy.random.RandomState(seed)
+    reservoir = []
+    recordsSeen = 0
+    reader = fastqBlockReader.FastqBlockReader(path)
+    for lines in reader.iterLineBatches():
+        records = list(zip(lines[1::4], lines[3::4]))
+        fillCount = max(min(sampleSize - len(reservoir), len(records)), 0)
+        reservoir.extend(records[:fillCount])
+        recordIndices = numpy.arange(recordsSeen + fillCount, recordsSeen + len(records))
+        slots = (randomGenerator.random_sample(len(recordIndices)) * (recordIndices + 1)).astype("int64")
+        for recordNumber, slot in zip(numpy.flatnonzero(slots < sampleSize).tolist(), slots[slots < sampleSize].tolist()):
+            reservoir[slot] = records[fillCount + recordNumber]
+        recordsSeen += len(records)
+    reader.close()
+    lengths = [len(sequence.rstrip(b"\r")) for sequence, quality in reservoir]
+    qualities = [quality.rstrip(b"\r") for sequence, quality in reservoir]
+    return ReadSample(path, reservoirMethod, lengths, qualities)
+
+
+def cheapToSample(path:str, useIndex:bool=True):
+    '''
+    :return: True if sampleReads can draw from the file without reading all of it, which is the case for plain files
+    and for gzipped files with a current checkpoint index
+    '''
+    from .. import compressionCodecs
+    from . import fastqGzipIndex
+    codec = compressionCodecs.sniffCodec(path)
+    if codec == compressionCodecs.plain:
+        return True
+    return useIndex and compressionCodecs.isGzipCodec(codec) and fastqGzipIndex.loadIndex(path) is not None
+
+
+def sampleReads(path:str, sampleSize:int=defaultSampleSize, seed:int=0, useIndex:bool=True):
+    '''
+    Draws a uniform sample of reads from anywhere in a fastq file, picking the cheapest method the file allows.
+    :param path: path to the fastq file
+    :param sampleSize: number of reads to sample
+    :param seed: seed for the random draws, so the same file and seed always give the same sample
+    :param useIndex: sample gzipped files through their checkpoint index when they have a current one
+    :return: ReadSample object
+    '''
+    from .. import compressionCodecs
+    from . import fastqGzipIndex
+    codec = compressionCodecs.sniffCodec(path)
+    if codec == compressionCodecs.plain:
+        return sampleBySeeking(path, sampleSize, seed)
+    if useIndex and compressionCodecs.isGzipCodec(codec):
+        index = fastqGzipIndex.loadIndex(path)
+        if index:
+            return sampleFromGzipIndex(path, index, sampleSize, seed)
+    return sampleByReservoir(path, sampleSize, seed)
@@ -0,0 +1,467 @@
+'''
+Single-pass scanning of fastq files. A scan decompresses a file (or a pair of files) exactly once and hands every batch
+of lines to each registered consumer, so that counting, validation, length and quality histograms, encoding detection
+and checksums no longer each need their own full pass through a gzipped file.
+Batches arrive as lists of raw lines whose length is a multiple of four (lines[1::4] are the sequences and lines[3::4]
+the quality strings for the batch).
+'''
+import logging
+logger = logging.getLogger(__name__)
+from . import fastqBlockReader
+
+
+class ScanConsumer(object):
+
+    name = "consumer"
+    usesRawBytes = False
+    diagnostics = None  #consumers that check records can set a DiagnosticsCollector, summarized when the scan ends
+    stopsScan = False  #set by a consumer whose result makes the rest of the scan pointless, ending it for every consumer
+
+    def __init__(self):
+        self.finished = False
+
+    def consumeRawBytes(self, data:bytes):
+        pass
+
+    def consumeLines(self, lines:list):
+        raise RuntimeError("This was always meant to be overridden and should not be getting hit during the program.  This is a bug.")
+
+    def result(self):
+        raise RuntimeError("This was always meant to be overridden and should not be getting hit during the program.  This is a bug.")
+
+
+class PairScanConsumer(ScanConsumer):
+
+    def consumeLines(self, lines:list):
+        raise RuntimeError("Pair consumers take batches from both mates through consumeLinePairs.")
+
+    def consumeLinePairs(self, pe1Lines:list, pe2Lines:list):
+        raise RuntimeError("This was always meant to be overridden and should not be getting hit during the program.  This is a bug.")
+
+
+class ReadCounter(ScanConsumer):
+
+    name = "readCount"
+
+    def __init__(self, maxReads:int=0):
+        super().__init__()
+        self.readCount = 0
+        self.maxReads = maxReads
+
+    def consumeLines(self, lines:list):
+        self.readCount += len(lines) // 4
+        if self.maxReads and self.readCount > self.maxReads:
+            self.finished = True  #the count is only known to be more than maxReads from here
+
+    def result(self):
+        return self.readCount
+
+
+validReason = "valid"
+emptyReason = "empty"
+formatErrorReason = "formatError"
+readBudgetReason = "readBudgetExceeded"
+
+
+class ValidationResult(object):
+    '''
+    Outcome of a validation scan that says why it stopped. Truthy only when the file (or pair) is valid, has reads and
+    stayed within the read budget. When the budget was exceeded, readCount is how far the scan got before stopping
+    (more than maxReads, but not the file's total).
+    '''
+
+    def __init__(self, path:[str, tuple], reason:str, readCount:int, message:str="", maxReads:int=0, errorCount:int=0):
+        self.path = path
+        self.reason = reason
+        self.readCount = readCount
+        self.message = message
+        self.maxReads = maxReads
+        self.errorCount = errorCount
+
+    @property
+    def valid(self):
+        return self.reason == validReason
+
+    def __bool__(self):
+        return self.valid
+
+    def __str__(self):
+        if self.valid:
+            return "%s is valid with %s reads" %(self.path, self.readCount)
+        return "%s failed validation (%s): %s" %(self.path, self.reason, self.message)
+
+
+class ValidationState(object):
+    '''
+    Error and read budget handling shared by the format and pair validators. With failFast the validator stops at the
+    first error; without it the first error is kept and reads go on being counted (but not validated) to the end. With
+    stopScan, a failure that stops the validator also ends the scan for every other consumer, so that checksums and
+    counts are not finished for a file that is about to be rejected.
+    '''
+
+    def setupValidation(self, logErrors:bool, maxReads:int, failFast:bool, stopScan:bool=False):
+        from ..diagnostics import DiagnosticsCollector
+        self.diagnostics = DiagnosticsCollector()
+        self.logErrors = logErrors
+        self.maxReads = maxReads
+        self.failFast = failFast
+        self.stopScan = stopScan
+        self.readCount = 0
+        self.error = None
+        self.errorCount = 0
+        self.budgetExceeded = False
+
+    def recordError(self, error:Exception):
+        if self.logErrors and self.error is None:
+            logger.error(error)
+        if self.error is None:
+            self.error = error
+        self.errorCount += 1
+        self.diagnostics.error(type(error).__name__, "%s", error)
+        if self.failFast:
+            self.finished = True
+            self.stopsScan = self.stopScan
+
+    def addReads(self, readCount:int):
+        self.readCount += readCount
+        if self.maxReads and self.readCount > self.maxReads:
+            self.budgetExceeded = True
+            self.finished = True
+            self.stopsScan = self.stopScan
+            if self.logErrors:
+                logger.error("Read budget of %s exceeded after %s reads" %(self.maxReads, self.readCount))
+
+    def result(self):
+        if self.error or self.budgetExceeded:
+            return False
+        return self.readCount
+
+    def validationResult(self, path:[str, tuple]):
+        if self.error:
+            return ValidationResult(path, formatErrorReason, self.readCount, str(self.error), self.maxReads, self.errorCount)
+        if self.budgetExceeded:
+            return ValidationResult(path, readBudgetReason, self.readCount, "More than %s reads" %self.maxReads, self.maxReads)
+        if not self.readCount:
+            return ValidationResult(path, emptyReason, 0, "No reads found", self.maxReads)
+        return ValidationResult(path, validReason, self.readCount, maxReads=self.maxReads)
+
+
+class FormatValidator(ValidationState, ScanConsumer):
+
+    name = "validation"
+
+    def __init__(self, fullValidation:bool=True, logErrors:bool=True, maxReads:int=0, failFast:bool=True, stopScan:bool=False):
+        from .fastqHeaders import HeaderValidator
+        super().__init__()
+        self.fullValidation = fullValidation
+        self.setupValidation(logErrors, maxReads, failFast, stopScan)
+        self.headerValidator = HeaderValidator(diagnostics=self.diagnostics)
+
+    @property
+    def tileCounts(self):
+        return self.headerValidator.readsPerTile()
+
+    def consumeLines(self, lines:list):
+        if self.finished:
+            return
+        if self.error:
+            self.addReads(len(lines) // 4)
+            return
+        try:
+            self.addReads(self.headerValidator.validateLines(lines, self.fullValidation))
+        except Exception as error:
+            self.recordError(error)
+            if not self.failFast:
+                self.addReads(len(lines) // 4)
+
+
+class PairValidator(ValidationState, PairScanConsumer):
+
+    name = "pairValidation"
+
+    def __init__(self, logErrors:bool=True, maxReads:int=0, failFast:bool=True, stopScan:bool=False):
+        from .fastqHeaders import HeaderValidator
+        super().__init__()
+        self.setupValidation(logErrors, maxReads, failFast, stopScan)
+        self.headerValidator = HeaderValidator(diagnostics=self.diagnostics)
+
+    @property
+    def tileCounts(self):
+        return self.headerValidator.readsPerTile()
+
+    def consumeLinePairs(self, pe1Lines:list, pe2Lines:list):
+        from .fastqHandler import FastqValidationError
+        if self.finished:
+            return
+        pairCount = min(len(pe1Lines), len(pe2Lines)) // 4
+        if self.error:
+            self.addReads(pairCount)
+        else:
+            try:
+                self.addReads(self.headerValidator.validatePairLines(pe1Lines, pe2Lines))
+            except Exception as error:
+                self.recordError(error)
+                if not self.failFast:
+                    self.addReads(pairCount)
+        if not len(pe1Lines) == len(pe2Lines) and not self.finished:
+            self.recordError(FastqValidationError("Reached end of one paired-end file before the other."))
+            self.finished = True  #nothing left to pair up
+
+
+class LengthHistogram(ScanConsumer):
+
+    name = "lengthHistogram"
+
+    def __init__(self):
+        import collections
+        super().__init__()
+        self.lengthCounts = collections.Counter()
+
+    def consumeLines(self, lines:list):
+        self.lengthCounts.update(map(len, lines[1::4]))
+
+    def result(self):
+        return dict(self.lengthCounts)
+
+
+class QualityHistogram(ScanConsumer):
+
+    name = "qualityHistogram"
+
+    def __init__(self):
+        import numpy
+        super().__init__()
+        self.characterCounts = numpy.zeros(256, dtype='int64')
+
+    def consumeLines(self, lines:list):
+        import numpy
+        qualityBytes = numpy.frombuffer(b"".join(lines[3::4]), dtype='uint8')
+        self.characterCounts += numpy.bincount(qualityBytes, minlength=256)
+
+    def result(self):
+        return self.characterCounts
+
+
+class EncodingDetector(ScanConsumer):
+
+    name = "encoding"
+
+    def __init__(self):
+        super().__init__()
+        self.lowestCharacter = 255
+        self.highestCharacter = 0
+
+    def consumeLines(self, lines:list):
+        qualityBytes = b"".join(lines[3::4])
+        if qualityBytes:
+            self.lowestCharacter = min(self.lowestCharacter, min(qualityBytes))
+            self.highestCharacter = max(self.highestCharacter, max(qualityBytes))
+
+    def result(self):
+        from .. import qualityScore
+        if self.lowestCharacter > self.highestCharacter:
+            return None
+        return qualityScore.qualityScoreHandler.findEncodingFromByteRange(self.lowestCharacter, self.highestCharacter)
+
+
+class Md5Hasher(ScanConsumer):
+
+    name = "md5"
+    usesRawBytes = True
+
+    def __init__(self):
+        import hashlib
+        super().__init__()
+        self.md5 = hashlib.md5()
+
+    def consumeRawBytes(self, data:bytes):
+        self.md5.update(data)
+
+    def consumeLines(self, lines:list):
+        pass
+
+    def result(self):
+        return self.md5.hexdigest()
+
+
+def defaultConsumers():
+    return [ReadCounter(), FormatValidator(), LengthHistogram(), QualityHistogram(), EncodingDetector(), Md5Hasher()]
+
+
+class ScanSummary(object):
+
+    def __init__(self, path:[str, tuple], results:dict, decompressionBackend:str=None):
+        self.path = path
+        self.results = results
+        self.decompressionBackend = decompressionBackend
+
+    def __getattr__(self, item):
+        if item in ("results", "decompressionBackend"):
+            raise AttributeError(item)
+        if item in self.results:
+            return self.results[item]
+        raise AttributeError("No consumer named %s was included in the scan of %s" %(item, self.path))
+
+    def __getitem__(self, item):
+        return self.results[item]
+
+    def __contains__(self, item):
+        return item in self.results
+
+    def __str__(self):
+        return "Scan summary for %s: %s" %(self.path, self.results)
+
+
+class PairScanSummary(ScanSummary):
+
+    def __init__(self, pe1Summary:ScanSummary, pe2Summary:ScanSummary, results:dict):
+        super().__init__((pe1Summary.path, pe2Summary.path), results)
+        self.pe1 = pe1Summary
+        self.pe2 = pe2Summary
+
+
+def openReader(path:str, consumers:list, blockSize:int=fastqBlockReader.defaultBlockSize):
+    rawObservers = [consumer.consumeRawBytes for consumer in consumers if consumer.usesRawBytes]
+    return fastqBlockReader.FastqBlockReader(path, blockSize=blockSize, rawObservers=rawObservers)
+
+
+def allFinished(consumers:list):
+    for consumer in consumers:
+        if not consumer.finished:
+            return False
+    return True
+
+
+def scanStopped(consumers:list):
+    for consumer in consumers:
+        if consumer.stopsScan:
+            return True
+    return False
+
+
+def collectResults(path:str, consumers:list):
+    results = {}
+    for consumer in consumers:
+        if consumer.name in results:
+            raise ValueError("Got two scan consumers named %s for %s. Consumer names must be unique within a scan." %(consumer.name, path))
+        results[consumer.name] = consumer.result()
+        emitDiagnostics(path, consumer)
+    return results
+
+
+def emitDiagnostics(path:str, consumer:ScanConsumer):
+    '''
+    Logs one summary of the issues a consumer found over the whole scan, in place of a line for every bad record.
+    '''
+    if consumer.diagnostics is None:
+        return
+    if not consumer.diagnostics.name:
+        consumer.diagnostics.name = "%s (%s)" %(path, consumer.name)
+    consumer.diagnostics.emitSummary()
+
+
+def scanFastq(path:str, consumers:list=None, blockSize:int=fastqBlockReader.defaultBlockSize):
+    '''
+    Decompresses and reads a fastq file once, feeding every batch of lines to each consumer.
+    :param path: path to the fastq file (plain or gzipped)
+    :param consumers: list of ScanConsumer objects, defaults to the full set from defaultConsumers
+    :param blockSize: bytes to read from the file at a time
+    :return: ScanSummary with each consumer's result under its name
+    '''
+    if consumers is None:
+        consumers = defaultConsumers()
+    reader = openReader(path, consumers, blockSize)
+    for lines in reader.iterLineBatches():
+        for consumer in consumers:
+            consumer.consumeLines(lines)
+        if allFinished(consumers) or scanStopped(consumers):
+            break
+    reader.close()
+    return ScanSummary(path, collectResults(path, consumers), reader.decompressionBackend)
+
+
+def alignedLineBatches(pe1Reader:fastqBlockReader.FastqBlockReader, pe2Reader:fastqBlockReader.FastqBlockReader):
+    '''
+    Zips line batches from two readers so that each yielded pair covers the same records from both mates. If one file
+    runs out first, its remaining partner lines are yielded against an empty list.
+    '''
+    return alignLineBatchIterators(pe1Reader.iterLineBatches(), pe2Reader.iterLineBatches())
+
+
+def alignLineBatchIterators(pe1Batches, pe2Batches):
+    pe1Batches = iter(pe1Batches)
+    pe2Batches = iter(pe2Batches)
+    pe1Lines = []
+    pe2Lines = []
+    while True:
+        if not pe1Lines:
+            pe1Lines = next(pe1Batches, None)
+        if not pe2Lines:
+            pe2Lines = next(pe2Batches, None)
+        if pe1Lines is None or pe2Lines is None:
+            break
+        batchSize = min(len(pe1Lines), len(pe2Lines))
+        yield pe1Lines[:batchSize], pe2Lines[:batchSize]
+        pe1Lines = pe1Lines[batchSize:]
+        pe2Lines = pe2Lines[batchSize:]
+    if pe1Lines:
+        yield pe1Lines, []
+        for lines in pe1Batches:
+            yield lines, []
+    if pe2Lines:
+        yield [], pe2Lines
+        for lines in pe2Batches:
+            yield [], lines
+
+
+def scanFastqPair(pe1Path:str, pe2Path:str, pe1Consumers:list=None, pe2Consumers:list=None, pairConsumers:list=None, blockSize:int=fastqBlockReader.defaultBlockSize, threaded:bool=True):
+    '''
+    Decompresses and reads both mates of a paired-end set once, feeding each mate's batches to its own consumers and
+    aligned batches from both mates to the pair consumers.
+    :param pe1Path: path to the paired-end 1 fastq
+    :param pe2Path: path to the paired-end 2 fastq
+    :param pe1Consumers: consumers for paired-end 1, defaults to the full set from defaultConsumers
+    :param pe2Consumers: consumers for paired-end 2, defaults to the full set from defaultConsumers
+    :param pairConsumers: PairScanConsumer objects, defaults to a PairValidator
+    :param blockSize: bytes to read from each file at a time
+    :param threaded: decompress and split each mate in its own background thread
+    :return: PairScanSummary with pe1 and pe2 summaries attached
+    '''
+    if pe1Consumers is None:
+        pe1Consumers = defaultConsumers()
+    if pe2Consumers is None:
+        pe2Consumers = defaultConsumers()
+    if pairConsumers is None:
+        pairConsumers = [PairValidator()]
+    if threaded:
+        from . import fastqThreadedReader
+        pe1Observers = [consumer.consumeRawBytes for consumer in pe1Consumers if consumer.usesRawBytes]
+        pe2Observers = [consumer.consumeRawBytes for consumer in pe2Consumers if consumer.usesRawBytes]
+        pairReader = fastqThreadedReader.ThreadedFastqPairReader(pe1Path, pe2Path, blockSize, pe1RawObservers=pe1Observers, pe2RawObservers=pe2Observers)
+        lineBatchPairs = pairReader.iterLineBatchPairs()
+    else:
+        pairReader = None
+        pe1Reader = openReader(pe1Path, pe1Consumers, blockSize)
+        pe2Reader = openReader(pe2Path, pe2Consumers, blockSize)
+        lineBatchPairs = alignedLineBatches(pe1Reader, pe2Reader)
+    for pe1Lines, pe2Lines in lineBatchPairs:
+        for consumer in pe1Consumers:
+            consumer.consumeLines(pe1Lines)
+        for consumer in pe2Consumers:
+            consumer.consumeLines(pe2Lines)
+        for consumer in pairConsumers:
+            consumer.consumeLinePairs(pe1Lines, pe2Lines)
+        if allFinished(pe1Consumers) and allFinished(pe2Consumers) and allFinished(pairConsumers):
+            break
+        if scanStopped(pe1Consumers) or scanStopped(pe2Consumers) or scanStopped(pairConsumers):
+            break
+    if pairReader:
+        pairReader.close()
+        pe1Reader = pairReader.pe1Reader
+        pe2Reader = pairReader.pe2Reader
+    else:
+        pe1Reader.close()
+        pe2Reader.close()
+    pe1Summary = ScanSummary(pe1Path, collectResults(pe1Path, pe1Consumers), pe1Reader.decompressionBackend)
+    pe2Summary = ScanSummary(pe2Path, collectResults(pe2Path, pe2Consumers), pe2Reader.decompressionBackend)
+    return PairScanSummary(pe1Summary, pe2Summary, collectResults("%s and %s" %(pe1Path, pe2Path), pairConsumers))
@@ -0,0 +1,116 @@
+'''
+Background-thread reading of fastq files. Each file gets its own thread that decompresses and splits blocks into line
+batches and hands them over through a bounded queue. zlib releases the GIL while it inflates, so the two mates of a
+gzipped pair are decompressed on separate cores while the calling thread works through the batches.
+'''
+import logging
+logger = logging.getLogger(__name__)
+from . import fastqBlockReader
+
+defaultQueueSize = 4
+endOfFile = None
+
+
+class BackgroundLineBatches(object):
+    '''
+    Runs a FastqBlockReader's iterLineBatches in a daemon thread. At most queueSize batches are held in memory at once,
+    and errors raised while reading are raised again in the consuming thread.
+    '''
+
+    def __init__(self, reader:fastqBlockReader.FastqBlockReader, queueSize:int=defaultQueueSize):
+        import queue
+        import threading
+        self.reader = reader
+        self.queue = queue.Queue(maxsize=queueSize)
+        self.stopRequested = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.readBatches, name="fastqReader:%s" %reader.path, daemon=True)
+        self.thread.start()
+
+    def readBatches(self):
+        try:
+            for lines in self.reader.iterLineBatches():
+                if not self.putBatch(lines):
+                    break
+        except Exception as error:
+            self.error = error
+        finally:
+            self.reader.close()
+            self.putBatch(endOfFile)
+
+    def putBatch(self, lines):
+        import queue
+        while not self.stopRequested.is_set():
+            try:
+                self.queue.put(lines, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        while True:
+            lines = self.queue.get()
+            if lines is endOfFile:
+                break
+            yield lines
+        self.thread.join()
+        if self.error:
+            raise self.error
+
+    def close(self):
+        import queue
+        self.stopRequested.set()
+        while True:  #drain anything queued so the reading thread can see the stop request and finish
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.thread.join()
+
+
+class ThreadedFastqPairReader(object):
+    '''
+    Reads both mates of a paired-end set in background threads and yields aligned line batches, or pairs of
+    FastqRecordView objects when iterated directly.
+    '''
+
+    def __init__(self, pe1Path:str, pe2Path:str, blockSize:int=fastqBlockReader.defaultBlockSize, queueSize:int=defaultQueueSize, pe1RawObservers:list=None, pe2RawObservers:list=None):
+        self.pe1Path = pe1Path
+        self.pe2Path = pe2Path
+        self.pe1Reader = fastqBlockReader.FastqBlockReader(pe1Path, blockSize=blockSize, rawObservers=pe1RawObservers)
+        self.pe2Reader = fastqBlockReader.FastqBlockReader(pe2Path, blockSize=blockSize, rawObservers=pe2RawObservers)
+        self.queueSize = queueSize
+        self.pe1Batches = None
+        self.pe2Batches = None
+
+    def iterLineBatchPairs(self):
+        from .fastqScanner import alignLineBatchIterators
+        self.pe1Batches = BackgroundLineBatches(self.pe1Reader, self.queueSize)
+        self.pe2Batches = BackgroundLineBatches(self.pe2Reader, self.queueSize)
+        try:
+            for pe1Lines, pe2Lines in alignLineBatchIterators(self.pe1Batches, self.pe2Batches):
+                yield pe1Lines, pe2Lines
+        finally:
+            self.close()
+
+    def close(self):
+        for batches in (self.pe1Batches, self.pe2Batches):
+            if batches:
+                batches.close()
+        self.pe1Reader.close()
+        self.pe2Reader.close()
+
+    def __iter__(self):
+        from .fastqBlockReader import FastqRecordView
+        for pe1Lines, pe2Lines in self.iterLineBatchPairs():
+            pe1Records = map(FastqRecordView, pe1Lines[0::4], pe1Lines[1::4], pe1Lines[2::4], pe1Lines[3::4])
+            pe2Records = map(FastqRecordView, pe2Lines[0::4], pe2Lines[1::4], pe2Lines[2::4], pe2Lines[3::4])
+            for pair in zip(pe1Records, pe2Records):
+                yield pair
+            if not len(pe1Lines) == len(pe2Lines):
+                from .fastqHandler import FastqValidationError
+                raise FastqValidationError("Reached end of one paired-end file before the other.")
+
+    def __str__(self):
+        return "Threaded fastq pair reader for %s and %s" %(self.pe1Path, self.pe2Path)
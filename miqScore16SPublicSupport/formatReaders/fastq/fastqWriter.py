@@ -0,0 +1,158 @@
+'''
+Writing fastq files with block-parallel compression. Records are gathered into blocks and each block is compressed on
+its own in a thread pool (zlib releases the GIL while it works), then written out in order. Because every block is a
+complete gzip member, the output is an ordinary multi-member gzip file that any gzip reader accepts, and the member
+starts double as random-access checkpoints for fastqGzipIndex. BGZF output follows the SAM specification (blocks of at
+most 64KB with a BC extra field and a closing empty block), so htslib tools can index it too.
+'''
+import os
+import logging
+logger = logging.getLogger(__name__)
+
+plainMode = "plain"
+gzipMode = "gzip"
+bgzfMode = "bgzf"
+writerModes = (plainMode, gzipMode, bgzfMode)
+
+defaultGzipBlockSize = 4 * 1024 * 1024
+bgzfBlockSize = 65280  #largest input the BGZF spec recommends so that a compressed block always fits in 64KB
+bgzfEndOfFileBlock = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def compressGzipMember(data:bytes, compressionLevel:int):
+    import zlib
+    compressor = zlib.compressobj(compressionLevel, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compressBgzfBlock(data:bytes, compressionLevel:int):
+    import zlib
+    import struct
+    compressor = zlib.compressobj(compressionLevel, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    blockSize = len(deflated) + 25  #18 byte header and 8 byte footer, minus one as the spec stores it
+    header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00" + struct.pack("<H", blockSize)
+    footer = struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data) & 0xffffffff)
+    return header + deflated + footer
+
+
+def compressBgzfBlocks(data:bytes, compressionLevel:int):
+    return b"".join(compressBgzfBlock(data[start:start + bgzfBlockSize], compressionLevel) for start in range(0, len(data), bgzfBlockSize))
+
+
+def modeFromPath(path:str):
+    if path.endswith(".gz") or path.endswith(".bgz"):
+        return gzipMode
+    return plainMode
+
+
+class FastqWriter(object):
+    '''
+    Writes fastq records to a plain, multi-member gzip or BGZF file.
+    :param path: file to write
+    :param mode: plain, gzip or bgzf, defaults to gzip for paths ending in .gz and plain otherwise
+    :param compressionLevel: zlib level from 1 (fastest, good for intermediate files) to 9
+    :param threads: compression threads, defaults to the number of cores
+    :param blockSize: uncompressed bytes per compressed block in gzip mode (BGZF blocks are always under 64KB)
+    '''
+
+    def __init__(self, path:str, mode:str=None, compressionLevel:int=6, threads:int=None, blockSize:int=defaultGzipBlockSize):
+        import collections
+        if mode is None:
+            mode = modeFromPath(path)
+        if not mode in writerModes:
+            raise ValueError("Fastq writer mode must be one of %s. %s was given." %(", ".join(writerModes), mode))
+        if not 0 <= compressionLevel <= 9:
+            raise ValueError("Compression level must be between 0 and 9. %s was given." %compressionLevel)
+        self.path = path
+        self.mode = mode
+        self.compressionLevel = compressionLevel
+        if threads is None:
+            threads = os.cpu_count() or 1
+        self.threads = max(1, threads)
+        if mode == bgzfMode:
+            blockSize = max(bgzfBlockSize, blockSize - blockSize % bgzfBlockSize)
+        self.blockSize = blockSize
+        self.filehandle = open(path, "wb")
+        self.buffer = []
+        self.bufferSize = 0
+        self.pendingBlocks = collections.deque()
+        self.executor = None
+        if not mode == plainMode and self.threads > 1:
+            import concurrent.futures
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.threads)
+        self.recordsWritten = 0
+        self.open = True
+
+    def compressBlock(self, data:bytes):
+        if self.mode == bgzfMode:
+            return compressBgzfBlocks(data, self.compressionLevel)
+        return compressGzipMember(data, self.compressionLevel)
+
+    def writeBlock(self, data:bytes):
+        if self.mode == plainMode:
+            self.filehandle.write(data)
+        elif self.executor:
+            self.pendingBlocks.append(self.executor.submit(self.compressBlock, data))
+            while len(self.pendingBlocks) > self.threads * 2:  #bounds memory when compression falls behind
+                self.filehandle.write(self.pendingBlocks.popleft().result())
+        else:
+            self.filehandle.write(self.compressBlock(data))
+
+    def flushBuffer(self):
+        if self.buffer:
+            self.writeBlock(b"".join(self.buffer))
+            self.buffer = []
+            self.bufferSize = 0
+
+    def write(self, data:bytes):
+        if not self.open:
+            raise ValueError("I/O operation on a closed fastq writer for %s" %self.path)
+        self.buffer.append(data)
+        self.bufferSize += len(data)
+        if self.bufferSize >= self.blockSize:
+            self.flushBuffer()
+
+    def writeLines(self, lines:list):
+        '''
+        Writes a batch of raw lines in the layout the block reader produces (four lines per record).
+        '''
+        if lines:
+            self.write(b"\n".join(lines) + b"\n")
+            self.recordsWritten += len(lines) // 4
+
+    def writeRecord(self, record):
+        '''
+        :param record: FastqRecordView or FastqLineSet
+        '''
+        if hasattr(record, "raw"):
+            self.write(record.raw)
+        else:
+            self.write(("%s\n" %record).encode())
+        self.recordsWritten += 1
+
+    def writeRecords(self, records):
+        for record in records:
+            self.writeRecord(record)
+
+    def close(self):
+        if not self.open:
+            return
+        self.flushBuffer()
+        while self.pendingBlocks:
+            self.filehandle.write(self.pendingBlocks.popleft().result())
+        if self.executor:
+            self.executor.shutdown()
+        if self.mode == bgzfMode:
+            self.filehandle.write(bgzfEndOfFileBlock)
+        self.filehandle.close()
+        self.open = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exceptionType, exceptionValue, traceback):
+        self.close()
+
+    def __str__(self):
+        return "Fastq writer (%s, level %s) at %s" %(self.mode, self.compressionLevel, self.path)
@@ -0,0 +1,19 @@
+import os
+from pytest import mark, importorskip
+
+
+@mark.build
+@mark.fastq
+def test_pairedPlotWithComposition(tmpdir, makeFastqText, writeFastq):
+    matplotlib = importorskip("matplotlib")
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from . import fastqAnalysis, fileNamingStandards
+    forward = fileNamingStandards.ManualNamingStandard(writeFastq(tmpdir, "sample_R1.fastq", makeFastqText(200, direction=1)), "sample", 1, 1)
+    reverse = fileNamingStandards.ManualNamingStandard(writeFastq(tmpdir, "sample_R2.fastq", makeFastqText(200, direction=2)), "sample", 1, 2)
+    agent = fastqAnalysis.ParallelPlotAgent(outputDirectory=str(tmpdir), outputFormat="png", includeComposition=True)
+    returnedFastq, outputFile, encodedPlot = agent.parallelPlotter((forward, reverse))
+    assert returnedFastq is forward and os.path.getsize(outputFile) > 0
+    assert not plt.get_fignums()  #the figure was closed after saving
+    encodedPlot = fastqAnalysis.generateFastqPlotPaired(forward, reverse, base64Format="png", includeComposition=True)
+    assert encodedPlot and not plt.get_fignums()
@@ -0,0 +1,58 @@
+from pytest import mark
+
+
+@mark.build
+@mark.fastq
+def test_batchRoundTripAndQueries(tmpdir, makeFastqText, writeFastq):
+    from . import fastqBatch, fastqHandler
+    text = makeFastqText(300) + "@odd read\nacgTNNG.\n+\nIIIIIIII\n"
+    path = writeFastq(tmpdir, "reads.fastq", text)
+    batch = fastqBatch.batchFromFile(path)
+    reads = list(fastqHandler.FastqFile(path))
+    assert len(batch) == len(reads) == 301
+    assert [record.sequence.decode() for record in batch][:-1] == [read.sequence for read in reads][:-1]
+    assert batch[-1].sequence == b"ACGTNNGN"
+    assert batch[-1].header == b"odd read"
+    assert batch[-1].quality == b"IIIIIIII"
+    assert list(batch.lengths) == [len(read.sequence) for read in reads]
+    counts = batch.baseCounts()
+    assert list(counts[-1]) == [1, 1, 2, 1, 3]
+    assert abs(batch.gcContent()[-1] - 0.6) < 1e-9
+    assert abs(batch.gcContent()[0] - fastqHandler.SequenceLine(reads[0].sequence, runAnalysis=True).gcContent) < 1e-9
+    joined = fastqBatch.concatenateBatches([batch.take(range(0, 7)), batch.take(range(7, 301))])
+    assert [record.raw for record in joined] == [record.raw for record in batch]
+    assert len(fastqBatch.batchFromFile(path, maxReads=5)) == 5
+    assert batch.nbytes < len(text)
+
+
+@mark.build
+@mark.fastq
+def test_baseComposition(tmpdir, makeFastqText, writeFastq):
+    import numpy
+    from . import fastqAnalysis, fastqBatch, fastqComposition, fastqHandler
+    text = makeFastqText(400, readLength=60)
+    lines = text.encode().split(b"\n")[:-1]
+    lines[1] = b"TTTTNNACGT"
+    lines[3] = b"IIIIIIIIII"
+    path = writeFastq(tmpdir, "reads.fastq", "\n".join([line.decode() for line in lines]) + "\n")
+    composition, gcHistogram = fastqAnalysis.buildBaseComposition(path)
+    assert composition.readCount == gcHistogram.readCount == 400
+    assert composition.counts[:, 0].tolist() == [399, 0, 0, 1, 0]
+    assert composition.counts[4, 4] == 1 and composition.readsCovering()[59] == 399
+    assert 0 in composition.lowDiversityPositions(0.99)
+    sequences = lines[1::4]
+    expectedGC = [fastqHandler.SequenceLine(sequence.decode(), runAnalysis=True).gcContent for sequence in sequences]
+    assert abs(gcHistogram.mean() - numpy.mean(expectedGC)) < 1e-9
+    assert gcHistogram.counts[50] == 399 and gcHistogram.counts[25] == 1
+    batch = fastqBatch.batchFromLines(lines)
+    batchComposition = fastqComposition.PositionBaseComposition()
+    batchComposition.addFastqBatch(batch)
+    batchGCHistogram = fastqComposition.GCContentHistogram()
+    batchGCHistogram.addFastqBatch(batch)
+    assert numpy.array_equal(batchComposition.counts, composition.counts)
+    assert numpy.array_equal(batchGCHistogram.counts, gcHistogram.counts)
+    halves = fastqComposition.PositionBaseComposition()
+    halves.addBatch(sequences[:200])
+    otherHalf = fastqComposition.PositionBaseComposition()
+    otherHalf.addBatch(sequences[200:])
+    assert numpy.array_equal(halves.merge(otherHalf).counts, composition.counts)
@@ -0,0 +1,59 @@
+from pytest import mark
+
+
+@mark.build
+@mark.fastq
+@mark.parametrize("compress", [False, True])
+def test_blockReaderMatchesLineReader(tmpdir, compress, makeFastqText, writeFastq):
+    from . import fastqHandler
+    path = writeFastq(tmpdir, "reads.fastq", makeFastqText(250), compress)
+    assert fastqHandler.countReads(path) == fastqHandler.countReads(path, useBlockReader=False) == 250
+    assert fastqHandler.validFastqFile(path) == fastqHandler.validFastqFile(path, useBlockReader=False) == 250
+    assert fastqHandler.getLongestReadInFile(path) == 150
+    assert fastqHandler.estimateReadLength(path, getVariance=True) == (150, 0)
+
+
+@mark.build
+@mark.fastq
+def test_blockReaderRecordsSpanBlocks(tmpdir, makeFastqText, writeFastq):
+    from . import fastqBlockReader
+    text = makeFastqText(40, readLength=31)
+    path = writeFastq(tmpdir, "reads.fastq", text.rstrip("\n"))
+    reader = fastqBlockReader.FastqBlockReader(path, blockSize=97)
+    records = list(reader)
+    assert len(records) == 40
+    assert b"".join(record.raw for record in records).decode() == text
+    assert records[0].toFastqLineSet(depth=1).quality.phredScores[-1] == 2
+
+
+@mark.build
+@mark.fastq
+def test_blockReaderTruncatedFile(tmpdir, makeFastqText, writeFastq):
+    from . import fastqBlockReader, fastqHandler
+    text = makeFastqText(3) + "@M00123:45:000000000-ABCDE:1:1101:1:1 1:N:0:1\nACGT\n"
+    path = writeFastq(tmpdir, "truncated.fastq", text)
+    reader = fastqBlockReader.FastqBlockReader(path)
+    assert reader.countRecords() == 4
+    assert reader.truncated
+    assert fastqHandler.validFastqFile(path) is False
+
+
+@mark.build
+@mark.fastq
+def test_findRecordStartResync():
+    from . import fastqBlockReader
+    data = b"IIII\n@read2\nACGT\n+\n@III\n@read3\nACGT\n+\nIIII\n"
+    assert fastqBlockReader.findRecordStart(data) == data.index(b"@read2")
+    assert fastqBlockReader.findRecordStart(data, data.index(b"@III")) == data.index(b"@read3")
+    assert fastqBlockReader.findRecordStart(data[:15]) == -1
+
+
+@mark.build
+@mark.fastq
+def test_qualityEncodingDetectionCache(tmpdir, makeFastqText, writeFastq):
+    from . import fastqHandler
+    path = writeFastq(tmpdir, "reads.fastq", makeFastqText(3000))
+    encoding = fastqHandler.findQualityScoreEncoding(path)
+    assert encoding == "Sanger/Illumina 1.8+"
+    assert fastqHandler.findQualityScoreEncoding(path, lineLimit=0, useCache=False) == encoding
+    assert fastqHandler.fileCacheKey(path) in fastqHandler.qualityScoreEncodingCache
@@ -0,0 +1,14 @@
+from pytest import mark
+
+
+@mark.build
+@mark.fastq
+def test_pairPreservingDownsample(tmpdir, makeFastqText, writeFastq):
+    from . import fastqHandler, fastqDownsampler
+    pe1Path = writeFastq(tmpdir, "reads_R1.fastq", makeFastqText(2000, direction=1))
+    pe2Path = writeFastq(tmpdir, "reads_R2.fastq.gz", makeFastqText(2000, direction=2), compress=True)
+    outputPaths = [str(tmpdir.join(name)) for name in ("kept_R1.fastq", "kept_R2.fastq.gz", "again_R1.fastq", "again_R2.fastq")]
+    assert fastqDownsampler.downsampleFastqPair(pe1Path, pe2Path, outputPaths[0], outputPaths[1], 150, seed=7) == 150
+    assert fastqHandler.validFastqPair(outputPaths[0], outputPaths[1]) == 150
+    fastqDownsampler.downsampleFastqPair(pe1Path, pe2Path, outputPaths[2], outputPaths[3], 150, seed=7, readCount=2000)
+    assert open(outputPaths[0]).read() == open(outputPaths[2]).read()
@@ -0,0 +1,34 @@
+import os
+from pytest import mark
+
+
+@mark.build
+@mark.fastq
+def test_checkpointIndexRandomAccess(tmpdir, makeFastqText, writeMultiMemberGzip):
+    from . import fastqGzipIndex, fastqHandler
+    text = makeFastqText(5000)
+    path = writeMultiMemberGzip(tmpdir, "reads.fastq.gz", text)
+    index = fastqGzipIndex.buildIndex(path, checkpointSpacing=100000)
+    assert index.totalRecords == 5000
+    assert len(index.checkpoints) > 2
+    assert fastqGzipIndex.loadIndex(path).totalRecords == fastqHandler.countReads(path) == 5000
+    allLines = text.encode().split(b"\n")
+    for checkpoint, recordCount in index.checkpointRecordRanges():
+        lines = [line for batch in fastqGzipIndex.iterLineBatchesFromCheckpoint(path, checkpoint, recordCount) for line in batch]
+        assert lines == allLines[checkpoint.recordIndex * 4:(checkpoint.recordIndex + recordCount) * 4]
+    lines = [line for batch in fastqGzipIndex.iterLineBatchesFromRecord(path, index, 3210, 5) for line in batch]
+    assert lines == allLines[3210 * 4:3215 * 4]
+
+
+@mark.build
+@mark.fastq
+def test_staleIndexIgnored(tmpdir, monkeypatch, makeFastqText, writeMultiMemberGzip):
+    from . import fastqGzipIndex, fastqHandler
+    path = writeMultiMemberGzip(tmpdir, "reads.fastq.gz", makeFastqText(100))
+    assert fastqHandler.countReads(path) == 100
+    assert not os.path.exists(fastqGzipIndex.indexPath(path))  #nothing is written next to the inputs unless asked for
+    monkeypatch.setattr(fastqGzipIndex, "buildIndexesDuringFullPass", True)
+    assert fastqHandler.countReads(path) == 100
+    assert fastqGzipIndex.loadIndex(path).totalRecords == 100
+    os.utime(path, (0, 0))
+    assert fastqGzipIndex.loadIndex(path) is None
@@ -0,0 +1,21 @@
+from pytest import mark
+
+
+@mark.build
+@mark.fastq
+def test_batchHeaderValidation(tmpdir, makeFastqText, writeFastq):
+    from . import fastqHandler, fastqScanner
+    pe1Text = makeFastqText(90, direction=1)
+    pe1Path = writeFastq(tmpdir, "reads_R1.fastq", pe1Text)
+    pe2Path = writeFastq(tmpdir, "reads_R2.fastq", makeFastqText(90, direction=2))
+    validator = fastqScanner.PairValidator()
+    fastqScanner.scanFastqPair(pe1Path, pe2Path, [], [], [validator])
+    assert validator.result() == 90
+    assert validator.tileCounts == {(1, 1101): 30, (1, 1102): 30, (1, 1103): 30}
+    paddedPe2Path = writeFastq(tmpdir, "padded_R2.fastq", makeFastqText(90, direction=2).replace(":1:11", ":01:11"))
+    assert fastqHandler.validFastqPair(pe1Path, paddedPe2Path) == 90
+    otherIndexPath = writeFastq(tmpdir, "index_R2.fastq", makeFastqText(90, direction=2).replace("N:0:1\n", "N:0:2\n", 1))
+    assert fastqHandler.validFastqPair(pe1Path, otherIndexPath) is False
+    for brokenHeader in (" 1:X:0:1", " 3:N:0:1", " 1:N:1:1", " 1:N:0"):
+        brokenPath = writeFastq(tmpdir, "broken.fastq", pe1Text.replace(" 1:N:0:1", brokenHeader, 1))
+        assert fastqHandler.validFastqFile(brokenPath) is False
@@ -0,0 +1,42 @@
+import os
+from pytest import mark
+
+
+@mark.build
+@mark.fastq
+def test_mappedRandomAccess(tmpdir, makeFastqText, writeFastq):
+    from . import fastqHandler, fastqMmap
+    path = writeFastq(tmpdir, "reads.fastq", makeFastqText(1000) + "\n\n")
+    streamed = [(str(read.metadata), read.sequence) for read in fastqHandler.FastqFile(path)]
+    fastq = fastqHandler.FastqFile(path, backend="mmap", persistIndex=True)
+    assert len(fastq) == 1000
+    assert os.path.isfile(fastqMmap.offsetIndexPath(path))
+    assert (str(fastq[-1].metadata), fastq[-1].sequence) == streamed[-1]
+    assert [(str(read.metadata), read.sequence) for read in fastq] == streamed
+    sample = fastqHandler.FastqFile(path, backend="mmap").sample(10, seed=1)
+    assert len(sample) == 10
+    subsampled = [str(read.metadata) for read in fastqHandler.FastqFile(path, backend="mmap", subsample=7)]
+    assert subsampled == [str(read.metadata) for read in fastqHandler.FastqFile(path, subsample=7)]
+
+
+@mark.build
+@mark.fastq
+def test_mappedTruncatedRecord(tmpdir, makeFastqText, writeFastq):
+    from . import fastqMmap, fastqBlockReader
+    text = makeFastqText(10)
+    path = writeFastq(tmpdir, "reads.fastq", text[:text.rindex("+")])
+    mappedFile = fastqMmap.MappedFastq(path)
+    assert len(mappedFile) == fastqBlockReader.FastqBlockReader(path).countRecords() == 10
+    assert mappedFile.truncated
+    assert mappedFile[9].quality == b""
+
+
+@mark.build
+@mark.fastq
+def test_emptyFileBackends(tmpdir, writeFastq):
+    from . import fastqHandler
+    path = writeFastq(tmpdir, "empty.fastq", "")
+    mapped = fastqHandler.FastqFile(path, backend="mmap")
+    assert mapped and len(mapped) == 0
+    assert list(mapped) == []
+    assert fastqHandler.FastqFile(path)
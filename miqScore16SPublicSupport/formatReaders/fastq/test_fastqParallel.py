@@ -0,0 +1,16 @@
+from pytest import mark
+
+
+@mark.build
+@mark.fastq
+def test_parallelPairValidation(tmpdir, makeFastqText, writeFastq):
+    from . import fastqHandler, fastqParallel
+    pe1Path = writeFastq(tmpdir, "reads_R1.fastq", makeFastqText(3000, direction=1))
+    pe2Path = writeFastq(tmpdir, "reads_R2.fastq", makeFastqText(3000, direction=2, readLength=100))
+    assert len(fastqParallel.planChunks(pe1Path, 7, minimumChunkSize=1024)) == 7
+    assert fastqParallel.countReadsParallel(pe2Path, workers=2, minimumChunkSize=1024) == 3000
+    assert fastqParallel.validFastqPairParallel(pe1Path, pe2Path, workers=2, minimumChunkSize=1024) == fastqHandler.validFastqPair(pe1Path, pe2Path) == 3000
+    assert fastqParallel.validFastqPairParallel(pe1Path, pe1Path, workers=2, minimumChunkSize=1024) is False
+    brokenText = makeFastqText(3000, direction=2).replace("\n+\n", "\n-\n", 2000)
+    brokenPath = writeFastq(tmpdir, "broken_R2.fastq", brokenText)
+    assert fastqParallel.validFastqPairParallel(pe1Path, brokenPath, workers=2, minimumChunkSize=1024) is False
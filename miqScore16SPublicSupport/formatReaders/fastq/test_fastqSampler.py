@@ -0,0 +1,51 @@
+from pytest import mark
+
+
+@mark.build
+@mark.fastq
+def test_uniformSampling(tmpdir, makeFastqText, writeFastq, writeMultiMemberGzip):
+    from . import fastqGzipIndex, fastqHandler, fastqSampler
+    text = makeFastqText(3000, readLength=150) + makeFastqText(3000, readLength=50)  #sorted by length, long reads first
+    path = writeFastq(tmpdir, "reads.fastq", text)
+    assert fastqHandler.estimateReadLength(path, uniformSample=False) == 150
+    readSample = fastqSampler.sampleReads(path, 2000, seed=1)
+    assert readSample.method == fastqSampler.seekMethod
+    assert len(readSample) == 2000
+    assert set(readSample.lengths.tolist()) == {50, 150}
+    mean, lower, upper = readSample.meanLength()
+    assert lower < 100 < upper  #without the size weights, long reads would be picked about twice as often
+    fraction, lower, upper = readSample.lengthDistribution()[150]
+    assert lower < 0.5 < upper
+    assert readSample.maxLength == 150
+    assert readSample.longerReadFractionBound < 0.01
+    profile = readSample.qualityProfile()
+    assert len(profile["means"]) == 150
+    assert abs(profile["means"][0] - 40) < 1e-9 and abs(profile["means"][-1] - 2) < 1e-9
+    assert profile["readsCovering"][0] == 2000 > profile["readsCovering"][100]
+    assert abs(fastqHandler.estimateReadLength(path, samplesize=2000) - 100) < 10
+    assert fastqSampler.sampleReads(path, 50, seed=3).lengths.tolist() == fastqSampler.sampleReads(path, 50, seed=3).lengths.tolist()
+    gzipPath = writeMultiMemberGzip(tmpdir, "reads.fastq.gz", text)
+    assert not fastqSampler.cheapToSample(gzipPath)
+    assert fastqHandler.estimateReadLength(gzipPath) == 150  #read from the head rather than decompressing it all
+    reservoirSample = fastqSampler.sampleReads(gzipPath, 500, seed=1)
+    assert reservoirSample.method == fastqSampler.reservoirMethod
+    assert len(reservoirSample) == 500
+    assert 0.35 < reservoirSample.lengthDistribution()[150][0] < 0.65
+    fastqGzipIndex.buildIndex(gzipPath, checkpointSpacing=100000)
+    assert fastqSampler.cheapToSample(gzipPath)
+    indexSample = fastqSampler.sampleReads(gzipPath, 500, seed=1)
+    assert indexSample.method == fastqSampler.gzipIndexMethod
+    assert len(indexSample) == 500
+    assert 0.35 < indexSample.lengthDistribution()[150][0] < 0.65
+
+
+@mark.build
+@mark.fastq
+def test_seekResyncsOnRecordBoundaries(tmpdir, makeFastqText, writeFastq):
+    from . import fastqSampler
+    text = makeFastqText(200, readLength=120).replace("\n+\nIII", "\n+\n@@@")  #quality lines starting with @
+    path = writeFastq(tmpdir, "reads.fastq", text + "@truncated\nACGT\n")
+    readSample = fastqSampler.sampleBySeeking(path, 500, seed=2, windowBytes=64)
+    assert 0 < len(readSample) <= 500
+    assert set(readSample.lengths.tolist()) == {120}
+    assert all([quality.startswith(b"@@@") for quality in readSample.qualities])
@@ -0,0 +1,54 @@
+from pytest import mark
+
+
+@mark.build
+@mark.fastq
+def test_singlePassScan(tmpdir, makeFastqText, writeFastq):
+    from . import fastqScanner
+    from ...projectData.utilities.validations import fileIntegrity
+    path = writeFastq(tmpdir, "reads.fastq.gz", makeFastqText(120), compress=True)
+    summary = fastqScanner.scanFastq(path)
+    assert summary.readCount == 120
+    assert summary.validation == 120
+    assert summary.lengthHistogram == {150: 120}
+    assert summary.qualityHistogram[ord("I")] == 120 * 140
+    assert summary.encoding == "Sanger/Illumina 1.8+"
+    assert summary.md5 == fileIntegrity.md5File(path)
+
+
+@mark.build
+@mark.fastq
+def test_pairScanValidation(tmpdir, makeFastqText, writeFastq):
+    from . import fastqHandler
+    pe1Path = writeFastq(tmpdir, "reads_R1.fastq", makeFastqText(80, direction=1))
+    pe2Path = writeFastq(tmpdir, "reads_R2.fastq", makeFastqText(80, direction=2))
+    shortPe2Path = writeFastq(tmpdir, "short_R2.fastq", makeFastqText(79, direction=2))
+    assert fastqHandler.validFastqPair(pe1Path, pe2Path) == fastqHandler.validFastqPair(pe1Path, pe2Path, useBlockReader=False) == 80
+    assert fastqHandler.validFastqPair(pe1Path, shortPe2Path) is False
+    assert fastqHandler.validFastqPair(pe1Path, pe1Path) is False
+
+
+@mark.build
+@mark.fastq
+def test_readBudgetAndFailFast(tmpdir, makeFastqText, writeFastq):
+    from . import fastqHandler, fastqScanner
+    pe1Path = writeFastq(tmpdir, "reads_R1.fastq", makeFastqText(20000, direction=1))
+    pe2Path = writeFastq(tmpdir, "reads_R2.fastq", makeFastqText(20000, direction=2))
+    assert fastqHandler.checkFastqPair(pe1Path, pe2Path).readCount == 20000
+    overBudget = fastqHandler.checkFastqPair(pe1Path, pe2Path, maxReads=100, logErrors=False, blockSize=65536)
+    assert not overBudget and overBudget.reason == fastqScanner.readBudgetReason
+    assert 100 < overBudget.readCount < 20000
+    assert 100 < fastqHandler.countReads(pe1Path, maxReads=100) <= 20000
+    assert fastqHandler.countReads(pe1Path, maxReads=20000) == 20000
+    brokenText = makeFastqText(20000).replace("\n+\n", "\n-\n", 1)
+    brokenPath = writeFastq(tmpdir, "broken.fastq", brokenText)
+    failedFast = fastqHandler.checkFastqFile(brokenPath, logErrors=False, blockSize=65536)
+    assert failedFast.reason == fastqScanner.formatErrorReason and failedFast.readCount == 0
+    fullyCounted = fastqHandler.checkFastqFile(brokenPath, failFast=False, logErrors=False)
+    assert fullyCounted.reason == fastqScanner.formatErrorReason and fullyCounted.readCount == 20000
+    assert fastqHandler.checkFastqFile(writeFastq(tmpdir, "empty.fastq", "")).reason == fastqScanner.emptyReason
+    hashers = [fastqScanner.ReadCounter(), fastqScanner.Md5Hasher()]
+    stopper = fastqScanner.PairValidator(logErrors=False, maxReads=100, stopScan=True)
+    stopped = fastqScanner.scanFastqPair(pe1Path, pe2Path, hashers, [fastqScanner.ReadCounter()], [stopper], blockSize=65536)
+    assert stopper.validationResult((pe1Path, pe2Path)).reason == fastqScanner.readBudgetReason
+    assert stopped.pe1.readCount < 20000  #the checksum did not keep the scan going to the end
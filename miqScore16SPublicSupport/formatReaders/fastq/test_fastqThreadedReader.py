@@ -0,0 +1,18 @@
+from pytest import mark
+
+
+@mark.build
+@mark.fastq
+def test_threadedPairReader(tmpdir, makeFastqText, writeFastq):
+    from . import fastqScanner, fastqThreadedReader
+    pe1Path = writeFastq(tmpdir, "reads_R1.fastq.gz", makeFastqText(500, direction=1), compress=True)
+    pe2Path = writeFastq(tmpdir, "reads_R2.fastq.gz", makeFastqText(500, direction=2), compress=True)
+    pairs = list(fastqThreadedReader.ThreadedFastqPairReader(pe1Path, pe2Path, blockSize=4096, queueSize=2))
+    assert len(pairs) == 500
+    assert pairs[-1][0].header.replace(b" 1:", b" 2:") == pairs[-1][1].header
+    threaded = fastqScanner.scanFastqPair(pe1Path, pe2Path, blockSize=4096)
+    unthreaded = fastqScanner.scanFastqPair(pe1Path, pe2Path, blockSize=4096, threaded=False)
+    assert threaded.pe1.md5 == unthreaded.pe1.md5
+    assert threaded.pairValidation == unthreaded.pairValidation == 500
+    earlyStop = fastqScanner.scanFastqPair(pe1Path, pe1Path, [], [], [fastqScanner.PairValidator()], blockSize=4096)
+    assert earlyStop.pairValidation is False
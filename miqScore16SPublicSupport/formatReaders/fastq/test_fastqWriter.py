@@ -0,0 +1,36 @@
+import gzip
+from pytest import mark
+
+
+@mark.build
+@mark.fastq
+def test_writerModesRoundTrip(tmpdir, makeFastqText, writeFastq):
+    from . import fastqWriter, fastqBlockReader, fastqGzipIndex
+    from .. import compressionCodecs
+    text = makeFastqText(3000)
+    sourcePath = writeFastq(tmpdir, "source.fastq", text)
+    for mode, name in (("plain", "out.fastq"), ("gzip", "out.fastq.gz"), ("bgzf", "out.bgzf.fastq.gz")):
+        path = str(tmpdir.join(name))
+        writer = fastqWriter.FastqWriter(path, mode=mode, compressionLevel=1, threads=3, blockSize=100000)
+        for lines in fastqBlockReader.FastqBlockReader(sourcePath, blockSize=50000).iterLineBatches():
+            writer.writeLines(lines)
+        writer.close()
+        assert writer.recordsWritten == 3000
+        assert compressionCodecs.sniffCodec(path) == mode
+        if mode == "plain":
+            assert open(path).read() == text
+        else:
+            assert gzip.open(path, "rt").read() == text
+    index = fastqGzipIndex.buildIndex(str(tmpdir.join("out.fastq.gz")), checkpointSpacing=100000)
+    assert len(index.checkpoints) > 1
+
+
+@mark.build
+@mark.fastq
+def test_writerAcceptsLineSets(tmpdir, makeFastqText, writeFastq):
+    from . import fastqWriter, fastqHandler
+    sourcePath = writeFastq(tmpdir, "source.fastq", makeFastqText(20))
+    path = str(tmpdir.join("copy.fastq.gz"))
+    with fastqWriter.FastqWriter(path, threads=1) as writer:
+        writer.writeRecords(fastqHandler.FastqFile(sourcePath))
+    assert gzip.open(path, "rt").read() == open(sourcePath).read()
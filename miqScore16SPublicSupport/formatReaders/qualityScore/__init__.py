@@ -1,3 +1,7 @@
 from . import qualityScoreHandler
+from . import qualityAccumulators
+from . import qualityRunLength
 
-__all__ = ["qualityScoreHandler"]
\ No newline at end of file
+__all__ = ["qualityScoreHandler",
+           "qualityAccumulators",
+           "qualityRunLength"]
\ No newline at end of file
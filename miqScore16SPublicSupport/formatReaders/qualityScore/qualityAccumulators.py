@@ -0,0 +1,200 @@
+import logging
+logger = logging.getLogger(__name__)
+from . import qualityScoreHandler
+
+
+class PositionQualityHistogram(object):
+    '''
+    Streaming count of how many times each quality character is seen at each read position. Reads are added in
+    batches and the position dimension grows as longer reads show up, so memory stays at 256 counters per position no
+    matter how many reads go through it.
+    '''
+
+    def __init__(self, encoding:qualityScoreHandler.EncodingScheme=qualityScoreHandler.encodingSchemes.illumina, initialLength:int=0):
+        import numpy
+        self.encoding = encoding
+        self.counts = numpy.zeros((256, initialLength), dtype='int64')
+        self.readCount = 0
+
+    @property
+    def length(self):
+        return self.counts.shape[1]
+
+    def growTo(self, length:int):
+        import numpy
+        if length > self.length:
+            self.counts = numpy.hstack((self.counts, numpy.zeros((256, length - self.length), dtype='int64')))
+
+    def addBatch(self, qualityStrings:list):
+        import numpy
+        if not qualityStrings:
+            return
+        qualityMatrix, lengths = qualityScoreHandler.qualityBatchToMatrix(qualityStrings)
+        self.growTo(qualityMatrix.shape[1])
+        inRead = numpy.arange(qualityMatrix.shape[1]) < lengths[:, None]
+        positions = numpy.nonzero(inRead)[1]
+        flatIndex = qualityMatrix[inRead].astype('int64') * self.length + positions
+        self.counts += numpy.bincount(flatIndex, minlength=256 * self.length).reshape(256, self.length)
+        self.readCount += len(qualityStrings)
+
+    def merge(self, other):
+        if not self.encoding == other.encoding:
+            raise ValueError("Unable to merge quality histograms using different encodings: %s and %s" %(self.encoding, other.encoding))
+        self.growTo(other.length)
+        self.counts[:, :other.length] += other.counts
+        self.readCount += other.readCount
+        return self
+
+    def scoreCounts(self):
+        '''
+        Counts with rows for each quality score in the encoding (0 through encoding.range) instead of each raw byte.
+        Characters outside of the encoding's range are dropped with a warning.
+        '''
+        firstRow = self.encoding.base
+        lastRow = self.encoding.base + self.encoding.range
+        outOfRange = self.counts[:firstRow].sum() + self.counts[lastRow + 1:].sum()
+        if outOfRange:
+            logger.warning("Found %s quality characters outside of the range for %s encoding. These will not be counted." %(outOfRange, self.encoding))
+        return self.counts[firstRow:lastRow + 1]
+
+    def readsCovering(self):
+        return self.counts.sum(axis=0)
+
+    def percentiles(self, percentile:[int, float]):
+        '''
+        Exact per-position percentile of quality scores, interpolated between order statistics the same way
+        numpy.percentile does by default. Positions no read reaches come back as NaN.
+        :param percentile: percentile to calculate (0 to 100)
+        :return: numpy array of percentile scores with one value per position
+        '''
+        import numpy
+        readsCovering = self.readsCovering()
+        cumulativeCounts = numpy.cumsum(self.counts, axis=0)
+        rank = (readsCovering - 1).clip(min=0) * (percentile / 100)
+        lowerRank = numpy.floor(rank)
+        upperRank = numpy.minimum(lowerRank + 1, (readsCovering - 1).clip(min=0))
+        lowerValue = (cumulativeCounts <= lowerRank).sum(axis=0)
+        upperValue = (cumulativeCounts <= upperRank).sum(axis=0)
+        result = lowerValue + (rank - lowerRank) * (upperValue - lowerValue) - self.encoding.base
+        result = result.astype('float64')
+        result[readsCovering == 0] = numpy.nan
+        return result
+
+    def means(self):
+        import numpy
+        readsCovering = self.readsCovering()
+        scores = numpy.arange(256) - self.encoding.base
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return (self.counts * scores[:, None]).sum(axis=0) / readsCovering
+
+    def qualityCountMatrix(self):
+        '''
+        Same layout that makeQualityMatrix has always returned: rows correspond to all possible quality scores and
+        columns to each base position (indexed to zero), so a value is called by matrix[qualityScore, readPosition].
+        '''
+        import numpy
+        return numpy.matrix(self.scoreCounts())
+
+    def __str__(self):
+        return "Position quality histogram for %s reads over %s positions (%s)" %(self.readCount, self.length, self.encoding)
+
+
+class PositionExpectedErrorSketch(object):
+    '''
+    Mergeable per-position sketch of cumulative expected error. Values are counted in logarithmically spaced buckets so
+    that any quantile comes back within relativeAccuracy of the true value, while exact sums are kept for means. Memory
+    is a fixed number of buckets per position regardless of read depth, and sketches built from separate chunks or
+    processes can be combined with merge as long as they share the same settings.
+    '''
+
+    def __init__(self, encoding:qualityScoreHandler.EncodingScheme=qualityScoreHandler.encodingSchemes.illumina, relativeAccuracy:float=0.01, minimumValue:float=1e-6, maximumValue:float=1e4):
+        import math
+        import numpy
+        if not 0 < relativeAccuracy < 1:
+            raise ValueError("Relative accuracy for an expected error sketch must be between 0 and 1. %s was given." %relativeAccuracy)
+        self.encoding = encoding
+        self.relativeAccuracy = relativeAccuracy
+        self.minimumValue = minimumValue
+        self.maximumValue = maximumValue
+        self.gamma = (1 + relativeAccuracy) / (1 - relativeAccuracy)
+        self.logGamma = math.log(self.gamma)
+        self.bucketOffset = math.floor(math.log(minimumValue) / self.logGamma)
+        self.bucketCount = math.ceil(math.log(maximumValue) / self.logGamma) - self.bucketOffset + 1
+        self.counts = numpy.zeros((self.bucketCount, 0), dtype='int64')
+        self.sums = numpy.zeros(0, dtype='float64')
+        self.readCount = 0
+
+    @property
+    def length(self):
+        return self.counts.shape[1]
+
+    def growTo(self, length:int):
+        import numpy
+        growth = length - self.length
+        if growth > 0:
+            self.counts = numpy.hstack((self.counts, numpy.zeros((self.bucketCount, growth), dtype='int64')))
+            self.sums = numpy.concatenate((self.sums, numpy.zeros(growth, dtype='float64')))
+
+    def bucketIndex(self, values):
+        import numpy
+        values = numpy.clip(values, self.minimumValue, self.maximumValue)
+        return numpy.ceil(numpy.log(values) / self.logGamma).astype('int64') - self.bucketOffset
+
+    def bucketValue(self, indices):
+        import numpy
+        return 2 * self.gamma ** (indices + self.bucketOffset) / (self.gamma + 1)
+
+    def addExpectedErrorMatrix(self, expectedErrorMatrix):
+        '''
+        :param expectedErrorMatrix: float matrix of cumulative expected error with one row per read and NaN past the end of shorter reads
+        '''
+        import numpy
+        self.growTo(expectedErrorMatrix.shape[1])
+        inRead = ~numpy.isnan(expectedErrorMatrix)
+        positions = numpy.nonzero(inRead)[1]
+        values = expectedErrorMatrix[inRead]
+        flatIndex = self.bucketIndex(values) * self.length + positions
+        self.counts += numpy.bincount(flatIndex, minlength=self.bucketCount * self.length).reshape(self.bucketCount, self.length)
+        self.sums[:expectedErrorMatrix.shape[1]] += numpy.nansum(expectedErrorMatrix, axis=0)
+        self.readCount += expectedErrorMatrix.shape[0]
+
+    def addBatch(self, qualityStrings:list):
+        if not qualityStrings:
+            return
+        expectedErrorMatrix, lengths = qualityScoreHandler.cumulativeExpectedErrorMatrix(qualityStrings, self.encoding)
+        self.addExpectedErrorMatrix(expectedErrorMatrix)
+
+    def merge(self, other):
+        if not (self.relativeAccuracy == other.relativeAccuracy and self.minimumValue == other.minimumValue and self.maximumValue == other.maximumValue):
+            raise ValueError("Unable to merge expected error sketches built with different accuracy or value range settings.")
+        self.growTo(other.length)
+        self.counts[:, :other.length] += other.counts
+        self.sums[:other.length] += other.sums
+        self.readCount += other.readCount
+        return self
+
+    def readsCovering(self):
+        return self.counts.sum(axis=0)
+
+    def means(self):
+        import numpy
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return self.sums / self.readsCovering()
+
+    def percentiles(self, percentile:[int, float]):
+        '''
+        Per-position percentile of cumulative expected error, accurate to within relativeAccuracy of the value found
+        by the nearest-rank method. Positions no read reaches come back as NaN.
+        :param percentile: percentile to calculate (0 to 100)
+        :return: numpy array of expected error values with one value per position
+        '''
+        import numpy
+        readsCovering = self.readsCovering()
+        rank = numpy.round((readsCovering - 1).clip(min=0) * (percentile / 100))
+        bucket = (numpy.cumsum(self.counts, axis=0) <= rank).sum(axis=0)
+        result = self.bucketValue(bucket)
+        result[readsCovering == 0] = numpy.nan
+        return result
+
+    def __str__(self):
+        return "Position expected error sketch for %s reads over %s positions (%s)" %(self.readCount, self.length, self.encoding)
@@ -0,0 +1,192 @@
+'''
+Compact storage for quality strings. Binned instruments (NovaSeq, NextSeq and newer MiSeq software) only write three or
+four distinct quality characters, so neighbouring bases usually share a score and a read collapses into a short list of
+(character, run length) pairs stored as two bytes each. Decoding back to bytes, scores or cumulative expected error is
+done for whole ranges of reads at once with numpy.
+'''
+import logging
+logger = logging.getLogger(__name__)
+from . import qualityScoreHandler
+
+maximumRunLength = 255
+
+
+def findRuns(qualityData, readLengths):
+    '''
+    Splits concatenated quality bytes into runs of one repeated character. Runs never cross from one read into the next
+    and are cut into pieces of at most maximumRunLength so that lengths fit in a byte.
+    :param qualityData: uint8 numpy array of all quality bytes for a batch of reads, end to end
+    :param readLengths: int64 numpy array with the length of each read
+    :return: tuple of (run characters, run lengths, number of runs in each read)
+    '''
+    import numpy
+    readStarts = numpy.zeros(len(readLengths), dtype='int64')
+    numpy.cumsum(readLengths[:-1], out=readStarts[1:])
+    isRunStart = numpy.ones(len(qualityData), dtype=bool)
+    isRunStart[1:] = qualityData[1:] != qualityData[:-1]
+    isRunStart[readStarts[readLengths > 0]] = True
+    runStarts = numpy.flatnonzero(isRunStart)
+    runLengths = numpy.diff(numpy.append(runStarts, len(qualityData)))
+    pieces = (runLengths + maximumRunLength - 1) // maximumRunLength
+    if len(pieces) and pieces.max() > 1:
+        firstPiece = numpy.repeat(numpy.cumsum(pieces) - pieces, pieces)
+        pieceNumber = numpy.arange(int(pieces.sum())) - firstPiece
+        runEnds = numpy.repeat(runStarts + runLengths, pieces)
+        runStarts = numpy.repeat(runStarts, pieces) + pieceNumber * maximumRunLength
+        runLengths = numpy.minimum(runEnds - runStarts, maximumRunLength)
+    readEnds = readStarts + readLengths
+    runsPerRead = numpy.searchsorted(runStarts, readEnds) - numpy.searchsorted(runStarts, readStarts)
+    return qualityData[runStarts], runLengths.astype('uint8'), runsPerRead
+
+
+class RunLengthQualities(object):
+    '''
+    Run-length encoded quality strings for any number of reads, grown in batches with addBatch. Memory is two bytes per
+    run plus twelve bytes per read, which for binned 2x150 data is around a tenth of the quality bytes themselves and a
+    small fraction of a per-base tuple of Python ints.
+    '''
+
+    def __init__(self, encoding:qualityScoreHandler.EncodingScheme=qualityScoreHandler.encodingSchemes.illumina):
+        import numpy
+        self.encoding = encoding
+        self.runCharacters = numpy.zeros(0, dtype='uint8')
+        self.runLengths = numpy.zeros(0, dtype='uint8')
+        self.readLengths = numpy.zeros(0, dtype='int32')
+        self.runOffsets = numpy.zeros(1, dtype='int64')
+        self.pendingBatches = []
+
+    def addBatch(self, qualityStrings:list):
+        import numpy
+        if not qualityStrings:
+            return
+        qualityStrings = [qualityScoreHandler.qualityBytes(qualityString) for qualityString in qualityStrings]
+        readLengths = numpy.fromiter(map(len, qualityStrings), dtype='int64', count=len(qualityStrings))
+        qualityData = numpy.frombuffer(b"".join(qualityStrings), dtype='uint8')
+        self.pendingBatches.append(findRuns(qualityData, readLengths) + (readLengths,))
+
+    def consolidate(self):
+        '''
+        Folds batches added since the last call into the main arrays. Batches are kept aside until something needs to
+        read the runs so that adding many small batches does not copy the whole store every time.
+        '''
+        import numpy
+        if not self.pendingBatches:
+            return
+        runCharacters, runLengths, runsPerRead, readLengths = zip(*self.pendingBatches)
+        self.pendingBatches = []
+        self.runCharacters = numpy.concatenate((self.runCharacters,) + runCharacters)
+        self.runLengths = numpy.concatenate((self.runLengths,) + runLengths)
+        self.readLengths = numpy.concatenate((self.readLengths,) + readLengths).astype('int32')
+        newOffsets = numpy.cumsum(numpy.concatenate(runsPerRead)) + self.runOffsets[-1]
+        self.runOffsets = numpy.concatenate((self.runOffsets, newOffsets))
+
+    @property
+    def readCount(self):
+        return len(self.readLengths) + sum([len(batch[3]) for batch in self.pendingBatches])
+
+    @property
+    def runCount(self):
+        self.consolidate()
+        return len(self.runLengths)
+
+    @property
+    def longestRead(self):
+        self.consolidate()
+        if not len(self.readLengths):
+            return 0
+        return int(self.readLengths.max())
+
+    @property
+    def nbytes(self):
+        self.consolidate()
+        return self.runCharacters.nbytes + self.runLengths.nbytes + self.readLengths.nbytes + self.runOffsets.nbytes
+
+    @property
+    def distinctCharacters(self):
+        import numpy
+        self.consolidate()
+        return bytes(numpy.unique(self.runCharacters))
+
+    def runRange(self, start:int, stop:int):
+        self.consolidate()
+        firstRun = self.runOffsets[start]
+        lastRun = self.runOffsets[stop]
+        return self.runCharacters[firstRun:lastRun], self.runLengths[firstRun:lastRun]
+
+    def qualityBytes(self, index:int):
+        import numpy
+        runCharacters, runLengths = self.runRange(index, index + 1)
+        return numpy.repeat(runCharacters, runLengths).tobytes()
+
+    def phredScores(self, index:int):
+        import numpy
+        runCharacters, runLengths = self.runRange(index, index + 1)
+        return numpy.repeat(runCharacters, runLengths).astype('int16') - self.encoding.base
+
+    def qualityMatrix(self, start:int=0, stop:int=None, padCharacter:int=0):
+        '''
+        Decodes a range of reads to a 2-D uint8 array of quality bytes, laid out the same way as
+        qualityScoreHandler.qualityBatchToMatrix.
+        :return: tuple of (uint8 matrix of quality bytes, array of read lengths)
+        '''
+        import numpy
+        self.consolidate()
+        if stop is None:
+            stop = len(self.readLengths)
+        lengths = self.readLengths[start:stop].astype('int64')
+        longest = int(lengths.max()) if len(lengths) else 0
+        matrix = numpy.full((len(lengths), longest), padCharacter, dtype='uint8')
+        inRead = numpy.arange(longest) < lengths[:, None]
+        runCharacters, runLengths = self.runRange(start, stop)
+        matrix[inRead] = numpy.repeat(runCharacters, runLengths)
+        return matrix, lengths
+
+    def cumulativeExpectedErrorMatrix(self, start:int=0, stop:int=None):
+        '''
+        Cumulative expected error straight from the runs: each run adds its error probability once per base, so the
+        value at any base is the total at the end of the previous run plus the run's probability times the number of
+        bases into the run. Only one probability lookup is done per run.
+        :return: tuple of (float64 matrix with one row per read and NaN past the end of shorter reads, array of read lengths)
+        '''
+        import numpy
+        self.consolidate()
+        if stop is None:
+            stop = len(self.readLengths)
+        lengths = self.readLengths[start:stop].astype('int64')
+        longest = int(lengths.max()) if len(lengths) else 0
+        expectedErrorMatrix = numpy.full((len(lengths), longest), numpy.nan, dtype='float64')
+        runCharacters, runLengths = self.runRange(start, stop)
+        if not len(runLengths):
+            return expectedErrorMatrix, lengths
+        runLengths = runLengths.astype('int64')
+        runErrors = self.encoding.pErrorLookupTable[runCharacters]
+        runTotals = runErrors * runLengths
+        runsPerRead = numpy.diff(self.runOffsets[start:stop + 1])
+        firstRunOfRead = numpy.repeat(numpy.cumsum(runsPerRead) - runsPerRead, runsPerRead)
+        cumulativeTotals = numpy.cumsum(runTotals)
+        readBaseline = numpy.concatenate(([0.0], cumulativeTotals))[firstRunOfRead]
+        errorBeforeRun = cumulativeTotals - runTotals - readBaseline
+        baseInRun = numpy.arange(int(runLengths.sum())) - numpy.repeat(numpy.cumsum(runLengths) - runLengths, runLengths) + 1
+        inRead = numpy.arange(longest) < lengths[:, None]
+        expectedErrorMatrix[inRead] = numpy.repeat(errorBeforeRun, runLengths) + numpy.repeat(runErrors, runLengths) * baseInRun
+        return expectedErrorMatrix, lengths
+
+    def totalExpectedErrors(self):
+        '''
+        Expected errors over the whole length of each read, computed without expanding runs back out to bases.
+        '''
+        import numpy
+        self.consolidate()
+        runReads = numpy.repeat(numpy.arange(len(self.readLengths)), numpy.diff(self.runOffsets))
+        runTotals = self.encoding.pErrorLookupTable[self.runCharacters] * self.runLengths
+        return numpy.bincount(runReads, weights=runTotals, minlength=len(self.readLengths))
+
+    def iterReadRanges(self, readsPerRange:int=100000):
+        for start in range(0, self.readCount, readsPerRange):
+            yield start, min(start + readsPerRange, self.readCount)
+
+    def __len__(self):
+        return self.readCount
+
+    def __str__(self):
+        return "Run-length encoded qualities for %s reads in %s runs (%s)" %(self.readCount, self.runCount, self.encoding)
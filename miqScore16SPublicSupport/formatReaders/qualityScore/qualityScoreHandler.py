@@ -10,8 +10,11 @@ class EncodingScheme(object):
         self.base = base
         self.characterSet = self.makeCharacterSet(startCharacter, endCharacter)
         self.range = self.calculateRange(startCharacter, endCharacter)
+        self.lowestCharacter = ord(startCharacter)
+        self.highestCharacter = ord(endCharacter)
         self.fromPErrorFormula = pErrorToScore
         self.toPErrorFormula = scoreToPError
+        self.lookupTable = None
 
     def makeCharacterSet(self, start:str, end:str):
         rangeStart = ord(start)
@@ -32,6 +35,17 @@ class EncodingScheme(object):
                 raise ValueError("Attempt to get pError for entire string. Need one value at a time. String: %s" %score)
         return self.toPErrorFormula(score)
 
+    @property
+    def pErrorLookupTable(self):
+        '''
+        256-entry numpy array mapping every possible quality byte to its probability of error under this scheme, built
+        on first use. Indexing it with an array of quality bytes converts a whole read (or batch of reads) at once.
+        '''
+        if self.lookupTable is None:
+            import numpy
+            self.lookupTable = numpy.array([self.toPErrorFormula(asciiValue - self.base) for asciiValue in range(256)], dtype='float64')
+        return self.lookupTable
+
     def scoreFromPError(self, pError:float, round:bool=True):
         return self.fromPErrorFormula(pError, round)
 
@@ -44,11 +58,12 @@ class EncodingScheme(object):
         except AttributeError:
             self.eliminated = False
         if not self.eliminated:
-            qualityString = str(qualityString)
-            for character in qualityString:
-                if not character in self.characterSet:
-                    self.eliminated = True
-                    break
+            encodedQuality = qualityBytes(qualityString)
+            if encodedQuality and not self.coversByteRange(min(encodedQuality), max(encodedQuality)):
+                self.eliminated = True
+
+    def coversByteRange(self, lowestCharacter:int, highestCharacter:int):
+        return self.lowestCharacter <= lowestCharacter and highestCharacter <= self.highestCharacter
 
     def __str__(self):
         return self.name
@@ -70,15 +85,57 @@ def makeEncodingTable():
     ]
     return encodingTable
 
+def findEncodingFromByteRange(lowestCharacter:int, highestCharacter:int):
+    '''
+    Picks the most likely encoding scheme for quality strings whose characters all fall between the two given byte
+    values. Candidates are checked in the same order of likelihood as makeEncodingTable.
+    :param lowestCharacter: lowest byte value seen in the quality strings
+    :param highestCharacter: highest byte value seen in the quality strings
+    :return: EncodingScheme object, or None if no scheme covers the range
+    '''
+    for candidate in makeEncodingTable():
+        if candidate.coversByteRange(lowestCharacter, highestCharacter):
+            return candidate
+    return None
+
+
 def convertCharacterToScore(character, base:int=33):
     return ord(character) - base
 
 
+def qualityBytes(qualityString:[str, bytes]):
+    if type(qualityString) == bytes:
+        return qualityString
+    return str(qualityString).encode("ascii")
+
+
 def convertToNumericArray(qualityString, base: int = 33):
-    phredScores = []
-    for character in qualityString:
-        phredScores.append(convertCharacterToScore(character, base))
-    return tuple(phredScores)
+    return tuple([character - base for character in qualityBytes(qualityString)])
+
+
+def convertToNumpyArray(qualityString:[str, bytes], base:int = 33):
+    import numpy
+    return numpy.frombuffer(qualityBytes(qualityString), dtype='uint8').astype('int16') - base
+
+
+def qualityBatchToMatrix(qualityStrings:list, padCharacter:int = 0):
+    '''
+    Lays a batch of quality strings out as a 2-D uint8 array of raw quality bytes with one row per read. Rows for reads
+    shorter than the longest in the batch are padded out with padCharacter.
+    :param qualityStrings: list of quality strings (bytes or str)
+    :param padCharacter: byte value to use for positions past the end of a read
+    :return: tuple of (uint8 matrix of quality bytes, array of read lengths)
+    '''
+    import numpy
+    qualityStrings = [qualityBytes(qualityString) for qualityString in qualityStrings]
+    lengths = numpy.array([len(qualityString) for qualityString in qualityStrings], dtype='int64')
+    if not qualityStrings:
+        return numpy.zeros((0, 0), dtype='uint8'), lengths
+    longest = int(lengths.max())
+    matrix = numpy.full((len(qualityStrings), longest), padCharacter, dtype='uint8')
+    inRead = numpy.arange(longest) < lengths[:, None]
+    matrix[inRead] = numpy.frombuffer(b"".join(qualityStrings), dtype='uint8')
+    return matrix, lengths
 
 
 def pErrorToPhred(pError:float, roundValue:bool=True):
@@ -119,13 +176,26 @@ encodingSchemes = _Encodings()
 
 
 def cumulativeExpectedErrorArray(qualityString:str, encoding:EncodingScheme=encodingSchemes.illumina):
-    cumulativeExpectedErrorArray = []
-    cumulativeExpectedError = 0.0  #ask me no questions, I'll tell you no lies/errors
-    qualityString = str(qualityString)
-    for character in qualityString:
-        cumulativeExpectedError += encoding.toPError(character)
-        cumulativeExpectedErrorArray.append(cumulativeExpectedError)
-    return cumulativeExpectedErrorArray
+    return cumulativeExpectedErrorNumpy(qualityString, encoding).tolist()
+
+
+def cumulativeExpectedErrorNumpy(qualityString:[str, bytes], encoding:EncodingScheme=encodingSchemes.illumina):
+    import numpy
+    return numpy.cumsum(encoding.pErrorLookupTable[numpy.frombuffer(qualityBytes(qualityString), dtype='uint8')])
+
+
+def cumulativeExpectedErrorMatrix(qualityStrings:list, encoding:EncodingScheme=encodingSchemes.illumina):
+    '''
+    Vectorized cumulative expected error for a whole batch of reads.
+    :param qualityStrings: list of quality strings (bytes or str)
+    :param encoding: encoding scheme for the quality strings
+    :return: tuple of (float64 matrix of cumulative expected error with one row per read and NaN past the end of shorter reads, array of read lengths)
+    '''
+    import numpy
+    qualityMatrix, lengths = qualityBatchToMatrix(qualityStrings)
+    expectedErrorMatrix = numpy.cumsum(encoding.pErrorLookupTable[qualityMatrix], axis=1)
+    expectedErrorMatrix[numpy.arange(qualityMatrix.shape[1]) >= lengths[:, None]] = numpy.nan
+    return expectedErrorMatrix, lengths
 
 
 def cumulativeExpectedErrorArrayDada2Exact(qualityString:str, encoding:EncodingScheme=encodingSchemes.illumina):
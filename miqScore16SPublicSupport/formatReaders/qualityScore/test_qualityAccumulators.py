@@ -0,0 +1,56 @@
+from pytest import mark
+
+testQualityStrings = ["IIIIHHHGG#", "IIII5", "@@@@@@@@@@@@", "#"]
+
+
+@mark.build
+@mark.qualityScore
+def test_positionQualityHistogramGrowsAndMerges():
+    from . import qualityAccumulators, qualityScoreHandler
+    encoding = qualityScoreHandler.encodingSchemes.illumina
+    expected = [[0] * 12 for score in range(encoding.range + 1)]
+    for qualityString in testQualityStrings:
+        for position, character in enumerate(qualityString):
+            expected[ord(character) - encoding.base][position] += 1
+    firstHalf = qualityAccumulators.PositionQualityHistogram(encoding)
+    firstHalf.addBatch(testQualityStrings[:2])
+    assert firstHalf.length == 10
+    secondHalf = qualityAccumulators.PositionQualityHistogram(encoding)
+    secondHalf.addBatch([qualityString.encode() for qualityString in testQualityStrings[2:]])
+    merged = firstHalf.merge(secondHalf)
+    assert merged.readCount == 4
+    assert merged.qualityCountMatrix().tolist() == expected
+
+
+@mark.build
+@mark.qualityScore
+def test_histogramPercentilesMatchNumpy():
+    import numpy
+    from . import qualityAccumulators, qualityScoreHandler
+    generator = numpy.random.RandomState(0)
+    qualityStrings = [bytes(generator.randint(35, 74, 30).astype("uint8")) for read in range(501)]
+    qualityHistogram = qualityAccumulators.PositionQualityHistogram(qualityScoreHandler.encodingSchemes.illumina)
+    qualityHistogram.addBatch(qualityStrings)
+    scores = numpy.array([list(qualityString) for qualityString in qualityStrings]) - 33
+    for percentile in (0, 10, 83, 100):
+        assert numpy.allclose(qualityHistogram.percentiles(percentile), numpy.percentile(scores, percentile, axis=0))
+    assert numpy.allclose(qualityHistogram.means(), scores.mean(axis=0))
+
+
+@mark.build
+@mark.qualityScore
+def test_expectedErrorSketchMergesWithinAccuracy():
+    import numpy
+    from . import qualityAccumulators, qualityScoreHandler
+    encoding = qualityScoreHandler.encodingSchemes.illumina
+    generator = numpy.random.RandomState(1)
+    qualityStrings = [bytes(generator.randint(35, 74, 40).astype("uint8")) for read in range(400)]
+    firstSketch = qualityAccumulators.PositionExpectedErrorSketch(encoding)
+    firstSketch.addBatch(qualityStrings[:150])
+    secondSketch = qualityAccumulators.PositionExpectedErrorSketch(encoding)
+    secondSketch.addBatch(qualityStrings[150:])
+    sketch = firstSketch.merge(secondSketch)
+    expectedErrorMatrix, lengths = qualityScoreHandler.cumulativeExpectedErrorMatrix(qualityStrings, encoding)
+    assert numpy.allclose(sketch.means(), expectedErrorMatrix.mean(axis=0))
+    exactMedian = numpy.sort(expectedErrorMatrix, axis=0)[round(399 * 0.5)]
+    assert (numpy.abs(sketch.percentiles(50) - exactMedian) / exactMedian).max() <= sketch.relativeAccuracy
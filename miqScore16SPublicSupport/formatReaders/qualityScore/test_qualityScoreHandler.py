@@ -0,0 +1,60 @@
+from pytest import mark, approx
+
+testQualityString = "CCCCCGG7FGGGGGGGGGGGGGG9EGGF8F8FGGFGGGFGGFGGGGFG8FFGEGG*:>ECCB:AFG>)::+@>CFFG?FFD><>FE8DFF>>F31CEC*1<)9FF=**.68*:<FC:1=+9CFG**,7C?*0*0/>F<?).7)4:(4CF3"
+
+
+def slowCumulativeExpectedError(qualityString:str, encoding):
+    cumulativeExpectedErrorArray = []
+    cumulativeExpectedError = 0.0
+    for character in qualityString:
+        cumulativeExpectedError += encoding.toPError(character)
+        cumulativeExpectedErrorArray.append(cumulativeExpectedError)
+    return cumulativeExpectedErrorArray
+
+
+@mark.build
+@mark.qualityScore
+@mark.parametrize("schemeName", ["illumina", "illumina1_5", "solexa"])
+def test_lookupTableMatchesFormula(schemeName):
+    from . import qualityScoreHandler
+    encoding = getattr(qualityScoreHandler.encodingSchemes, schemeName)
+    qualityString = qualityScoreHandler.convertQualityString(testQualityString, qualityScoreHandler.encodingSchemes.illumina, encoding)
+    assert qualityScoreHandler.cumulativeExpectedErrorArray(qualityString, encoding) == approx(slowCumulativeExpectedError(qualityString, encoding))
+    assert list(qualityScoreHandler.convertToNumpyArray(qualityString, encoding.base)) == [ord(character) - encoding.base for character in qualityString]
+
+
+@mark.build
+@mark.qualityScore
+def test_cumulativeExpectedErrorMatrixPadsShortReads():
+    import numpy
+    from . import qualityScoreHandler
+    encoding = qualityScoreHandler.encodingSchemes.illumina
+    expectedErrorMatrix, lengths = qualityScoreHandler.cumulativeExpectedErrorMatrix([testQualityString, testQualityString[:20].encode()], encoding)
+    assert list(lengths) == [len(testQualityString), 20]
+    assert list(expectedErrorMatrix[0]) == approx(slowCumulativeExpectedError(testQualityString, encoding))
+    assert list(expectedErrorMatrix[1, :20]) == approx(slowCumulativeExpectedError(testQualityString[:20], encoding))
+    assert numpy.isnan(expectedErrorMatrix[1, 20:]).all()
+
+
+@mark.build
+@mark.qualityScore
+def test_runLengthQualitiesMatchUncompressed():
+    import numpy
+    from . import qualityScoreHandler, qualityRunLength
+    encoding = qualityScoreHandler.encodingSchemes.illumina
+    qualityStrings = [testQualityString, "F" * 600 + ":" * 3, "", "FFFF,,F", testQualityString[:20].encode()]
+    compactQualities = qualityRunLength.RunLengthQualities(encoding)
+    compactQualities.addBatch(qualityStrings[:2])
+    compactQualities.addBatch(qualityStrings[2:])
+    assert len(compactQualities) == 5
+    assert compactQualities.runCount < sum([len(qualityString) for qualityString in qualityStrings])
+    assert compactQualities.runLengths.max() <= qualityRunLength.maximumRunLength
+    assert [compactQualities.qualityBytes(index) for index in range(5)] == [qualityScoreHandler.qualityBytes(qualityString) for qualityString in qualityStrings]
+    expectedMatrix, expectedLengths = qualityScoreHandler.qualityBatchToMatrix(qualityStrings)
+    qualityMatrix, lengths = compactQualities.qualityMatrix()
+    assert (qualityMatrix == expectedMatrix).all() and list(lengths) == list(expectedLengths)
+    expectedErrors, lengths = qualityScoreHandler.cumulativeExpectedErrorMatrix(qualityStrings, encoding)
+    assert numpy.allclose(compactQualities.cumulativeExpectedErrorMatrix()[0], expectedErrors, equal_nan=True)
+    assert numpy.allclose(compactQualities.cumulativeExpectedErrorMatrix(1, 4)[0], expectedErrors[1:4, :603], equal_nan=True)
+    totals = [slowCumulativeExpectedError(qualityScoreHandler.qualityBytes(qualityString).decode(), encoding)[-1:] or [0] for qualityString in qualityStrings]
+    assert list(compactQualities.totalExpectedErrors()) == approx([total[0] for total in totals])
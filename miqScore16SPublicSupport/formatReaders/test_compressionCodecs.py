@@ -0,0 +1,62 @@
+import os
+from pytest import mark
+
+
+def writeCompressedCopies(folder, data:bytes):
+    import gzip
+    import bz2
+    import lzma
+    import struct
+    paths = {}
+    for codec, compress in (("plain", bytes), ("gzip", gzip.compress), ("bzip2", bz2.compress), ("xz", lzma.compress)):
+        paths[codec] = os.path.join(str(folder), "reads.%s" %codec)
+        file = open(paths[codec], "wb")
+        file.write(compress(data))
+        file.close()
+    member = gzip.compress(data)
+    extraField = b"BC" + struct.pack("<HH", 2, 0)  #BGZF block size values are not checked when sniffing
+    bgzfMember = member[:3] + bytes([member[3] | 4]) + member[4:10] + struct.pack("<H", len(extraField)) + extraField + member[10:]
+    paths["bgzf"] = os.path.join(str(folder), "reads.bgzf")
+    file = open(paths["bgzf"], "wb")
+    file.write(bgzfMember)
+    file.close()
+    return paths
+
+
+@mark.build
+def test_sniffAndReadCodecs(tmpdir, makeFastqText):
+    from . import compressionCodecs, gzipIdentifier
+    from .fastq import fastqBlockReader, fastqHandler
+    text = makeFastqText(200)
+    for codec, path in writeCompressedCopies(tmpdir, text.encode()).items():
+        assert compressionCodecs.sniffCodec(path) == codec
+        assert gzipIdentifier.isGzipped(path) == (codec in ("gzip", "bgzf"))
+        for allowExternal in (True, False):
+            stream, backendName = compressionCodecs.openDecompressedStream(path, allowExternal=allowExternal)
+            assert stream.read(-1) == text.encode()
+            stream.close()
+        reader = fastqBlockReader.FastqBlockReader(path, buildIndex=False)
+        assert reader.countRecords() == 200
+        fastq = fastqHandler.FastqFile(path)
+        assert len([read for read in fastq]) == 200
+
+
+@mark.build
+def test_externalDecompressorWithObservers(tmpdir, monkeypatch, makeFastqText):
+    import gzip
+    import hashlib
+    from . import compressionCodecs
+    from .fastq import fastqScanner
+    path = os.path.join(str(tmpdir), "reads.fastq.gz")
+    file = open(path, "wb")
+    file.write(gzip.compress(makeFastqText(5000).encode()))
+    file.close()
+    noisyGzip = ["sh", "-c", "head -c 300000 /dev/zero >&2; exec gzip -dc \"$@\"", "noisyGzip"]  #more stderr than a pipe holds
+    monkeypatch.setitem(compressionCodecs.externalDecompressors, compressionCodecs.gzip, [("noisyGzip", noisyGzip)])
+    summary = fastqScanner.scanFastq(path, [fastqScanner.ReadCounter(), fastqScanner.Md5Hasher()])
+    assert summary.decompressionBackend == "noisyGzip"
+    assert summary.readCount == 5000
+    assert summary.md5 == hashlib.md5(open(path, "rb").read()).hexdigest()
+    stream, backendName = compressionCodecs.openDecompressedStream(path)
+    assert backendName == "noisyGzip" and len(stream.read(-1)) == len(makeFastqText(5000))
+    stream.close()
@@ -0,0 +1,64 @@
+import logging
+from pytest import mark
+
+
+@mark.build
+def test_diagnosticsCollector(caplog):
+    from . import diagnostics
+    collector = diagnostics.DiagnosticsCollector("reads.fastq", exampleLimit=2)
+    with caplog.at_level(logging.WARNING):
+        for i in range(1000):
+            collector.error("invalidBase", "Bad base in read %s", i)
+        collector.warning("missingAtSymbol", "No @ on line %s", 7)
+    assert not caplog.records  #nothing is logged per issue unless asked for
+    assert collector.counts == {"invalidBase": 1000, "missingAtSymbol": 1}
+    assert collector.count() == 1001
+    assert collector.examples("invalidBase") == ["Bad base in read 0", "Bad base in read 1"]
+    with caplog.at_level(logging.WARNING):
+        collector.emitSummary()
+        collector.emitSummary()
+    assert len(caplog.records) == 1
+    assert caplog.records[0].levelno == logging.ERROR
+    assert "invalidBase: 1000" in caplog.records[0].getMessage()
+    assert "...and 998 more" in caplog.records[0].getMessage()
+    other = diagnostics.DiagnosticsCollector(exampleLimit=2)
+    other.error("invalidBase", "Bad base in read %s", 5000)
+    other.error("mateMismatch", "Mismatch on %s", "tileNumber")
+    collector.merge(other)
+    assert collector.counts["invalidBase"] == 1001 and collector.counts["mateMismatch"] == 1
+    assert len(collector.examples("invalidBase")) == 2
+    eachCollector = diagnostics.DiagnosticsCollector(logEach=True)
+    with caplog.at_level(logging.WARNING):
+        caplog.clear()
+        eachCollector.error("invalidBase", "Bad base in read %s", 3)
+    assert caplog.records[0].getMessage() == "Bad base in read 3"
+    from .fastq import fastqHandler
+    with caplog.at_level(logging.WARNING):
+        caplog.clear()
+        fastqHandler.SequenceLine("ACGX", runAnalysis=True)
+    assert "Character: X" in caplog.records[0].getMessage()  #nothing summarizes records read outside a scan, so they log right away
+
+
+@mark.build
+@mark.fastq
+def test_recordIssuesAreSummarized(tmpdir, caplog, makeFastqText, writeFastq):
+    from .fastq import fastqHandler, fastqScanner
+    text = makeFastqText(50).replace("ACGTACGT", "ACGTXCGT")
+    path = writeFastq(tmpdir, "reads.fastq", text)
+    with caplog.at_level(logging.WARNING):
+        fastq = fastqHandler.FastqFile(path, analyzeSequenceInDepth=True)
+        for read in fastq:
+            pass
+    summaries = [record for record in caplog.records if "invalidBase" in record.getMessage()]
+    assert len(summaries) == 1
+    assert fastq.diagnostics.count("invalidBase") == text.count("X")
+    badHeaders = makeFastqText(30).replace(":N:0:1", ":N:1:1")
+    badPath = writeFastq(tmpdir, "badHeaders.fastq", badHeaders)
+    caplog.clear()
+    validator = fastqScanner.FormatValidator(logErrors=False, failFast=False)
+    with caplog.at_level(logging.WARNING):
+        fastqScanner.scanFastq(badPath, [validator])
+    assert validator.diagnostics.count("oddControlBits") == 1
+    assert validator.diagnostics.count("FastqValidationError") == 1
+    assert len(caplog.records) == 1
+    assert badPath in caplog.records[0].getMessage()
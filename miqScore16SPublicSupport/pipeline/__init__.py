@@ -0,0 +1,11 @@
+from . import batchScheduler
+from . import rRunner
+from . import rWorker
+from . import stepCache
+from . import stepGraph
+
+__all__ = ["batchScheduler",
+           "rRunner",
+           "rWorker",
+           "stepCache",
+           "stepGraph"]
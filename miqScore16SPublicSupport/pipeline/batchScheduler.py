@@ -0,0 +1,98 @@
+'''
+Sizing and bookkeeping for running many samples at once. The number of samples run at the same time is whatever fits in
+both the core budget and the memory budget, and samples are handed out largest first so that the longest jobs are not
+left running alone at the end of a batch.
+'''
+import os
+import logging
+logger = logging.getLogger(__name__)
+from . import rRunner
+
+summaryFields = ("sampleName", "sampleID", "status", "miqScore", "readPairs", "seconds", "outputFolder", "resultFile", "reportFile", "error")
+
+
+def availableMemory():
+    '''
+    :return: megabytes of memory available for new work according to /proc/meminfo, or None if it cannot be read
+    '''
+    try:
+        memoryInfo = open("/proc/meminfo", "r")
+    except OSError:
+        return None
+    availableKB = None
+    for line in memoryInfo:
+        if line.startswith("MemAvailable:"):
+            availableKB = int(line.split()[1])
+            break
+    memoryInfo.close()
+    if availableKB is None:
+        return None
+    return availableKB // 1024
+
+
+def concurrentSampleCount(sampleCount:int, coreBudget:int=0, memoryBudget:int=0, coresPerSample:int=1, memoryPerSample:int=0):
+    '''
+    :param coreBudget: cores the whole batch may use, or 0 for every core available to this process
+    :param memoryBudget: megabytes the whole batch may use, or 0 for the memory available now
+    :param coresPerSample: cores each running sample is given
+    :param memoryPerSample: megabytes each running sample is expected to need at its peak (0 to ignore memory)
+    :return: how many samples to run at the same time (at least one, so a batch always makes progress)
+    '''
+    if coreBudget < 1:
+        coreBudget = rRunner.availableCores()
+    limits = [sampleCount, coreBudget // max(coresPerSample, 1)]
+    if memoryPerSample > 0:
+        if memoryBudget < 1:
+            memoryBudget = availableMemory()
+        if memoryBudget is not None:
+            limits.append(memoryBudget // memoryPerSample)
+    return max(min(limits), 1)
+
+
+def largestFirst(samples:list, sizeFunction):
+    '''
+    :param sizeFunction: called on each sample to get its size (such as total read file bytes)
+    :return: samples sorted from largest to smallest, keeping manifest order between samples of the same size
+    '''
+    return sorted(samples, key=sizeFunction, reverse=True)
+
+
+class BatchSummary(object):
+    '''
+    One record per sample with the fields in summaryFields, kept in manifest order for output however the samples
+    finished.
+    '''
+
+    def __init__(self, sampleOrder:list=()):
+        self.sampleOrder = {sampleID: index for index, sampleID in enumerate(sampleOrder)}
+        self.records = []
+
+    def add(self, record:dict):
+        self.records.append({field: record.get(field) for field in summaryFields})
+        return record
+
+    def orderedRecords(self):
+        return sorted(self.records, key=lambda record: self.sampleOrder.get(record["sampleID"], len(self.sampleOrder)))
+
+    def count(self, status:str):
+        return len([record for record in self.records if record["status"] == status])
+
+    def writeCSV(self, path:str):
+        import csv
+        outputFile = open(path, "w", newline="")
+        writer = csv.DictWriter(outputFile, summaryFields)
+        writer.writeheader()
+        for record in self.orderedRecords():
+            writer.writerow(record)
+        outputFile.close()
+        return path
+
+    def writeJSON(self, path:str):
+        import json
+        outputFile = open(path, "w")
+        json.dump({"samples": self.orderedRecords(), "succeeded": self.count("succeeded"), "failed": self.count("failed")}, outputFile, indent=2)
+        outputFile.close()
+        return path
+
+    def __str__(self):
+        return "Batch of %s samples: %s succeeded, %s failed" %(len(self.records), self.count("succeeded"), self.count("failed"))
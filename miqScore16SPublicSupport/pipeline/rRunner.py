@@ -0,0 +1,129 @@
+'''
+Runs R scripts as subprocesses, several at a time if asked, with each one's exit status, standard output and standard
+error captured. Output goes to temporary files rather than pipes so a chatty script can never stall on a full pipe
+while another job is being waited on.
+'''
+import os
+import logging
+logger = logging.getLogger(__name__)
+
+stderrTailLines = 20
+
+
+class RScriptError(RuntimeError):
+
+    def __init__(self, job):
+        self.job = job
+        self.exitCode = job.exitCode
+        self.stderr = job.stderr
+        tail = "\n".join(job.stderr.splitlines()[-stderrTailLines:])
+        super().__init__("R script job %s exited with status %s. Last lines of standard error:\n%s" %(job.name, job.exitCode, tail))
+
+
+def availableCores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  #not available on every platform
+        return os.cpu_count() or 1
+
+
+def splitCores(coreBudget:int, jobCount:int):
+    '''
+    Divides a core budget as evenly as possible between jobs running at the same time, giving each at least one.
+    :param coreBudget: cores to share out, or 0 for every core available to this process
+    :return: list of core counts, one per job
+    '''
+    if jobCount < 1:
+        return []
+    if coreBudget < 1:
+        coreBudget = availableCores()
+    share, remainder = divmod(max(coreBudget, jobCount), jobCount)
+    return [share + 1 if jobNumber < remainder else share for jobNumber in range(jobCount)]
+
+
+def buildRscriptCommand(rScriptExecutable:str, scriptPath:str, arguments:dict):
+    '''
+    :return: argument list for subprocess, with each key of arguments as a single letter flag
+    '''
+    command = [rScriptExecutable, scriptPath]
+    for flag, value in arguments.items():
+        command.extend(["-%s" %flag, str(value)])
+    return command
+
+
+class RScriptJob(object):
+    '''
+    One Rscript call.
+    :param name: label used in logs and errors
+    :param command: argument list as built by buildRscriptCommand
+    '''
+
+    def __init__(self, name:str, command:list):
+        self.name = name
+        self.command = command
+        self.process = None
+        self.stdoutFile = None
+        self.stderrFile = None
+        self.exitCode = None
+        self.stdout = ""
+        self.stderr = ""
+
+    @property
+    def commandText(self):
+        import shlex
+        return " ".join([shlex.quote(argument) for argument in self.command])
+
+    def start(self):
+        import subprocess
+        import tempfile
+        self.stdoutFile = tempfile.TemporaryFile()
+        self.stderrFile = tempfile.TemporaryFile()
+        logger.info("Starting %s: %s" %(self.name, self.commandText))
+        self.process = subprocess.Popen(self.command, stdout=self.stdoutFile, stderr=self.stderrFile)
+        return self
+
+    def wait(self):
+        self.exitCode = self.process.wait()
+        self.stdout = self.readOutput(self.stdoutFile)
+        self.stderr = self.readOutput(self.stderrFile)
+        if self.exitCode == 0:
+            logger.info("%s returned exit status 0" %self.name)
+        else:
+            logger.error("%s (%s) returned exit status %s" %(self.name, self.commandText, self.exitCode))
+        return self.exitCode
+
+    @staticmethod
+    def readOutput(outputFile):
+        outputFile.seek(0)
+        output = outputFile.read().decode(errors="replace")
+        outputFile.close()
+        return output
+
+    @property
+    def succeeded(self):
+        return self.exitCode == 0
+
+    def __str__(self):
+        return "R script job %s (exit status %s)" %(self.name, self.exitCode)
+
+
+def runConcurrently(jobs:list, raiseOnError:bool=True):
+    '''
+    Starts every job, then waits for all of them. Every job is waited on even after one fails, so no R process is left
+    running and every failure is logged.
+    :param raiseOnError: raise RScriptError for the first failed job once all have finished
+    :return: the jobs, with exit codes and output filled in
+    '''
+    for job in jobs:
+        job.start()
+    for job in jobs:
+        job.wait()
+        for line in job.stdout.splitlines():
+            logger.info("%s: %s" %(job.name, line))
+        if not job.succeeded:
+            for line in job.stderr.splitlines()[-stderrTailLines:]:
+                logger.error("%s: %s" %(job.name, line))
+    failures = [job for job in jobs if not job.succeeded]
+    if failures and raiseOnError:
+        raise RScriptError(failures[0])
+    return jobs
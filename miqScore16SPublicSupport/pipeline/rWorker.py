@@ -0,0 +1,247 @@
+'''
+Warm R processes for running the dada2 step scripts. Each RWorker keeps one dada2.worker.R process alive with dada2
+already loaded and sends it the same script and arguments an RScriptJob would pass to Rscript, so every step after the
+first skips R startup and library loading. RWorkerPool holds several so that independent jobs (such as the two error
+model builds) still run at the same time. Anything that goes wrong starting a worker raises RWorkerError, and callers
+can fall back to running each job as its own Rscript process.
+'''
+import os
+import logging
+logger = logging.getLogger(__name__)
+from . import rRunner
+
+protocolMarker = "@@dada2worker"
+workerScriptName = "dada2.worker.R"
+startupTimeout = 300  #seconds
+
+
+class RWorkerError(RuntimeError):
+    pass
+
+
+class RWorker(object):
+    '''
+    :param rScriptExecutable: path to Rscript
+    :param workerScript: path to dada2.worker.R
+    :param name: label used in logs
+    :param jobTimeout: seconds to wait for a job before giving up on the worker (None to wait forever)
+    '''
+
+    def __init__(self, rScriptExecutable:str, workerScript:str, name:str="R worker", jobTimeout:float=None):
+        self.rScriptExecutable = rScriptExecutable
+        self.workerScript = workerScript
+        self.name = name
+        self.jobTimeout = jobTimeout
+        self.process = None
+        self.lines = None
+        self.readerThread = None
+        self.currentJob = None
+        self.jobCount = 0
+        self.ready = False
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        import queue
+        import subprocess
+        import threading
+        logger.info("Starting %s: %s %s" %(self.name, self.rScriptExecutable, self.workerScript))
+        try:
+            self.process = subprocess.Popen([self.rScriptExecutable, self.workerScript], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1)
+        except OSError as error:
+            raise RWorkerError("Unable to start %s: %s" %(self.name, error))
+        self.ready = False
+        self.lines = queue.Queue()
+        self.readerThread = threading.Thread(target=self.readOutput, args=(self.process.stdout, self.lines), daemon=True)
+        self.readerThread.start()
+        return self
+
+    @staticmethod
+    def readOutput(stream, lines):
+        '''
+        Moves the worker's output into a queue on a separate thread, so a worker is never blocked on a full pipe while
+        another worker's job is being collected.
+        '''
+        for line in stream:
+            lines.put(line.rstrip("\n"))
+        lines.put(None)
+
+    def nextResponse(self, timeout:float=None):
+        '''
+        Reads output until the next protocol line.
+        :return: tuple of (list of protocol fields, or None if the worker exited, list of output lines before it)
+        '''
+        import queue
+        output = []
+        while True:
+            try:
+                line = self.lines.get(timeout=timeout)
+            except queue.Empty:
+                raise RWorkerError("%s did not respond within %s seconds" %(self.name, timeout))
+            if line is None:
+                return None, output
+            markerPosition = line.find(protocolMarker)
+            if markerPosition == -1:
+                output.append(line)
+                continue
+            if markerPosition:
+                output.append(line[:markerPosition])
+            return line[markerPosition:].split("\t")[1:], output
+
+    def waitUntilReady(self):
+        response, output = self.nextResponse(startupTimeout)
+        if not response or not response[0] == "READY":
+            self.stop()
+            raise RWorkerError("%s failed to start:\n%s" %(self.name, "\n".join(output[-rRunner.stderrTailLines:])))
+        self.ready = True
+        logger.info("%s is ready" %self.name)
+        return self
+
+    def submit(self, job:rRunner.RScriptJob):
+        '''
+        Sends a job to the worker without waiting for it to finish.
+        '''
+        if self.currentJob is not None:
+            raise RWorkerError("%s is already running %s" %(self.name, self.currentJob.name))
+        if not self.running:
+            self.start()
+        if not self.ready:
+            self.waitUntilReady()
+        fields = ["RUN", str(self.jobCount)] + [str(argument) for argument in job.command[1:]]
+        for field in fields:
+            if "\t" in field or "\n" in field:
+                raise ValueError("Unable to send an argument containing a tab or line break to %s: %r" %(self.name, field))
+        logger.info("Sending %s to %s: %s" %(job.name, self.name, job.commandText))
+        self.process.stdin.write("\t".join(fields) + "\n")
+        self.process.stdin.flush()
+        self.currentJob = job
+        return job
+
+    def collect(self):
+        '''
+        Waits for the submitted job to finish and fills in its exit code (0 or 1, or the worker's own exit status if
+        the worker died) and output. The error message from R, if any, goes in the job's stderr. Raises RWorkerError,
+        after killing the worker, if the job takes longer than jobTimeout.
+        '''
+        job = self.currentJob
+        try:
+            response, output = self.nextResponse(self.jobTimeout)
+        except RWorkerError:
+            self.kill()
+            raise
+        job.stdout = "\n".join(output)
+        for line in output:
+            logger.info("%s: %s" %(job.name, line))
+        if response is None:
+            self.process.wait()
+            job.exitCode = self.process.returncode or 1
+            job.stderr = "%s exited while running %s" %(self.name, job.name)
+            self.process = None
+            self.ready = False
+        elif response[0] == "DONE":
+            job.exitCode = 0
+        else:
+            job.exitCode = 1
+            job.stderr = "\t".join(response[2:])
+        self.currentJob = None
+        self.jobCount += 1
+        if job.succeeded:
+            logger.info("%s returned exit status 0 from %s" %(job.name, self.name))
+        else:
+            logger.error("%s (%s) failed in %s: %s" %(job.name, job.commandText, self.name, job.stderr))
+        return job
+
+    def kill(self):
+        if self.process is not None:
+            if self.running:
+                self.process.kill()
+            self.process.wait()
+        self.process = None
+        self.ready = False
+        self.currentJob = None
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.running:
+            try:
+                self.process.stdin.write("QUIT\n")
+                self.process.stdin.close()
+                self.process.wait(timeout=30)
+            except Exception:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+        self.ready = False
+
+    def __str__(self):
+        return "%s (%s jobs run, running: %s)" %(self.name, self.jobCount, self.running)
+
+
+class RWorkerPool(object):
+    '''
+    :param rScriptExecutable: path to Rscript
+    :param rScriptFolder: folder holding dada2.worker.R and the step scripts
+    :param size: number of workers, which is the most jobs that run at the same time
+    :param jobTimeout: seconds each job may take in a worker (None for no limit)
+    '''
+
+    def __init__(self, rScriptExecutable:str, rScriptFolder:str, size:int=2, jobTimeout:float=None):
+        workerScript = os.path.join(rScriptFolder, workerScriptName)
+        self.workers = [RWorker(rScriptExecutable, workerScript, "R worker %s" %number, jobTimeout) for number in range(size)]
+
+    def start(self):
+        '''
+        Starts every worker before waiting on any, so they load their libraries at the same time.
+        '''
+        try:
+            for worker in self.workers:
+                if not worker.running:
+                    worker.start()
+            for worker in self.workers:
+                if not worker.ready:
+                    worker.waitUntilReady()
+        except RWorkerError:
+            self.stop()
+            raise
+        return self
+
+    def runConcurrently(self, jobs:list, raiseOnError:bool=True):
+        '''
+        Same contract as rRunner.runConcurrently, with at most one job per worker at a time. Jobs a worker could not
+        start or finish in time are rerun as their own Rscript processes.
+        '''
+        fallbackJobs = []
+        for firstJob in range(0, len(jobs), len(self.workers)):
+            batch = jobs[firstJob:firstJob + len(self.workers)]
+            submitted = []
+            for worker, job in zip(self.workers, batch):
+                try:
+                    submitted.append((worker, worker.submit(job)))
+                except RWorkerError as error:
+                    logger.warning("%s. Running %s as its own Rscript process instead." %(error, job.name))
+                    fallbackJobs.append(job)
+            for worker, job in submitted:
+                try:
+                    worker.collect()
+                except RWorkerError as error:
+                    logger.warning("%s. Running %s as its own Rscript process instead." %(error, job.name))
+                    fallbackJobs.append(job)
+        if fallbackJobs:
+            rRunner.runConcurrently(fallbackJobs, raiseOnError=False)
+        failures = [job for job in jobs if not job.succeeded]
+        if failures and raiseOnError:
+            raise rRunner.RScriptError(failures[0])
+        return jobs
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
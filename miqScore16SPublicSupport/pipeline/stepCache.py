@@ -0,0 +1,258 @@
+'''
+Content-addressed storage for the outputs of pipeline steps, shared safely between processes.
+'''
+import os
+import json
+import logging
+logger = logging.getLogger(__name__)
+
+manifestFileName = "entry.json"
+lockFileName = ".lock"
+valuesFileName = "values.pickle"
+checksumBlockSize = 1024 * 1024
+checksumCache = {}
+
+
+def fileCacheKey(path:str):
+    fileStats = os.stat(path)
+    return os.path.abspath(path), fileStats.st_size, fileStats.st_mtime_ns
+
+
+def rememberChecksum(path:str, checksum:str):
+    '''
+    Records an MD5 already calculated elsewhere so the file is not read again.
+    '''
+    checksumCache[fileCacheKey(path)] = checksum
+
+
+def fileChecksum(path:str):
+    '''
+    MD5 of a file's contents, remembered by path, size and modification time.
+    '''
+    import hashlib
+    cacheKey = fileCacheKey(path)
+    if cacheKey in checksumCache:
+        return checksumCache[cacheKey]
+    md5 = hashlib.md5()
+    file = open(path, "rb")
+    for chunk in iter(lambda: file.read(checksumBlockSize), b""):
+        md5.update(chunk)
+    file.close()
+    checksumCache[cacheKey] = md5.hexdigest()
+    return checksumCache[cacheKey]
+
+
+def makeStepKey(stepName:str, version:str="", parameters:dict=None, inputFiles:list=(), scripts:list=(), dependencyKeys:list=()):
+    '''
+    :return: hex digest identifying a step run with exactly these inputs
+    '''
+    import hashlib
+    if parameters is None:
+        parameters = {}
+    keyData = {"step": stepName,
+               "version": version,
+               "parameters": parameters,
+               "inputs": [fileChecksum(path) for path in inputFiles],
+               "scripts": [fileChecksum(path) for path in scripts],
+               "dependencies": list(dependencyKeys)}
+    keyText = json.dumps(keyData, sort_keys=True, default=str)
+    return hashlib.sha256(keyText.encode()).hexdigest()
+
+
+def directorySize(path:str):
+    totalSize = 0
+    for folder, subfolders, fileNames in os.walk(path):
+        for fileName in fileNames:
+            totalSize += os.path.getsize(os.path.join(folder, fileName))
+    return totalSize
+
+
+def linkOrCopy(source:str, destination:str):
+    '''
+    Hard links where the file system allows it (no extra space or copy time), copies otherwise.
+    '''
+    import shutil
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class CacheEntry(object):
+
+    def __init__(self, cacheFolder:str, key:str):
+        self.key = key
+        self.folder = os.path.join(cacheFolder, key)
+        self.manifestPath = os.path.join(self.folder, manifestFileName)
+        self.manifest = None
+
+    def exists(self):
+        return os.path.isfile(self.manifestPath)
+
+    def load(self):
+        manifestFile = open(self.manifestPath, "r")
+        self.manifest = json.load(manifestFile)
+        manifestFile.close()
+        return self.manifest
+
+    @property
+    def lastUsed(self):
+        return os.path.getmtime(self.manifestPath)
+
+    def touch(self):
+        os.utime(self.manifestPath, None)
+
+    def size(self):
+        return directorySize(self.folder)
+
+    def __str__(self):
+        return "Cache entry %s at %s" %(self.key, self.folder)
+
+
+class CacheLock(object):
+    '''
+    Exclusive flock on a cache folder, across processes and threads. Not reentrant.
+    '''
+
+    def __init__(self, cacheFolder:str):
+        self.path = os.path.join(cacheFolder, lockFileName)
+        self.lockFile = None
+
+    def __enter__(self):
+        import fcntl
+        self.lockFile = open(self.path, "a")
+        fcntl.flock(self.lockFile, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exceptionType, exceptionValue, traceback):
+        import fcntl
+        fcntl.flock(self.lockFile, fcntl.LOCK_UN)
+        self.lockFile.close()
+        self.lockFile = None
+
+
+class StepCache(object):
+    '''
+    :param cacheFolder: folder holding the cache entries, created if needed
+    :param sizeLimit: bytes the cache may hold before least recently used entries are removed (0 for no limit)
+    '''
+
+    def __init__(self, cacheFolder:str, sizeLimit:int=0):
+        self.cacheFolder = os.path.abspath(cacheFolder)
+        self.sizeLimit = sizeLimit
+        if not os.path.isdir(self.cacheFolder):
+            os.makedirs(self.cacheFolder, exist_ok=True)
+
+    def lock(self):
+        return CacheLock(self.cacheFolder)
+
+    def entry(self, key:str):
+        return CacheEntry(self.cacheFolder, key)
+
+    def entries(self):
+        entries = [self.entry(name) for name in os.listdir(self.cacheFolder) if not name.startswith(".")]  #skips the lock file and entries still being staged
+        return [entry for entry in entries if entry.exists()]
+
+    def contains(self, key:str):
+        return self.entry(key).exists()
+
+    def restore(self, key:str, outputFiles:dict):
+        '''
+        :param outputFiles: dictionary of output name to the path the file should be restored to
+        :return: tuple of (dictionary of output files, dictionary of cached values), or None if not cached
+        '''
+        with self.lock():
+            return self.restoreEntry(key, outputFiles)
+
+    def restoreEntry(self, key:str, outputFiles:dict):
+        import pickle
+        entry = self.entry(key)
+        if not entry.exists():
+            return None
+        manifest = entry.load()
+        if not set(outputFiles).issubset(manifest["files"]):
+            logger.warning("Cache entry for %s step %s is missing output files %s and will be rebuilt" %(manifest["step"], key, sorted(set(outputFiles) - set(manifest["files"]))))
+            return None
+        for name, destination in outputFiles.items():
+            destinationFolder = os.path.split(os.path.abspath(destination))[0]
+            if not os.path.isdir(destinationFolder):
+                os.makedirs(destinationFolder)
+            linkOrCopy(os.path.join(entry.folder, manifest["files"][name]), destination)
+        values = {}
+        valuesPath = os.path.join(entry.folder, valuesFileName)
+        if os.path.isfile(valuesPath):
+            valuesFile = open(valuesPath, "rb")
+            values = pickle.load(valuesFile)
+            valuesFile.close()
+        entry.touch()
+        return outputFiles, values
+
+    def store(self, key:str, stepName:str, outputFiles:dict, values:dict=None):
+        '''
+        :param outputFiles: dictionary of output name to path of the file the step wrote
+        :param values: picklable results later steps need
+        '''
+        import pickle
+        import shutil
+        import tempfile
+        entry = self.entry(key)
+        with self.lock():
+            if entry.exists():
+                entry.touch()
+                return entry
+        stagingFolder = tempfile.mkdtemp(prefix=".%s." %key[:12], dir=self.cacheFolder)
+        manifest = {"step": stepName, "key": key, "files": {}}
+        for name, path in outputFiles.items():
+            cachedName = "%s.%s" %(name, os.path.split(path)[1])
+            linkOrCopy(path, os.path.join(stagingFolder, cachedName))
+            manifest["files"][name] = cachedName
+        if values:
+            valuesFile = open(os.path.join(stagingFolder, valuesFileName), "wb")
+            pickle.dump(values, valuesFile)
+            valuesFile.close()
+        manifestFile = open(os.path.join(stagingFolder, manifestFileName), "w")
+        json.dump(manifest, manifestFile, indent=2)
+        manifestFile.close()
+        with self.lock():
+            try:
+                os.rename(stagingFolder, entry.folder)
+            except OSError:  #another run stored the same key first
+                shutil.rmtree(stagingFolder, ignore_errors=True)
+            self.removeLeastRecentlyUsed(keep=key)
+        return entry
+
+    def evict(self, keep:str=None):
+        '''
+        :param keep: key of an entry that should survive even if it alone is over the limit
+        :return: list of keys removed
+        '''
+        with self.lock():
+            return self.removeLeastRecentlyUsed(keep)
+
+    def removeLeastRecentlyUsed(self, keep:str=None):
+        import shutil
+        if not self.sizeLimit:
+            return []
+        entries = sorted(self.entries(), key=lambda entry: entry.lastUsed)
+        sizes = {entry.key: entry.size() for entry in entries}
+        totalSize = sum(sizes.values())
+        removed = []
+        for entry in entries:
+            if totalSize <= self.sizeLimit:
+                break
+            if entry.key == keep:
+                continue
+            shutil.rmtree(entry.folder, ignore_errors=True)
+            totalSize -= sizes[entry.key]
+            removed.append(entry.key)
+        if removed:
+            logger.info("Removed %s least recently used step cache entries to bring %s under %s bytes" %(len(removed), self.cacheFolder, self.sizeLimit))
+        return removed
+
+    def size(self):
+        return sum([entry.size() for entry in self.entries()])
+
+    def __str__(self):
+        return "Step cache at %s (limit %s bytes)" %(self.cacheFolder, self.sizeLimit)
@@ -0,0 +1,146 @@
+'''
+Pipeline steps run in dependency order, with outputs reused from a StepCache.
+'''
+import os
+import logging
+logger = logging.getLogger(__name__)
+from . import stepCache
+
+
+class PipelineStep(object):
+    '''
+    :param function: takes a dictionary of upstream results keyed by step name and returns a dictionary of results
+    :param parameters: every setting that changes the step's outputs
+    :param inputFiles: files from outside the pipeline that are checksummed into the key
+    :param scripts: scripts the step runs, checksummed into the key
+    :param outputFiles: dictionary of output name to the path the step writes it to
+    :param version: bump when the step's own code changes its outputs
+    :param cacheable: False for steps that should always run
+    '''
+
+    def __init__(self, name:str, function, dependencies:list=(), parameters:dict=None, inputFiles:list=(), scripts:list=(), outputFiles:dict=None, version:str="1", cacheable:bool=True):
+        self.name = name
+        self.function = function
+        self.dependencies = list(dependencies)
+        if parameters is None:
+            parameters = {}
+        self.parameters = parameters
+        self.inputFiles = list(inputFiles)
+        self.scripts = list(scripts)
+        if outputFiles is None:
+            outputFiles = {}
+        self.outputFiles = outputFiles
+        self.version = version
+        self.cacheable = cacheable
+        self.key = None
+
+    def makeKey(self, dependencyKeys:list):
+        self.key = stepCache.makeStepKey(self.name, self.version, self.parameters, self.inputFiles, self.scripts, dependencyKeys)
+        return self.key
+
+    def removeOldOutputs(self):
+        '''
+        Removes existing outputs, which may be hard links into the cache.
+        '''
+        for path in self.outputFiles.values():
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def run(self, upstreamResults:dict):
+        self.removeOldOutputs()
+        results = self.function(upstreamResults)
+        if results is None:
+            results = {}
+        for name, path in self.outputFiles.items():
+            if not name in results:
+                raise RuntimeError("Pipeline step %s did not return its %s output" %(self.name, name))
+            if not os.path.isfile(path):
+                raise RuntimeError("Pipeline step %s did not write its %s output to %s" %(self.name, name, path))
+        return results
+
+    def __str__(self):
+        return "Pipeline step %s (depends on %s)" %(self.name, self.dependencies)
+
+
+class PipelineGraph(object):
+
+    def __init__(self, cache:stepCache.StepCache=None):
+        self.cache = cache
+        self.steps = {}
+        self.results = {}
+        self.cachedSteps = []
+        self.completedSteps = []
+
+    def addStep(self, step:PipelineStep):
+        if step.name in self.steps:
+            raise ValueError("Pipeline already has a step named %s" %step.name)
+        self.steps[step.name] = step
+        return step
+
+    def order(self, targets:list=None):
+        '''
+        :param targets: names of the steps wanted, or None for every step
+        :return: list of the targets and their dependencies in run order
+        '''
+        ordered = []
+        visiting = set()
+        done = set()
+
+        def visit(name:str, path:list):
+            if name in done:
+                return
+            if not name in self.steps:
+                raise ValueError("Pipeline step %s depends on %s, which is not in the pipeline" %(path[-1], name))
+            if name in visiting:
+                raise ValueError("Pipeline steps have a circular dependency: %s" %" -> ".join(path + [name]))
+            visiting.add(name)
+            for dependency in self.steps[name].dependencies:
+                visit(dependency, path + [name])
+            visiting.remove(name)
+            done.add(name)
+            ordered.append(self.steps[name])
+
+        if targets is None:
+            targets = list(self.steps)
+        for name in targets:
+            if not name in self.steps:
+                raise ValueError("No pipeline step named %s" %name)
+            visit(name, [])
+        return ordered
+
+    def runStep(self, step:PipelineStep, force:bool=False):
+        upstreamResults = {dependency: self.results[dependency] for dependency in step.dependencies}
+        step.makeKey([self.steps[dependency].key for dependency in step.dependencies])
+        useCache = self.cache is not None and step.cacheable
+        if useCache and not force:
+            cached = self.cache.restore(step.key, step.outputFiles)
+            if cached is not None:
+                outputFiles, values = cached
+                logger.info("Reusing cached outputs for pipeline step %s (%s)" %(step.name, step.key))
+                results = dict(values)
+                results.update(outputFiles)
+                self.cachedSteps.append(step.name)
+                return results
+        logger.info("Running pipeline step %s" %step.name)
+        results = step.run(upstreamResults)
+        if useCache:
+            values = {name: value for name, value in results.items() if not name in step.outputFiles}
+            self.cache.store(step.key, step.name, {name: results[name] for name in step.outputFiles}, values)
+        self.completedSteps.append(step.name)
+        return results
+
+    def run(self, force:list=(), targets:list=None):
+        '''
+        :param force: names of steps to run even if they are cached
+        :param targets: names of the steps to run with their dependencies, or None for every step
+        :return: dictionary of each step's results keyed by step name
+        '''
+        for step in self.order(targets):
+            self.results[step.name] = self.runStep(step, step.name in force)
+        return self.results
+
+    def __getitem__(self, item:str):
+        return self.steps[item]
+
+    def __str__(self):
+        return "Pipeline of %s steps (%s)" %(len(self.steps), ", ".join([step.name for step in self.order()]))
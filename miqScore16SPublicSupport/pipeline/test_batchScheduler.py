@@ -0,0 +1,37 @@
+from pytest import mark
+
+
+@mark.build
+@mark.pipeline
+def test_concurrentSampleCount():
+    from . import batchScheduler
+    assert batchScheduler.concurrentSampleCount(10, coreBudget=32, coresPerSample=8) == 4
+    assert batchScheduler.concurrentSampleCount(10, coreBudget=32, memoryBudget=20000, coresPerSample=8, memoryPerSample=8192) == 2
+    assert batchScheduler.concurrentSampleCount(3, coreBudget=64, memoryBudget=100000, coresPerSample=4, memoryPerSample=1000) == 3
+    assert batchScheduler.concurrentSampleCount(10, coreBudget=4, memoryBudget=1000, coresPerSample=8, memoryPerSample=8192) == 1
+    assert batchScheduler.concurrentSampleCount(10, coresPerSample=1) >= 1
+    assert batchScheduler.largestFirst(["b", "ccc", "a", "dd"], len) == ["ccc", "dd", "b", "a"]
+
+
+@mark.build
+@mark.pipeline
+def test_batchSummary(tmpdir):
+    import csv
+    import json
+    import os
+    from . import batchScheduler
+    summary = batchScheduler.BatchSummary(["sample_1", "sample_2", "sample_3"])
+    summary.add({"sampleName": "third", "sampleID": "sample_3", "status": "failed", "error": "FileNotFoundError: missing reads"})
+    summary.add({"sampleName": "first", "sampleID": "sample_1", "status": "succeeded", "miqScore": 87, "readPairs": 50000})
+    assert str(summary) == "Batch of 2 samples: 1 succeeded, 1 failed"
+    csvPath = summary.writeCSV(os.path.join(str(tmpdir), "batchSummary.csv"))
+    csvFile = open(csvPath, "r")
+    rows = list(csv.DictReader(csvFile))
+    csvFile.close()
+    assert [row["sampleID"] for row in rows] == ["sample_1", "sample_3"]
+    assert rows[0]["miqScore"] == "87" and rows[1]["error"] == "FileNotFoundError: missing reads"
+    jsonFile = open(summary.writeJSON(os.path.join(str(tmpdir), "batchSummary.json")), "r")
+    summaryData = json.load(jsonFile)
+    jsonFile.close()
+    assert summaryData["succeeded"] == 1 and summaryData["failed"] == 1
+    assert summaryData["samples"][0]["readPairs"] == 50000
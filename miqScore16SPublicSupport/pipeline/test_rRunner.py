@@ -0,0 +1,35 @@
+import sys
+from pytest import mark, raises
+
+
+@mark.build
+@mark.pipeline
+def test_splitCores():
+    from . import rRunner
+    assert rRunner.splitCores(32, 2) == [16, 16]
+    assert rRunner.splitCores(5, 2) == [3, 2]
+    assert rRunner.splitCores(1, 2) == [1, 1]
+    assert sum(rRunner.splitCores(0, 2)) == max(rRunner.availableCores(), 2)
+    assert rRunner.buildRscriptCommand("Rscript", "script.R", {"i": "in.txt", "t": 4}) == ["Rscript", "script.R", "-i", "in.txt", "-t", "4"]
+
+
+@mark.build
+@mark.pipeline
+def test_runConcurrently(tmpdir, caplog):
+    import logging
+    from . import rRunner
+    sleeper = "import sys, time; start = time.time(); time.sleep(0.5); print(start, time.time()); print('done'); sys.stderr.write('progress\\n')"
+    jobs = [rRunner.RScriptJob("job%s" %number, [sys.executable, "-c", sleeper]) for number in range(2)]
+    with caplog.at_level(logging.INFO):
+        rRunner.runConcurrently(jobs)
+    times = [[float(value) for value in job.stdout.splitlines()[0].split()] for job in jobs]
+    assert max([start for start, end in times]) < min([end for start, end in times])  #both ran at once
+    assert all([job.exitCode == 0 and job.stdout.splitlines()[-1] == "done" and job.stderr.strip() == "progress" for job in jobs])
+    assert "job0: done" in [record.getMessage() for record in caplog.records if record.levelno == logging.INFO]
+    failing = rRunner.RScriptJob("failing", [sys.executable, "-c", "import sys; sys.stderr.write('model failed\\n'); sys.exit(3)"])
+    passing = rRunner.RScriptJob("passing", [sys.executable, "-c", "pass"])
+    with raises(rRunner.RScriptError) as error:
+        rRunner.runConcurrently([failing, passing])
+    assert error.value.exitCode == 3
+    assert "model failed" in str(error.value)
+    assert passing.exitCode == 0
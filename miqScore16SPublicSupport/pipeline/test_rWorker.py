@@ -0,0 +1,94 @@
+import sys
+from pytest import mark, raises
+
+fakeWorker = '''
+import os, sys, time
+print("loading libraries")
+print("@@dada2worker\\tREADY", flush=True)
+for request in sys.stdin:
+    fields = request.rstrip("\\n").split("\\t")
+    if fields[0] == "QUIT":
+        break
+    jobID, script, arguments = fields[1], fields[2], fields[3:]
+    if "hang" in arguments:
+        time.sleep(600)
+    if script == "crash.R":
+        sys.exit(7)
+    startTime = time.time()
+    time.sleep(0.3)
+    if arguments:  #records when the job ran, for checking which jobs overlapped
+        timeFile = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), arguments[-1] + ".times"), "w")
+        timeFile.write("%s %s" %(startTime, time.time()))
+        timeFile.close()
+    print("ran %s with %s" %(script, " ".join(arguments)), end="")
+    if script == "fail.R":
+        print("@@dada2worker\\tERROR\\t%s\\tcould not read input" %jobID, flush=True)
+    else:
+        print("\\n@@dada2worker\\tDONE\\t%s" %jobID, flush=True)
+'''
+
+
+def readJobTimes(tmpdir, inputName:str):
+    timeFile = open(str(tmpdir.join(inputName + ".times")), "r")
+    startTime, endTime = [float(value) for value in timeFile.read().split()]
+    timeFile.close()
+    return startTime, endTime
+
+
+def makePool(tmpdir, size:int=2, jobTimeout:float=None):
+    import os
+    from . import rWorker
+    workerPath = os.path.join(str(tmpdir), rWorker.workerScriptName)
+    workerFile = open(workerPath, "w")
+    workerFile.write(fakeWorker)
+    workerFile.close()
+    return rWorker.RWorkerPool(sys.executable, str(tmpdir), size=size, jobTimeout=jobTimeout)
+
+
+@mark.build
+@mark.pipeline
+def test_workerPool(tmpdir, caplog):
+    import logging
+    from . import rRunner, rWorker
+    with makePool(tmpdir) as pool:
+        jobs = [rRunner.RScriptJob("job%s" %number, ["Rscript", "step.R", "-i", "input%s.txt" %number]) for number in range(3)]
+        with caplog.at_level(logging.INFO):
+            pool.runConcurrently(jobs)
+        times = [readJobTimes(tmpdir, "input%s.txt" %number) for number in range(3)]
+        assert max(times[0][0], times[1][0]) < min(times[0][1], times[1][1])  #the first two ran at once
+        assert times[2][0] >= min(times[0][1], times[1][1])  #two workers, so the third waited for a free one
+        assert "job0: ran step.R with -i input0.txt" in [record.getMessage() for record in caplog.records if record.levelno == logging.INFO]
+        assert [job.stdout for job in jobs] == ["ran step.R with -i input%s.txt" %number for number in range(3)]
+        assert [worker.jobCount for worker in pool.workers] == [2, 1]
+        failing = rRunner.RScriptJob("failing", ["Rscript", "fail.R"])
+        with raises(rRunner.RScriptError) as error:
+            pool.runConcurrently([failing])
+        assert failing.exitCode == 1 and failing.stdout == "ran fail.R with "
+        assert "could not read input" in str(error.value)
+        crashing = rRunner.RScriptJob("crashing", ["Rscript", "crash.R"])
+        pool.runConcurrently([crashing], raiseOnError=False)
+        assert crashing.exitCode == 7
+        assert not pool.workers[0].running
+        restarted = rRunner.RScriptJob("restarted", ["Rscript", "step.R"])
+        pool.runConcurrently([restarted])  #the worker that died starts again
+        assert restarted.succeeded
+        with raises(ValueError):
+            pool.runConcurrently([rRunner.RScriptJob("tab", ["Rscript", "step.R", "a\tb"])])
+    assert not any([worker.running for worker in pool.workers])
+    missingPool = rWorker.RWorkerPool(str(tmpdir.join("missingRscript")), str(tmpdir))
+    with raises(rWorker.RWorkerError):
+        missingPool.start()
+
+
+@mark.build
+@mark.pipeline
+def test_hungWorkerFallsBack(tmpdir):
+    from . import rRunner
+    with makePool(tmpdir, size=1, jobTimeout=1) as pool:
+        hanging = rRunner.RScriptJob("hanging", [sys.executable, "-c", "print('ran without the worker')", "hang"])
+        pool.runConcurrently([hanging])
+        assert hanging.succeeded and hanging.stdout.strip() == "ran without the worker"
+        assert not pool.workers[0].running
+        afterwards = rRunner.RScriptJob("afterwards", ["Rscript", "step.R", "-i", "input.txt"])
+        pool.runConcurrently([afterwards])
+        assert afterwards.stdout == "ran step.R with -i input.txt"
@@ -0,0 +1,108 @@
+import os
+from pytest import mark, raises
+
+
+def writeText(path:str, text:str):
+    file = open(path, "w")
+    file.write(text)
+    file.close()
+    return path
+
+
+def readText(path:str):
+    file = open(path, "r")
+    text = file.read()
+    file.close()
+    return text
+
+
+def makePipeline(folder, cache, inputPath:str, calls:list, multiplier:int=2):
+    from . import stepGraph
+    pipeline = stepGraph.PipelineGraph(cache)
+    doubledPath = os.path.join(str(folder), "doubled.txt")
+    summaryPath = os.path.join(str(folder), "summary.txt")
+
+    def doubleStep(upstream:dict):
+        calls.append("double")
+        writeText(doubledPath, readText(inputPath) * multiplier)
+        return {"doubled": doubledPath, "copies": multiplier}
+
+    def summaryStep(upstream:dict):
+        calls.append("summary")
+        writeText(summaryPath, "%s characters" %len(readText(upstream["double"]["doubled"])))
+        return {"summary": summaryPath}
+
+    pipeline.addStep(stepGraph.PipelineStep("summary", summaryStep, ["double"], outputFiles={"summary": summaryPath}))
+    pipeline.addStep(stepGraph.PipelineStep("double", doubleStep, parameters={"multiplier": multiplier}, inputFiles=[inputPath], outputFiles={"doubled": doubledPath}))
+    return pipeline
+
+
+@mark.build
+@mark.pipeline
+def test_pipelineStepsAreCached(tmpdir):
+    from . import stepCache, stepGraph
+    cache = stepCache.StepCache(os.path.join(str(tmpdir), "cache"))
+    inputPath = writeText(os.path.join(str(tmpdir), "input.txt"), "abc")
+    calls = []
+    pipeline = makePipeline(tmpdir, cache, inputPath, calls)
+    assert [step.name for step in pipeline.order()] == ["double", "summary"]
+    assert [step.name for step in pipeline.order(["double"])] == ["double"]
+    results = pipeline.run()
+    assert calls == ["double", "summary"]
+    assert readText(results["summary"]["summary"]) == "6 characters"
+    os.remove(results["summary"]["summary"])
+    rerun = makePipeline(tmpdir, cache, inputPath, calls)
+    rerunResults = rerun.run()
+    assert calls == ["double", "summary"]  #nothing ran again
+    assert rerun.cachedSteps == ["double", "summary"]
+    assert rerunResults["double"]["copies"] == 2
+    assert readText(rerunResults["summary"]["summary"]) == "6 characters"
+    changedParameter = makePipeline(tmpdir, cache, inputPath, calls, multiplier=3)
+    assert readText(changedParameter.run()["summary"]["summary"]) == "9 characters"
+    assert calls == ["double", "summary"] * 2
+    writeText(inputPath, "abcd")
+    makePipeline(tmpdir, cache, inputPath, calls).run()
+    assert calls == ["double", "summary"] * 3
+    assert readText(os.path.join(str(tmpdir), "input.txt")) == "abcd"
+    assert len(cache.entries()) == 6
+    partial = makePipeline(tmpdir, cache, inputPath, calls, multiplier=4)
+    assert list(partial.run(targets=["double"])) == ["double"]
+    assert calls[-1] == "double" and len(calls) == 7
+
+
+@mark.build
+@mark.pipeline
+def test_cacheEvictionAndGraphErrors(tmpdir):
+    import threading
+    import time
+    from . import stepCache, stepGraph
+    cache = stepCache.StepCache(os.path.join(str(tmpdir), "cache"), sizeLimit=2500)
+    for number in range(4):
+        outputPath = writeText(os.path.join(str(tmpdir), "output%s.txt" %number), "x" * 1000)
+        cache.store("key%s" %number, "step", {"output": outputPath})
+        time.sleep(0.01)
+        if number == 1:  #using key0 makes key1 the least recently used
+            assert cache.restore("key0", {"output": os.path.join(str(tmpdir), "restored.txt")})
+            time.sleep(0.01)
+        if number == 2:
+            assert sorted([entry.key for entry in cache.entries()]) == ["key0", "key2"]
+    assert sorted([entry.key for entry in cache.entries()]) == ["key2", "key3"]
+    assert cache.size() <= 2500
+    assert cache.restore("key1", {"output": os.path.join(str(tmpdir), "missing.txt")}) is None
+    evictions = []
+    with cache.lock():  #stands in for another worker process restoring an entry
+        evictor = threading.Thread(target=lambda: evictions.append(cache.evict()))
+        evictor.start()
+        evictor.join(0.2)
+        assert evictor.is_alive() and not evictions
+    evictor.join()
+    assert evictions == [[]]
+    pipeline = stepGraph.PipelineGraph()
+    pipeline.addStep(stepGraph.PipelineStep("first", lambda upstream: {}, ["second"]))
+    pipeline.addStep(stepGraph.PipelineStep("second", lambda upstream: {}, ["first"]))
+    with raises(ValueError):
+        pipeline.order()
+    pipeline = stepGraph.PipelineGraph()
+    pipeline.addStep(stepGraph.PipelineStep("first", lambda upstream: {}, ["absent"]))
+    with raises(ValueError):
+        pipeline.run()
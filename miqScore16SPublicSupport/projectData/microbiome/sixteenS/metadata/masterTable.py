@@ -145,6 +145,7 @@ class MasterTableLine(object):
         rawDate = runID[-6:]
         if not rawDate.isdigit():
             self.runDate = None
+            return
         day = int(rawDate[0:2])
         month = int(rawDate[2:4])
         year = int(rawDate[4:6])
@@ -157,7 +158,7 @@ class MasterTableLine(object):
         self.seqType = seqType.strip()
 
     def setUniqueLabel(self, uniqueLabel:str):
-        self.uniqueLabel = validations.naming.alphaNumericString(uniqueLabel.strip(), replacement="")
+        self.uniqueLabel = validations.naming.alphaNumericString(uniqueLabel.strip(), replacement="") or ""  #blank labels fall back to the sample ID
 
     def setCategories(self, categories:list):
         self.categories = []